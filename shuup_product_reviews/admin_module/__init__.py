@@ -25,6 +25,16 @@ class ProductReviewsModule(AdminModule):
                 "shuup_product_reviews.admin_module.views.ProductReviewListView",
                 name="product_reviews.list"
             ),
+            admin_url(
+                r"^product_reviews/export/$",
+                "shuup_product_reviews.admin_module.views.ReviewExportView",
+                name="product_reviews.export"
+            ),
+            admin_url(
+                r"^product_reviews/moderation_jobs/$",
+                "shuup_product_reviews.admin_module.views.ReviewModerationJobListView",
+                name="product_reviews.moderation_jobs"
+            ),
             admin_url(
                 r"^product_reviews/list-settings/",
                 "shuup.admin.modules.settings.views.ListSettingsView",
@@ -41,5 +51,13 @@ class ProductReviewsModule(AdminModule):
                 category=PRODUCTS_MENU_CATEGORY,
                 subcategory="products",
                 ordering=5
+            ),
+            MenuEntry(
+                text=_("Review Moderation Jobs"),
+                icon="fa fa-tasks",
+                url="shuup_admin:product_reviews.moderation_jobs",
+                category=PRODUCTS_MENU_CATEGORY,
+                subcategory="products",
+                ordering=6
             )
         ]
@@ -14,6 +14,15 @@ from shuup.admin.utils.picotable import (
 )
 from shuup.admin.utils.views import PicotableListView
 from shuup_product_reviews.enums import ReviewStatus
+from shuup_product_reviews.search import search_comments
+
+
+class CommentSearchFilter(TextFilter):
+    """
+    Filter the reviews with the full-text search of the comments
+    """
+    def filter_queryset(self, queryset, column, value, context):
+        return search_comments(queryset, value)
 
 
 class BaseProductReviewListView(PicotableListView):
@@ -30,7 +39,11 @@ class BaseProductReviewListView(PicotableListView):
             _("Rating"),
             filter_config=RangeFilter(min=1, max=5, step=1, filter_field="rating")
         ),
-        Column("comment", _("Comment")),
+        Column(
+            "comment",
+            _("Comment"),
+            filter_config=CommentSearchFilter(placeholder=_("Search comments..."))
+        ),
         Column(
             "status",
             _("Status"),
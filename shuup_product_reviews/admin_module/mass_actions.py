@@ -5,13 +5,36 @@
 #
 # This source code is licensed under the OSL-3.0 license found in the
 # LICENSE file in the root directory of this source tree.
+from django.conf import settings
+from django.contrib import messages
 from django.db.models import Q
 from django.utils.translation import ugettext_lazy as _
 from six import string_types
 
 from shuup.admin.shop_provider import get_shop
 from shuup.admin.utils.picotable import PicotableMassAction
+from shuup_product_reviews.enums import ReviewStatus
 from shuup_product_reviews.models import ProductReview
+from shuup_product_reviews.moderation import create_moderation_job
+
+
+def update_review_status(request, review_model, ids, status):
+    """
+    Set the status of the selected reviews of the shop, or create a background
+    job when all the reviews are selected and there are too many to moderate now
+    """
+    shop = get_shop(request)
+    query = Q(shop=shop)
+
+    if isinstance(ids, string_types) and ids == "all":
+        if review_model.objects.filter(query).count() > settings.PRODUCT_REVIEWS_MODERATION_JOB_THRESHOLD:
+            create_moderation_job(review_model, shop, status, request.user)
+            messages.info(request, _("The reviews will be moderated in the background."))
+            return
+    else:
+        query &= Q(id__in=ids)
+
+    review_model.bulk_update_status(review_model.objects.filter(query), status)
 
 
 class ApproveProductReviewMassAction(PicotableMassAction):
@@ -19,13 +42,7 @@ class ApproveProductReviewMassAction(PicotableMassAction):
     identifier = "mass_action_approve_product_reviews"
 
     def process(self, request, ids):
-        query = Q(shop=get_shop(request))
-
-        if not (isinstance(ids, string_types) and ids == "all"):
-            query &= Q(id__in=ids)
-
-        for product_review in ProductReview.objects.only("pk").filter(query):
-            product_review.approve()
+        update_review_status(request, ProductReview, ids, ReviewStatus.APPROVED)
 
 
 class RejectProductReviewMassAction(PicotableMassAction):
@@ -33,10 +50,4 @@ class RejectProductReviewMassAction(PicotableMassAction):
     identifier = "mass_action_reject_product_reviews"
 
     def process(self, request, ids):
-        query = Q(shop=get_shop(request))
-
-        if not (isinstance(ids, string_types) and ids == "all"):
-            query &= Q(id__in=ids)
-
-        for product_review in ProductReview.objects.only("pk").filter(query):
-            product_review.reject()
+        update_review_status(request, ProductReview, ids, ReviewStatus.REJECTED)
@@ -7,11 +7,19 @@
 # LICENSE file in the root directory of this source tree.
 from __future__ import unicode_literals
 
+from django.apps import apps
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
 from django.utils.translation import ugettext_lazy as _
+from django.views.generic import View
 
 from shuup.admin.shop_provider import get_shop
-from shuup.admin.utils.picotable import Column, TextFilter
-from shuup_product_reviews.models import ProductReview
+from shuup.admin.utils.picotable import ChoicesFilter, Column, TextFilter
+from shuup.admin.utils.views import PicotableListView
+from shuup_product_reviews.enums import ModerationJobStatus
+from shuup_product_reviews.export import (
+    EXPORT_FORMATS, iter_review_rows, parse_since, REVIEW_EXPORTS
+)
+from shuup_product_reviews.models import ProductReview, ReviewModerationJob
 
 from .base import BaseProductReviewListView
 
@@ -38,3 +46,60 @@ class ProductReviewListView(BaseProductReviewListView):
 
     def get_queryset(self):
         return ProductReview.objects.filter(shop=get_shop(self.request))
+
+
+class ReviewExportView(View):
+    """
+    Stream the product and vendor reviews of the shop, e.g. ``?format=jsonl&reviews=product&since=2020-01-31``
+    """
+    def get(self, request, *args, **kwargs):
+        export_format = request.GET.get("format", "csv")
+        if export_format not in EXPORT_FORMATS:
+            return HttpResponseBadRequest("Invalid format.")
+
+        kinds = [kind for kind in request.GET.getlist("reviews") if kind in REVIEW_EXPORTS]
+        since = None
+        if request.GET.get("since"):
+            since = parse_since(request.GET["since"])
+            if not since:
+                return HttpResponseBadRequest("Invalid since date.")
+
+        (iter_lines, content_type) = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(
+            iter_lines(iter_review_rows(get_shop(request), kinds, since)), content_type=content_type
+        )
+        response["Content-Disposition"] = 'attachment; filename="reviews.%s"' % export_format
+        return response
+
+
+class ReviewModerationJobListView(PicotableListView):
+    """
+    The progress of the background review moderation jobs of the shop
+    """
+    model = ReviewModerationJob
+    url_identifier = "product_reviews.moderation_jobs"
+    default_columns = [
+        Column("created_on", _("Created on")),
+        Column("review_model", _("Reviews"), display="format_review_model", sortable=False),
+        Column("review_status", _("New status")),
+        Column("progress", _("Progress"), display="format_progress", sortable=False),
+        Column("changed_count", _("Changed reviews")),
+        Column(
+            "status",
+            _("Status"),
+            filter_config=ChoicesFilter(choices=ModerationJobStatus.choices(), filter_field="status")
+        )
+    ]
+
+    def __init__(self):
+        super(ReviewModerationJobListView, self).__init__()
+        self.columns = self.default_columns
+
+    def get_queryset(self):
+        return ReviewModerationJob.objects.filter(shop=get_shop(self.request)).order_by("-created_on")
+
+    def format_review_model(self, instance):
+        return apps.get_model(instance.review_model)._meta.verbose_name_plural
+
+    def format_progress(self, instance):
+        return "%d / %d" % (instance.processed_count, instance.review_count)
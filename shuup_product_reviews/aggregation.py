@@ -0,0 +1,871 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup Product Reviews Addon.
+#
+# Copyright (c) 2012-2019, Shoop Commerce Ltd. All rights reserved.
+#
+# This source code is licensed under the OSL-3.0 license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Incremental maintenance of the review aggregations.
+
+The reviews are aggregated per shop and reviewed object, so the key of
+an aggregation is a `(shop_id, object_id)` tuple.
+
+When a review is saved, its stored row is locked and read first, and the
+difference between the stored and the new state is applied to the
+aggregation row instead of re-aggregating all the approved reviews
+of the reviewed object in the shop. Reading the stored state instead of
+the state the review was loaded with keeps concurrent or stale saves
+of the same review from applying their change twice. When the delta
+can't be applied safely, the aggregation is recalculated from scratch.
+
+What happens after that depends on ``PRODUCT_REVIEWS_AGGREGATION_MODE``:
+
+* ``immediate``: recalculations and cache invalidations run inside ``save()``
+* ``commit``: the reviewed objects are collected in a dirty set and their
+  recalculations and cache invalidations run once when the transaction commits
+* ``queue``: ``save()`` only queues the reviewed object in the database and the
+  ``process_review_aggregation_queue`` command recalculates the aggregations
+
+Review models can also keep daily aggregations, one row per shop, reviewed
+object and day the review was created on, to calculate the ratings of a
+time window by summing the rows of its days. The daily rows are always
+updated inside ``save()`` as they are small and rarely written concurrently.
+
+Reviews moderated in bulk are updated with `AggregatedReviewMixin.bulk_update_status`
+which recalculates the aggregations of every reviewed object once instead of
+applying the change of each review.
+"""
+import datetime
+import threading
+from collections import namedtuple, OrderedDict
+from decimal import Decimal
+
+from django.apps import apps
+from django.conf import settings
+from django.db import IntegrityError, models, router, transaction
+from django.db.models import Case, Count, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_save
+from django.db.transaction import atomic
+from django.utils import timezone
+
+from shuup_product_reviews.enums import ReviewStatus
+from shuup_product_reviews.scores import (
+    get_aggregation_score, get_score, get_score_prior
+)
+
+AGGREGATION_MODE_IMMEDIATE = "immediate"
+AGGREGATION_MODE_COMMIT = "commit"
+AGGREGATION_MODE_QUEUE = "queue"
+
+#: The review fields that affect the aggregation
+AGGREGATED_REVIEW_FIELDS = ("status", "rating", "would_recommend")
+
+#: The aggregation fields counting the reviews rated with 1 to 5 stars
+RATING_COUNT_FIELDS = tuple("rating_%d_count" % stars for stars in range(1, 6))
+
+AggregationDelta = namedtuple(
+    "AggregationDelta", ("review_count", "rating_sum", "would_recommend") + RATING_COUNT_FIELDS
+)
+AggregationValues = namedtuple("AggregationValues", AggregationDelta._fields + ("rating",))
+ReviewSnapshot = namedtuple("ReviewSnapshot", ["key", "contribution", "date"])
+
+#: The fields of the daily aggregations
+DAILY_AGGREGATION_FIELDS = ("review_count", "rating_sum", "would_recommend")
+DailyAggregationValues = namedtuple("DailyAggregationValues", DAILY_AGGREGATION_FIELDS)
+
+EMPTY_DELTA = AggregationDelta(*([0] * len(AggregationDelta._fields)))
+
+#: The number of reviews updated with one query by `AggregatedReviewMixin.bulk_update_status`
+BULK_UPDATE_CHUNK_SIZE = 500
+
+_dirty_aggregations = threading.local()
+
+
+def get_aggregation_mode():
+    return settings.PRODUCT_REVIEWS_AGGREGATION_MODE
+
+
+def get_review_contribution(status, rating, would_recommend):
+    """
+    Returns how much a review with the given values weighs in the aggregation
+    """
+    if ReviewStatus(status) != ReviewStatus.APPROVED:
+        return EMPTY_DELTA
+    rating = int(rating)
+    rating_counts = [int(stars == rating) for stars in range(1, 6)]
+    return AggregationDelta(1, rating, int(bool(would_recommend)), *rating_counts)
+
+
+def get_average_rating(rating_sum, review_count):
+    return (Decimal(rating_sum) / Decimal(review_count)).quantize(Decimal("0.1"))
+
+
+def get_bucket_date(value):
+    """
+    Returns the date of the daily aggregation for the given datetime
+    """
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.date()
+
+
+def _count_when(**conditions):
+    return Sum(
+        Case(
+            When(then=Value(1), **conditions),
+            default=Value(0),
+            output_field=models.PositiveIntegerField()
+        )
+    )
+
+
+def get_review_aggregates():
+    """
+    Returns the aggregate expressions that calculate the aggregation fields from reviews
+    """
+    aggregates = dict(
+        review_count=Count("pk"),
+        rating_sum=Sum("rating"),
+        would_recommend=_count_when(would_recommend=True)
+    )
+    for (stars, field) in enumerate(RATING_COUNT_FIELDS, 1):
+        aggregates[field] = _count_when(rating=stars)
+    return aggregates
+
+
+def get_aggregation_sums():
+    """
+    Returns the aggregate expressions that sum up aggregation rows
+    """
+    return dict((field, Sum(field)) for field in AggregationDelta._fields)
+
+
+def get_aggregation_totals(aggregations):
+    """
+    Returns the review totals of the given aggregation rows,
+    e.g. the aggregation of an object in one shop or in all shops
+    """
+    return get_totals_from_sums(aggregations.aggregate(**get_aggregation_sums()))
+
+
+def get_aggregation_totals_by_object(aggregations, attname):
+    """
+    Returns a dict of the object ids and the review totals of their aggregation rows
+    """
+    return dict(
+        (row[attname], get_totals_from_sums(row))
+        for row in aggregations.order_by().values(attname).annotate(**get_aggregation_sums())
+    )
+
+
+def get_empty_totals():
+    return dict(rating=None, reviews=None, would_recommend=None, rating_counts=None)
+
+
+def get_totals_from_sums(sums):
+    if not sums["review_count"]:
+        return get_empty_totals()
+
+    return dict(
+        rating=get_average_rating(sums["rating_sum"], sums["review_count"]),
+        reviews=sums["review_count"],
+        would_recommend=sums["would_recommend"],
+        rating_counts=[sums[field] for field in RATING_COUNT_FIELDS]
+    )
+
+
+def recalculate_aggregation_for_queryset(queryset):
+    reviews_agg = queryset.aggregate(**get_review_aggregates())
+    if not reviews_agg["review_count"]:
+        # Make sure there is no aggregation since there is no approved reviews
+        return
+
+    reviews_agg["rating"] = get_average_rating(reviews_agg["rating_sum"], reviews_agg["review_count"])
+    return reviews_agg
+
+
+def recalculate_review_aggregation(review_model, aggregation_model, lookup):
+    """
+    Recalculate the aggregation matching `lookup` from all the approved reviews
+
+    :param lookup: the shop and reviewed object of the aggregation, e.g. `{"shop_id": 1, "product_id": 2}`
+    """
+    reviews_agg = recalculate_aggregation_for_queryset(
+        review_model.objects.filter(status=ReviewStatus.APPROVED, **lookup)
+    )
+    if not reviews_agg:
+        aggregation_model.objects.filter(**lookup).delete()
+        return
+
+    values = get_aggregation_values(reviews_agg)
+    score = get_aggregation_score(aggregation_model, lookup["shop_id"], values)
+    aggregation_model.objects.update_or_create(defaults=dict(values._asdict(), score=score), **lookup)
+
+
+def apply_aggregation_delta(aggregation_model, lookup, delta):
+    """
+    Apply the `delta` to the aggregation matching `lookup`.
+
+    Returns `False` when the delta can't be applied consistently,
+    in which case the aggregation should be recalculated.
+    """
+    with atomic():
+        aggregation = aggregation_model.objects.select_for_update().filter(**lookup).first()
+        if aggregation is None:
+            aggregation = aggregation_model(**lookup)
+
+        values = AggregationDelta(*[
+            getattr(aggregation, field) + change for (field, change) in zip(AggregationDelta._fields, delta)
+        ])
+        rating_counts = [getattr(values, field) for field in RATING_COUNT_FIELDS]
+
+        # anything inconsistent with the star counts means the row has drifted
+        if (
+            min(values) < 0 or
+            values.would_recommend > values.review_count or
+            sum(rating_counts) != values.review_count or
+            sum(stars * count for (stars, count) in enumerate(rating_counts, 1)) != values.rating_sum
+        ):
+            return False
+
+        if not values.review_count:
+            if aggregation.pk:
+                aggregation.delete()
+            return True
+
+        for (field, value) in values._asdict().items():
+            setattr(aggregation, field, value)
+        aggregation.rating = get_average_rating(values.rating_sum, values.review_count)
+        aggregation.score = get_aggregation_score(aggregation_model, lookup["shop_id"], values)
+        try:
+            with atomic():
+                aggregation.save()
+        except IntegrityError:
+            # the aggregation was created concurrently
+            return False
+
+    return True
+
+
+def get_aggregation_differences(computed, stored):
+    """
+    :return: dict of the keys whose `stored` values differ from the `computed` ones
+      and their up to date values, `None` meaning that there should be no aggregation
+    :rtype: dict[tuple[int, int], AggregationValues|None]
+    """
+    return dict(
+        (key, computed.get(key))
+        for key in set(computed) | set(stored)
+        if computed.get(key) != stored.get(key)
+    )
+
+
+def get_aggregation_values(row):
+    return AggregationValues(*(
+        [row[field] for field in AggregationDelta._fields] +
+        [get_average_rating(row["rating_sum"], row["review_count"])]
+    ))
+
+
+def group_keys_by_shop(keys):
+    """
+    Returns a dict of the shop ids of the given `(shop_id, object_id)` keys and their object ids
+    """
+    object_ids_by_shop = OrderedDict()
+    for (shop_id, object_id) in keys:
+        object_ids_by_shop.setdefault(shop_id, []).append(object_id)
+    return object_ids_by_shop
+
+
+def replace_aggregations(aggregation_model, attname, aggregation_values):
+    """
+    Replace the aggregations of the given keys with the given values
+
+    :param attname: the name of the aggregation column holding the object id of the key
+    :param aggregation_values: dict of keys and their values, `None` deletes the aggregation
+    :type aggregation_values: dict[tuple[int, int], AggregationValues|None]
+    """
+    object_ids_by_shop = group_keys_by_shop(aggregation_values)
+    priors = dict((shop_id, get_score_prior(aggregation_model, shop_id)) for shop_id in object_ids_by_shop)
+    with atomic():
+        for (shop_id, object_ids) in object_ids_by_shop.items():
+            aggregation_model.objects.filter(shop_id=shop_id, **{"%s__in" % attname: object_ids}).delete()
+        aggregation_model.objects.bulk_create([
+            aggregation_model(**dict(
+                values._asdict(),
+                score=get_score(values.rating_sum, values.review_count, priors[key[0]]),
+                shop_id=key[0],
+                **{attname: key[1]}
+            ))
+            for (key, values) in aggregation_values.items()
+            if values
+        ])
+
+
+def apply_daily_aggregation_delta(daily_aggregation_model, lookup, delta):
+    """
+    Apply the `delta` to the daily aggregation matching `lookup`
+
+    Returns `False` when the delta can't be applied consistently,
+    in which case the daily aggregation should be recalculated.
+    """
+    changes = dict((field, getattr(delta, field)) for field in DAILY_AGGREGATION_FIELDS)
+    with atomic():
+        aggregation = daily_aggregation_model.objects.select_for_update().filter(**lookup).first()
+        if aggregation is None:
+            # only a review that starts counting can create the row
+            if changes["review_count"] != 1 or min(changes.values()) < 0:
+                return False
+            aggregation = daily_aggregation_model(**lookup)
+
+        values = DailyAggregationValues(*[
+            getattr(aggregation, field) + changes[field] for field in DAILY_AGGREGATION_FIELDS
+        ])
+        # checked here as the databases report negative counters with different errors
+        if min(values) < 0 or values.would_recommend > values.review_count:
+            return False
+
+        if not values.review_count:
+            if aggregation.pk:
+                aggregation.delete()
+            return True
+
+        for (field, value) in values._asdict().items():
+            setattr(aggregation, field, value)
+        try:
+            with atomic():
+                aggregation.save()
+        except IntegrityError:
+            # the row was created concurrently
+            return False
+    return True
+
+
+def recalculate_daily_review_aggregation(review_model, daily_aggregation_model, lookup, date):
+    """
+    Recalculate the daily aggregation matching `lookup` and `date` from the approved reviews created on that day
+    """
+    reviews_agg = review_model.objects.filter(
+        status=ReviewStatus.APPROVED, created_on__date=date, **lookup
+    ).aggregate(**get_daily_review_aggregates())
+    if not reviews_agg["review_count"]:
+        daily_aggregation_model.objects.filter(date=date, **lookup).delete()
+        return
+
+    daily_aggregation_model.objects.update_or_create(date=date, defaults=reviews_agg, **lookup)
+
+
+def get_daily_review_aggregates():
+    return dict(
+        review_count=Count("pk"),
+        rating_sum=Sum("rating"),
+        would_recommend=_count_when(would_recommend=True)
+    )
+
+
+def get_window_totals(daily_aggregations, days):
+    """
+    Returns the review totals of the last `days` days, today included,
+    by summing the given daily aggregation rows
+    """
+    since = get_bucket_date(timezone.now()) - datetime.timedelta(days=(days - 1))
+    totals = daily_aggregations.filter(date__gte=since).aggregate(
+        **dict((field, Sum(field)) for field in DAILY_AGGREGATION_FIELDS)
+    )
+    if not totals["review_count"]:
+        return dict(rating=None, reviews=None, would_recommend=None)
+
+    return dict(
+        rating=get_average_rating(totals["rating_sum"], totals["review_count"]),
+        reviews=totals["review_count"],
+        would_recommend=totals["would_recommend"]
+    )
+
+
+class AggregationSync(object):
+    """
+    Set-based comparison and repair of the aggregations of a review model
+    for ranges of reviewed object ids
+
+    The aggregations are keyed by `(shop_id, object_id)` tuples.
+    """
+
+    def __init__(self, review_model):
+        self.review_model = review_model
+        self.aggregation_model = review_model.get_aggregation_model()
+        self.attname = review_model.get_aggregation_attname()
+
+    @property
+    def name(self):
+        return self.aggregation_model._meta.verbose_name
+
+    def get_key_range(self, key_from, key_to):
+        return {"%s__gte" % self.attname: key_from, "%s__lt" % self.attname: key_to}
+
+    def get_querysets(self, shop=None):
+        reviews = self.review_model.objects.all()
+        aggregations = self.aggregation_model.objects.all()
+        if shop:
+            reviews = reviews.filter(shop=shop)
+            aggregations = aggregations.filter(shop=shop)
+        return (reviews, aggregations)
+
+    def get_key_bounds(self, shop=None):
+        """
+        Returns the lowest and highest ids of the reviewed objects
+        that have reviews or aggregations
+        """
+        bounds = [
+            queryset.aggregate(low=models.Min(self.attname), high=models.Max(self.attname))
+            for queryset in self.get_querysets(shop)
+        ]
+        lows = [bound["low"] for bound in bounds if bound["low"] is not None]
+        highs = [bound["high"] for bound in bounds if bound["high"] is not None]
+        return (min(lows) if lows else None, max(highs) if highs else None)
+
+    def get_stored(self, aggregations):
+        return dict(
+            (
+                (row["shop_id"], row[self.attname]),
+                AggregationValues(*[row[field] for field in AggregationValues._fields])
+            )
+            for row in aggregations.values("shop_id", self.attname, *AggregationValues._fields)
+        )
+
+    def get_differences(self, key_from, key_to, shop=None):
+        """
+        Compare the stored aggregations of the reviewed objects with ids
+        from `key_from` to `key_to` (exclusive) with the approved reviews,
+        using one grouped query for the reviews and one for the aggregations.
+        """
+        (reviews, aggregations) = self.get_querysets(shop)
+        key_range = self.get_key_range(key_from, key_to)
+        reviews_agg = reviews.filter(status=ReviewStatus.APPROVED, **key_range).order_by().values(
+            "shop_id", self.attname
+        ).annotate(**get_review_aggregates())
+        computed = dict(((row["shop_id"], row[self.attname]), get_aggregation_values(row)) for row in reviews_agg)
+        return get_aggregation_differences(computed, self.get_stored(aggregations.filter(**key_range)))
+
+    def get_stored_for_keys(self, keys):
+        stored = {}
+        for (shop_id, object_ids) in group_keys_by_shop(keys).items():
+            stored.update(self.get_stored(self.aggregation_model.objects.filter(
+                shop_id=shop_id, **{"%s__in" % self.attname: object_ids}
+            )))
+        return stored
+
+    def write(self, aggregation_values):
+        if not aggregation_values:
+            return
+
+        # the aggregations depending on these ones, e.g. the variation families,
+        # are repaired by their own syncs instead of being recalculated one by one
+        replace_aggregations(self.aggregation_model, self.attname, aggregation_values)
+        self.review_model.bump_aggregation_caches(list(aggregation_values))
+
+
+class DailyAggregationSync(AggregationSync):
+    """
+    Set-based comparison and repair of the daily aggregations of a review model
+
+    The daily aggregations are keyed by `(shop_id, object_id, date)` tuples.
+    """
+
+    def __init__(self, review_model):
+        super(DailyAggregationSync, self).__init__(review_model)
+        self.aggregation_model = review_model.get_daily_aggregation_model()
+
+    def get_stored(self, aggregations):
+        return dict(
+            (
+                (row["shop_id"], row[self.attname], row["date"]),
+                DailyAggregationValues(*[row[field] for field in DAILY_AGGREGATION_FIELDS])
+            )
+            for row in aggregations.values("shop_id", self.attname, "date", *DAILY_AGGREGATION_FIELDS)
+        )
+
+    def get_differences(self, key_from, key_to, shop=None):
+        (reviews, aggregations) = self.get_querysets(shop)
+        key_range = self.get_key_range(key_from, key_to)
+        reviews_agg = reviews.filter(status=ReviewStatus.APPROVED, **key_range).order_by().values(
+            "shop_id", self.attname, date=TruncDate("created_on")
+        ).annotate(**get_daily_review_aggregates())
+        computed = dict(
+            (
+                (row["shop_id"], row[self.attname], row["date"]),
+                DailyAggregationValues(*[row[field] for field in DAILY_AGGREGATION_FIELDS])
+            )
+            for row in reviews_agg
+        )
+        return get_aggregation_differences(computed, self.get_stored(aggregations.filter(**key_range)))
+
+    def get_stored_for_keys(self, keys):
+        stored = {}
+        for (shop_id, object_ids) in group_keys_by_shop(key[:2] for key in keys).items():
+            stored.update(self.get_stored(self.aggregation_model.objects.filter(
+                shop_id=shop_id, **{"%s__in" % self.attname: object_ids}
+            )))
+        return dict((key, stored[key]) for key in keys if key in stored)
+
+    def write(self, aggregation_values):
+        if not aggregation_values:
+            return
+
+        object_ids_by_day = OrderedDict()
+        for (shop_id, object_id, date) in aggregation_values:
+            object_ids_by_day.setdefault((shop_id, date), []).append(object_id)
+
+        with atomic():
+            for ((shop_id, date), object_ids) in object_ids_by_day.items():
+                self.aggregation_model.objects.filter(
+                    shop_id=shop_id, date=date, **{"%s__in" % self.attname: object_ids}
+                ).delete()
+            self.aggregation_model.objects.bulk_create([
+                self.aggregation_model(**dict(
+                    values._asdict(), shop_id=key[0], date=key[2], **{self.attname: key[1]}
+                ))
+                for (key, values) in aggregation_values.items()
+                if values
+            ])
+
+
+def _get_dirty_aggregations():
+    if not hasattr(_dirty_aggregations, "items"):
+        _dirty_aggregations.items = OrderedDict()
+    return _dirty_aggregations.items
+
+
+def mark_aggregation_dirty(review_model, key, recalculate=False):
+    """
+    Schedule the cache invalidation, and optionally the recalculation,
+    of the aggregation for `key` to run once the current transaction commits
+    """
+    dirty = _get_dirty_aggregations()
+    dirty_key = (review_model._meta.label, key)
+    dirty[dirty_key] = (dirty.get(dirty_key) or recalculate)
+    # Every change registers the flush so a rolled back savepoint can't drop
+    # the changes of the outer transaction. The first flush drains the dirty set.
+    transaction.on_commit(flush_dirty_aggregations)
+
+
+def flush_dirty_aggregations():
+    dirty = _get_dirty_aggregations()
+    _dirty_aggregations.items = OrderedDict()
+    keys_by_model = OrderedDict()
+    for (review_model_label, key), recalculate in dirty.items():
+        review_model = apps.get_model(review_model_label)
+        if recalculate:
+            review_model.recalculate_aggregation_for_key(key)
+        keys_by_model.setdefault(review_model, []).append(key)
+    for (review_model, keys) in keys_by_model.items():
+        review_model.bump_aggregation_caches(keys)
+
+
+def enqueue_aggregation(review_model, key):
+    from shuup_product_reviews.models import ReviewAggregationQueueItem
+    (shop_id, object_id) = key
+    ReviewAggregationQueueItem.objects.create(
+        review_model=review_model._meta.label, shop_id=shop_id, object_id=object_id
+    )
+
+
+def process_aggregation_queue(batch_size=500):
+    """
+    Recalculate the aggregations of the oldest queued objects
+
+    :return: the number of processed queue items
+    :rtype: int
+    """
+    from shuup_product_reviews.models import ReviewAggregationQueueItem
+    items = list(
+        ReviewAggregationQueueItem.objects.order_by("pk").values_list(
+            "pk", "review_model", "shop_id", "object_id"
+        )[:batch_size]
+    )
+    queued = OrderedDict.fromkeys((label, shop_id, object_id) for (pk, label, shop_id, object_id) in items)
+    keys_by_model = OrderedDict()
+    for (review_model_label, shop_id, object_id) in queued:
+        review_model = apps.get_model(review_model_label)
+        if not shop_id:
+            # items queued before the aggregations were kept per shop
+            review_model.recalculate_aggregations_for_object(object_id)
+            continue
+
+        key = (shop_id, object_id)
+        review_model.recalculate_aggregation_for_key(key)
+        keys_by_model.setdefault(review_model, []).append(key)
+    for (review_model, keys) in keys_by_model.items():
+        review_model.bump_aggregation_caches(keys)
+
+    ReviewAggregationQueueItem.objects.filter(pk__in=[item[0] for item in items]).delete()
+    return len(items)
+
+
+class AggregatedReviewMixin(object):
+    """
+    Keeps the aggregation of the reviewed object up to date
+    by applying the difference between the loaded and the saved state.
+    """
+
+    #: The name of the field that points to the reviewed object, e.g. `product`
+    aggregation_field = None
+
+    #: The label of the aggregation model, e.g. `shuup_product_reviews.ProductReviewAggregation`
+    aggregation_model = None
+
+    #: The label of the daily aggregation model, if the review model keeps daily aggregations
+    daily_aggregation_model = None
+
+    @classmethod
+    def get_aggregation_attname(cls):
+        return cls._meta.get_field(cls.aggregation_field).attname
+
+    @classmethod
+    def get_aggregation_model(cls):
+        return apps.get_model(cls.aggregation_model)
+
+    @classmethod
+    def get_daily_aggregation_model(cls):
+        if cls.daily_aggregation_model:
+            return apps.get_model(cls.daily_aggregation_model)
+
+    @classmethod
+    def get_aggregation_syncs(cls):
+        syncs = [AggregationSync(cls)]
+        if cls.daily_aggregation_model:
+            syncs.append(DailyAggregationSync(cls))
+        return syncs
+
+    @classmethod
+    def get_aggregation_lookup(cls, key):
+        (shop_id, object_id) = key
+        return {"shop_id": shop_id, cls.get_aggregation_attname(): object_id}
+
+    @classmethod
+    def get_aggregation_shop_ids(cls, object_id):
+        """
+        Returns the ids of the shops where the object has reviews or aggregations
+        """
+        lookup = {cls.get_aggregation_attname(): object_id}
+        return sorted(
+            set(cls.objects.filter(**lookup).values_list("shop_id", flat=True)) |
+            set(cls.get_aggregation_model().objects.filter(**lookup).values_list("shop_id", flat=True))
+        )
+
+    @classmethod
+    def recalculate_aggregation_for_key(cls, key):
+        cls.recalculate_aggregations_for_keys([key])
+
+    @classmethod
+    def recalculate_aggregations_for_keys(cls, keys):
+        for key in keys:
+            recalculate_review_aggregation(cls, cls.get_aggregation_model(), cls.get_aggregation_lookup(key))
+        cls.aggregations_recalculated(keys)
+
+    @classmethod
+    def recalculate_aggregations_for_object(cls, object_id):
+        """
+        Recalculate the aggregations of the object in every shop
+        """
+        for shop_id in cls.get_aggregation_shop_ids(object_id):
+            key = (shop_id, object_id)
+            cls.recalculate_aggregation_for_key(key)
+            cls.bump_aggregation_cache(key)
+
+    @classmethod
+    def apply_aggregation_delta_for_key(cls, key, delta):
+        return apply_aggregation_delta(cls.get_aggregation_model(), cls.get_aggregation_lookup(key), delta)
+
+    @classmethod
+    def aggregations_recalculated(cls, keys):
+        """
+        Called after the aggregations of the given keys were recalculated from scratch
+        """
+        pass
+
+    def _get_aggregation_key(self):
+        return (self.shop_id, getattr(self, self.get_aggregation_attname()))
+
+    def _get_aggregation_snapshot(self):
+        return ReviewSnapshot(
+            self._get_aggregation_key(),
+            get_review_contribution(self.status, self.rating, self.would_recommend),
+            get_bucket_date(self.created_on)
+        )
+
+    def _get_stored_aggregation_snapshot(self, using):
+        """
+        Lock the stored row of the review and return its snapshot, or `None` if it is not stored
+        """
+        attname = self.get_aggregation_attname()
+        row = type(self).objects.using(using).select_for_update().filter(pk=self.pk).values(
+            "shop_id", attname, "created_on", *AGGREGATED_REVIEW_FIELDS
+        ).first()
+        if row is None:
+            return None
+        return ReviewSnapshot(
+            (row["shop_id"], row[attname]),
+            get_review_contribution(*[row[field] for field in AGGREGATED_REVIEW_FIELDS]),
+            get_bucket_date(row["created_on"])
+        )
+
+    def save(self, *args, **kwargs):
+        using = (kwargs.get("using") or router.db_for_write(type(self), instance=self))
+        with atomic(using=using):
+            previous = (self._get_stored_aggregation_snapshot(using) if self.pk is not None else None)
+            super(AggregatedReviewMixin, self).save(*args, **kwargs)
+            current = self._get_aggregation_snapshot()
+            if previous is None:
+                previous = current._replace(contribution=EMPTY_DELTA)
+            self.update_aggregation(previous, current)
+            if self.daily_aggregation_model:
+                self.update_daily_aggregation(previous, current)
+
+    @classmethod
+    def bump_aggregation_cache(cls, key):
+        cls.bump_aggregation_caches([key])
+
+    @classmethod
+    def bump_aggregation_caches(cls, keys):
+        """
+        Invalidate the cached ratings of the aggregations for `keys`
+        """
+        pass
+
+    @classmethod
+    def warm_aggregation_cache(cls, key):
+        """
+        Render and cache the ratings of the aggregation for `key`
+        """
+        pass
+
+    def warm_aggregation_cache_on_commit(self):
+        """
+        Schedule the warm-up of the ratings cache of the reviewed object after the
+        aggregation changes of the current transaction, when enabled with the
+        ``PRODUCT_REVIEWS_WARM_CACHE_ON_MODERATION`` setting
+        """
+        self.warm_aggregation_caches_on_commit([self._get_aggregation_key()])
+
+    @classmethod
+    def warm_aggregation_caches_on_commit(cls, keys):
+        # the queued aggregations are not updated until the queue is processed
+        if not settings.PRODUCT_REVIEWS_WARM_CACHE_ON_MODERATION or get_aggregation_mode() == AGGREGATION_MODE_QUEUE:
+            return
+        for key in keys:
+            transaction.on_commit(lambda key=key: cls.warm_aggregation_cache(key))
+
+    @classmethod
+    def bulk_update_status(cls, queryset, status):
+        """
+        Set the status of the reviews of the queryset with one ``UPDATE`` per
+        `BULK_UPDATE_CHUNK_SIZE` reviews, then update the aggregations and
+        invalidate the cache of every reviewed object once.
+
+        As the reviews are not saved one by one, ``post_save`` is sent
+        for every changed review with the updated fields as ``update_fields``.
+
+        :return: the number of changed reviews
+        :rtype: int
+        """
+        changed = list(queryset.exclude(status=status).order_by("pk").values_list(
+            "pk", "shop_id", cls.get_aggregation_attname(), "created_on"
+        ))
+        keys = list(OrderedDict.fromkeys((shop_id, object_id) for (pk, shop_id, object_id, created_on) in changed))
+        buckets = OrderedDict.fromkeys(
+            ((shop_id, object_id), get_bucket_date(created_on))
+            for (pk, shop_id, object_id, created_on) in changed
+        )
+        update_fields = frozenset(["status", "modified_on"])
+
+        with atomic(using=queryset.db):
+            for index in range(0, len(changed), BULK_UPDATE_CHUNK_SIZE):
+                pks = [row[0] for row in changed[index:index + BULK_UPDATE_CHUNK_SIZE]]
+                cls.objects.using(queryset.db).filter(pk__in=pks).update(status=status, modified_on=timezone.now())
+                for review in cls.objects.using(queryset.db).filter(pk__in=pks):
+                    post_save.send(
+                        sender=cls, instance=review, created=False,
+                        update_fields=update_fields, raw=False, using=queryset.db
+                    )
+
+            cls.update_aggregations_for_keys(keys)
+            if cls.daily_aggregation_model:
+                for (key, date) in buckets:
+                    recalculate_daily_review_aggregation(
+                        cls, cls.get_daily_aggregation_model(), cls.get_aggregation_lookup(key), date
+                    )
+
+        cls.warm_aggregation_caches_on_commit(keys)
+        return len(changed)
+
+    @classmethod
+    def update_aggregations_for_keys(cls, keys):
+        """
+        Recalculate the aggregations of the given keys and invalidate their
+        caches, or queue them, according to the aggregation mode
+        """
+        mode = get_aggregation_mode()
+        if mode == AGGREGATION_MODE_QUEUE:
+            for key in keys:
+                enqueue_aggregation(cls, key)
+            return
+
+        cls.recalculate_aggregations_for_keys(keys)
+        if mode == AGGREGATION_MODE_IMMEDIATE:
+            cls.bump_aggregation_caches(keys)
+            return
+        for key in keys:
+            mark_aggregation_dirty(cls, key)
+
+    def update_aggregation(self, previous, current):
+        keys = [current.key]
+        if previous is not None and previous.key != current.key:
+            keys.append(previous.key)
+
+        mode = get_aggregation_mode()
+        for key in keys:
+            if mode == AGGREGATION_MODE_QUEUE:
+                enqueue_aggregation(type(self), key)
+                continue
+
+            recalculate = not self._apply_aggregation_delta(key, previous, current)
+            if mode == AGGREGATION_MODE_IMMEDIATE:
+                if recalculate:
+                    self.recalculate_aggregation_for_key(key)
+                self.bump_aggregation_cache(key)
+            else:
+                mark_aggregation_dirty(type(self), key, recalculate)
+
+    def _apply_aggregation_delta(self, key, previous, current):
+        if previous is None or previous.key != current.key:
+            return False
+
+        delta = AggregationDelta(*[
+            new - old for (new, old) in zip(current.contribution, previous.contribution)
+        ])
+        if delta == EMPTY_DELTA:
+            return True
+
+        return self.apply_aggregation_delta_for_key(key, delta)
+
+    def update_daily_aggregation(self, previous, current):
+        daily_aggregation_model = self.get_daily_aggregation_model()
+        if previous is not None and (previous.key, previous.date) == (current.key, current.date):
+            delta = AggregationDelta(*[
+                new - old for (new, old) in zip(current.contribution, previous.contribution)
+            ])
+            if delta == EMPTY_DELTA:
+                return
+            lookup = dict(self.get_aggregation_lookup(current.key), date=current.date)
+            if apply_daily_aggregation_delta(daily_aggregation_model, lookup, delta):
+                return
+
+        buckets = [(current.key, current.date)]
+        if previous is not None and (previous.key, previous.date) != (current.key, current.date):
+            buckets.append((previous.key, previous.date))
+        for (key, date) in buckets:
+            recalculate_daily_review_aggregation(
+                type(self), daily_aggregation_model, self.get_aggregation_lookup(key), date
+            )
@@ -32,6 +32,9 @@ class AppConfig(shuup.apps.AppConfig):
         "xtheme_resource_injection": [
             "shuup_product_reviews.resources:add_resources"
         ],
+        "front_template_helper_namespace": [
+            "shuup_product_reviews.template_helpers.ProductReviewsTemplateHelpers"
+        ],
         "notify_event": [
             "shuup_product_reviews.notify_events.ProductReviewCreated"
         ],
@@ -5,36 +5,357 @@
 #
 # This source code is licensed under the OSL-3.0 license found in the
 # LICENSE file in the root directory of this source tree.
+import hashlib
+from collections import OrderedDict
+
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
 from django.core.urlresolvers import reverse
+from django.db.models import Q
+from django.http import QueryDict
 from django.http.response import JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_bytes, force_text
+from django.utils.http import (
+    http_date, quote_etag, urlencode, urlsafe_base64_decode,
+    urlsafe_base64_encode
+)
 from django.views.generic import View
 
+from shuup_product_reviews import caching
+from shuup_product_reviews.search import get_search_words, search_comments
+
+#: The review columns the comments are serialized from, read in one joined query
+REVIEW_COMMENT_VALUES = ("pk", "created_on", "rating", "comment", "reviewer__name")
+
+
+def serialize_review_comment(values):
+    return {
+        "id": values["pk"],
+        "date": values["created_on"].isoformat(),
+        "rating": values["rating"],
+        "comment": values["comment"],
+        "reviewer": values["reviewer__name"],
+    }
+
+
+#: The orderings of the review comments by the `sort` parameter, the first one is the default.
+#: Each ordering is read in one direction of the composite indexes of the review models.
+COMMENT_SORTS = OrderedDict([
+    ("newest", ("-created_on", "-pk")),
+    ("highest", ("-rating", "-created_on", "-pk")),
+    ("lowest", ("rating", "created_on", "pk")),
+])
+
+
+def encode_cursor(ordering, values):
+    """
+    Returns the opaque cursor of the page of reviews after the review of the given values in the ordering
+    """
+    position = []
+    for field in ordering:
+        value = values[field.lstrip("-")]
+        position.append(value.isoformat() if hasattr(value, "isoformat") else force_text(value))
+    return force_text(urlsafe_base64_encode(force_bytes(",".join(position))))
+
+
+def decode_cursor(ordering, cursor):
+    """
+    Returns the values of the ordering fields of the cursor position or `None` if it is not valid
+    """
+    try:
+        position = force_text(urlsafe_base64_decode(cursor or "")).split(",")
+        if len(position) != len(ordering):
+            return None
+        values = [
+            (parse_datetime(value) if field.lstrip("-") == "created_on" else int(value))
+            for (field, value) in zip(ordering, position)
+        ]
+    except (TypeError, ValueError):
+        return None
+    return (values if None not in values else None)
+
+
+def get_keyset_filter(ordering, position):
+    """
+    Returns the filter of the rows after the position in the ordering
+    """
+    keyset_filter = Q()
+    equal = {}
+    for (field, value) in zip(ordering, position):
+        name = field.lstrip("-")
+        after = {"%s__%s" % (name, "lt" if field.startswith("-") else "gt"): value}
+        after.update(equal)
+        keyset_filter |= Q(**after)
+        equal[name] = value
+    return keyset_filter
+
 
 class BaseCommentsView(View):
     view_name = ""
+    #: The query parameters of the listed page, the parameters of the request when `None`
+    params = None
+    #: The reviews to list, read with `get_reviews_queryset` when `None`
+    reviews_queryset = None
 
-    def get(self, request, *args, **kwargs):
-        page = self.get_reviews_page()
-        reviews = [
-            {
-                "id": review.pk,
-                "date": review.created_on.isoformat(),
-                "rating": review.rating,
-                "comment": review.comment,
-                "reviewer": review.reviewer.name,
-            }
-            for review in page.object_list
-        ]
+    @classmethod
+    def get_first_page_view(cls, request, pk, reviews_queryset=None):
+        """
+        Returns the view of the first page of the reviews of the object in the default order
+        """
+        return cls(
+            request=request, args=(), kwargs=dict(pk=pk), params=QueryDict(), reviews_queryset=reviews_queryset
+        )
+
+    @classmethod
+    def get_first_page_querysets(cls, request, pks):
+        """
+        Returns a dict of the object ids and their reviews to list, see `get_reviews_queryset`
+
+        Override to read the reviewed objects of all the ids at once.
+        """
+        return dict((pk, cls.get_first_page_view(request, pk).get_reviews_queryset()) for pk in pks)
 
-        next_page_url = None
-        if page.has_next():
-            next_page_url = "{}?page={}".format(
-                reverse('shuup:%s' % self.view_name, kwargs=dict(pk=self.kwargs["pk"])),
-                page.number + 1
+    @classmethod
+    def get_first_page_payloads(cls, request, pks):
+        """
+        Returns the payloads of the first pages of the reviews of the objects in the default
+        order, cached until the reviews of each object change, read with one cache query
+
+        :return: dict of the object ids and their first page payloads
+        :rtype: dict
+        """
+        def get_payloads(missing_pks):
+            querysets = cls.get_first_page_querysets(request, missing_pks)
+            return dict(
+                (pk, cls.get_first_page_view(request, pk, querysets[pk]).get_payload())
+                for pk in missing_pks
             )
 
-        payload = {
-            "reviews": reviews,
+        return caching.get_cached_values(
+            pks,
+            cls.get_object_reviews_namespace,
+            request.shop,
+            caching.get_comments_page_key(request.shop),
+            get_payloads
+        )
+
+    @classmethod
+    def get_first_page_payload(cls, request, pk):
+        """
+        Returns the payload of the first page of the reviews in the default order
+        to embed in the page of the object, cached until the reviews of the object change
+        """
+        return cls.get_first_page_payloads(request, [pk])[pk]
+
+    def get_params(self):
+        return (self.request.GET if self.params is None else self.params)
+
+    @classmethod
+    def get_object_reviews_namespace(cls, pk):
+        """
+        Returns the star rating cache namespace of the reviewed object of the id,
+        its generation is bumped whenever the reviews of the object change
+        """
+        raise NotImplementedError()
+
+    def get_reviews_namespace(self):
+        return self.get_object_reviews_namespace(self.kwargs["pk"])
+
+    def get_cache_control(self):
+        """
+        Returns the `patch_cache_control` arguments of the responses
+        """
+        return {}
+
+    def get(self, request, *args, **kwargs):
+        # the version of the reviews is read from the cache so that
+        # a request for an unchanged page is answered without any queries
+        namespace = self.get_reviews_namespace()
+        generation = caching.get_generations([namespace])[namespace]
+        etag = quote_etag(hashlib.md5(force_bytes("%s:%s:%s" % (
+            generation, request.shop.pk, request.get_full_path()
+        ))).hexdigest())
+        last_modified = int(caching.get_generation_time(generation))
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = JsonResponse(self.get_payload())
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        patch_cache_control(response, **self.get_cache_control())
+        return response
+
+    def get_reviews_queryset(self):
+        """
+        Returns the approved reviews with comments to list
+        """
+        raise NotImplementedError()
+
+    def get_page_size(self):
+        raise NotImplementedError()
+
+    def get_sort(self):
+        sort = self.get_params().get("sort")
+        return (sort if sort in COMMENT_SORTS else list(COMMENT_SORTS)[0])
+
+    def get_rating(self):
+        """
+        Returns the rating of the `rating` parameter to filter the reviews with, if any
+        """
+        rating = self.get_params().get("rating")
+        if rating and rating.isdigit() and 1 <= int(rating) <= 5:
+            return int(rating)
+
+    def get_search(self):
+        """
+        Returns the `q` parameter to search the comments with, if it has any words
+        """
+        query = self.get_params().get("q", "").strip()
+        return (query if get_search_words(query) else None)
+
+    def get_list_params(self):
+        """
+        Returns the sort and filter parameters of the request to keep in the page URLs
+        """
+        params = {}
+        if self.get_params().get("sort") in COMMENT_SORTS:
+            params["sort"] = self.get_params()["sort"]
+        if self.get_rating():
+            params["rating"] = self.get_rating()
+        if self.get_search():
+            params["q"] = self.get_search()
+        return params
+
+    def get_sorted_reviews(self):
+        """
+        Returns the values of the reviews filtered and sorted by the request
+        """
+        queryset = (self.get_reviews_queryset() if self.reviews_queryset is None else self.reviews_queryset)
+        rating = self.get_rating()
+        if rating:
+            queryset = queryset.filter(rating=rating)
+        search = self.get_search()
+        if search:
+            queryset = search_comments(queryset, search)
+        return queryset.order_by(*COMMENT_SORTS[self.get_sort()]).values(*REVIEW_COMMENT_VALUES)
+
+    def get_reviews_page(self):
+        """
+        Returns the page of the review values of the `page` parameter
+        """
+        queryset = self.get_sorted_reviews()
+        paginator = Paginator(queryset, self.get_page_size())
+        page = self.get_params().get("page")
+
+        try:
+            return paginator.page(page)
+        except PageNotAnInteger:
+            return paginator.page(1)
+        except EmptyPage:
+            return paginator.page(paginator.num_pages)
+
+    def get_reviews_after_cursor(self, cursor):
+        """
+        Returns the page of the values of the reviews after the review of the cursor, or the first page
+        when there is no valid cursor, and the cursor of the next page, or `None` if it is the last one
+
+        Unlike the numbered pages, the cursor pages are read with an index range
+        without counting the reviews or skipping the reviews of the previous pages.
+        """
+        ordering = COMMENT_SORTS[self.get_sort()]
+        queryset = self.get_sorted_reviews()
+        position = decode_cursor(ordering, cursor)
+        if position:
+            queryset = queryset.filter(get_keyset_filter(ordering, position))
+
+        page_size = self.get_page_size()
+        reviews = list(queryset[:page_size + 1])
+        if len(reviews) > page_size:
+            return (reviews[:page_size], encode_cursor(ordering, reviews[page_size - 1]))
+        return (reviews, None)
+
+    def get_page_url(self, **params):
+        return self.get_object_page_url(self.kwargs["pk"], **params)
+
+    def get_object_page_url(self, pk, **params):
+        url = reverse("shuup:%s" % self.view_name, kwargs=dict(pk=pk))
+        params.update(self.get_list_params())
+        return "{}?{}".format(url, urlencode(sorted(params.items())))
+
+    def get_payload(self):
+        # the numbered pages are kept for the links created before the cursor pages
+        if "page" in self.get_params():
+            page = self.get_reviews_page()
+            object_list = page.object_list
+            next_page_url = (self.get_page_url(page=page.number + 1) if page.has_next() else None)
+        else:
+            (object_list, next_cursor) = self.get_reviews_after_cursor(self.get_params().get("cursor"))
+            next_page_url = (self.get_page_url(cursor=next_cursor) if next_cursor else None)
+
+        return {
+            "reviews": [serialize_review_comment(values) for values in object_list],
             "next_page_url": next_page_url,
         }
-        return JsonResponse(payload)
+
+    def limit_first_page_payload(self, pk, payload, size):
+        """
+        Returns the first page payload of the object limited to its first `size` reviews
+        """
+        if len(payload["reviews"]) <= size:
+            return payload
+
+        # continue after the last of the reviews, see `encode_cursor`
+        reviews = payload["reviews"][:size]
+        position = {"created_on": reviews[-1]["date"], "pk": reviews[-1]["id"]}
+        cursor = encode_cursor(COMMENT_SORTS[self.get_sort()], position)
+        return {"reviews": reviews, "next_page_url": self.get_object_page_url(pk, cursor=cursor)}
+
+
+class BaseManyCommentsView(View):
+    """
+    The first reviews of many objects at once, e.g. ``?ids=1,2,3&limit=3``
+
+    The reviews are read from the cached first pages of the
+    objects, see `BaseCommentsView.get_first_page_payloads`.
+    """
+    #: The `BaseCommentsView` of the reviews of each object
+    comments_view_class = None
+    #: The maximum number of objects per request
+    max_objects = 20
+
+    def get_cache_control(self):
+        return {}
+
+    def get_ids(self):
+        """
+        Returns the unique ids of the `ids` parameter in their order
+        """
+        ids = []
+        for value in self.request.GET.get("ids", "").split(","):
+            value = value.strip()
+            if value.isdigit() and int(value) not in ids:
+                ids.append(int(value))
+        return ids
+
+    def get_limit(self, page_size):
+        """
+        Returns the number of reviews of the `limit` parameter, up to a page of reviews
+        """
+        limit = self.request.GET.get("limit", "")
+        return (min(int(limit), page_size) if limit.isdigit() and int(limit) else page_size)
+
+    def get(self, request, *args, **kwargs):
+        ids = self.get_ids()
+        if len(ids) > self.max_objects:
+            return JsonResponse({"error": "At most %d ids are allowed." % self.max_objects}, status=400)
+
+        payloads = self.comments_view_class.get_first_page_payloads(request, ids)
+        # the first pages of all the objects are limited with the same view
+        view = self.comments_view_class.get_first_page_view(request, None)
+        limit = self.get_limit(view.get_page_size())
+        results = dict((pk, view.limit_first_page_payload(pk, payloads[pk], limit)) for pk in ids)
+
+        response = JsonResponse({"results": results})
+        patch_cache_control(response, **self.get_cache_control())
+        return response
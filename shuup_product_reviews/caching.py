@@ -0,0 +1,438 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup Product Reviews Addon.
+#
+# Copyright (c) 2012-2019, Shoop Commerce Ltd. All rights reserved.
+#
+# This source code is licensed under the OSL-3.0 license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Versioned caching of the star ratings.
+
+Every product and vendor has its own cache namespace, e.g.
+``product_reviews_star_rating_1``, and the current generation of the
+namespace is part of the keys of all its cached values. Bumping the
+generation invalidates all the values of the namespace at once.
+
+Unlike with ``shuup.core.cache``, the generations and the values of many
+namespaces are read with one ``get_many`` each, so rendering the ratings
+of a whole listing page takes two cache round-trips.
+
+The namespace of an object holds two levels of values per shop: the
+review totals of the object and the star ratings rendered from them, one
+variant per render options and language. All the variants are rendered
+from the cached totals with a single aggregation query per object.
+
+Objects without reviews are cached too, and the values are protected from
+stampedes: missing values are computed by one request at a time and
+values about to expire are recomputed early by one request, see
+`get_or_set_many`.
+
+Optionally, the values are also kept in a bounded in-process LRU cache,
+see ``PRODUCT_REVIEWS_LOCAL_CACHE_SIZE``. Instead of the generation of
+every namespace, the local values are validated against a generation per
+shop bumped with every star rating invalidation in the shop, read from the
+shared cache at most once a second, so the processes serve hot star
+ratings from memory and still notice review changes within seconds.
+"""
+import hashlib
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.encoding import force_bytes, force_text
+from django.utils.translation import get_language
+
+#: Seconds between the checks whether the values locked by another request are cached
+LOCK_POLL_INTERVAL = 0.05
+
+#: How early the values are recomputed before they expire, higher is earlier
+EARLY_EXPIRY_BETA = 1.0
+
+#: Seconds the process trusts the generations of the local values of a shop before re-reading them
+LOCAL_GENERATION_CHECK_INTERVAL = 1
+
+# The local cache of the process: an LRU dict of the `(namespace, key)` pairs
+# and their values, the shop generations they are valid for and expiry times
+_local_cache = OrderedDict()
+_local_generations = {}
+_local_lock = threading.Lock()
+
+
+def _get_cache():
+    return caches["default"]
+
+
+def _get_generation_key(namespace):
+    return "_product_reviews_generation:%s" % namespace
+
+
+def _get_new_generation():
+    return "%s/%s" % (time.time(), random.random())
+
+
+def get_generations(namespaces):
+    """
+    Returns a dict of the given namespaces and their current generations
+
+    Namespaces without a generation, e.g. after the cache evicted it,
+    get a new one so that no values cached before can be read.
+    """
+    cache = _get_cache()
+    generation_keys = dict((namespace, _get_generation_key(namespace)) for namespace in set(namespaces))
+    found = cache.get_many(list(generation_keys.values()))
+    generations = {}
+    missing = {}
+    for (namespace, generation_key) in generation_keys.items():
+        if generation_key in found:
+            generations[namespace] = found[generation_key]
+        else:
+            generations[namespace] = missing[generation_key] = _get_new_generation()
+    if missing:
+        cache.set_many(missing, timeout=None)
+    return generations
+
+
+def get_generation_time(generation):
+    """
+    Returns the timestamp of when the generation was created, i.e. when the
+    namespace was last invalidated, or when its previous generation was evicted
+    """
+    return float(generation.split("/")[0])
+
+
+def bump_namespace(namespace):
+    """
+    Invalidate all the values cached in the namespace
+    """
+    _get_cache().set(_get_generation_key(namespace), _get_new_generation(), timeout=None)
+
+
+def get_versioned_keys(keys):
+    """
+    :param keys: dict of names and their `(namespace, key)` pairs
+    :return: dict of the names and the cache keys in the current generation of their namespace
+    :rtype: dict
+    """
+    generations = get_generations(namespace for (namespace, key) in keys.values())
+    return dict(
+        (name, "%s:%s:%s" % (namespace, generations[namespace], key))
+        for (name, (namespace, key)) in keys.items()
+    )
+
+
+def _is_expiring(delta, expires_at):
+    # probabilistic early expiration: the closer the value is to expiring and the longer it
+    # took to compute, the likelier a read recomputes it before every request misses at once
+    return time.time() - delta * EARLY_EXPIRY_BETA * math.log(1.0 - random.random()) >= expires_at
+
+
+def _read_many(versioned_keys):
+    cached = _get_cache().get_many(list(versioned_keys.values()))
+    values = {}
+    expiring = []
+    for (name, key) in versioned_keys.items():
+        if key in cached:
+            (value, delta, expires_at) = cached[key]
+            values[name] = value
+            if _is_expiring(delta, expires_at):
+                expiring.append(name)
+    return (values, expiring)
+
+
+def get_many(versioned_keys):
+    """
+    :param versioned_keys: dict of names and their cache keys from `get_versioned_keys`
+    :return: dict of the names that are cached and their values
+    :rtype: dict
+    """
+    return _read_many(versioned_keys)[0]
+
+
+def set_many(versioned_keys, values, delta=0):
+    """
+    :param versioned_keys: dict of names and their cache keys from `get_versioned_keys`
+    :param values: dict of names and the values to cache
+    :param delta: seconds it took to compute the values
+    """
+    if values:
+        timeout = settings.PRODUCT_REVIEWS_CACHE_DURATION
+        expires_at = time.time() + timeout
+        _get_cache().set_many(
+            dict((versioned_keys[name], (value, delta, expires_at)) for (name, value) in values.items()),
+            timeout=timeout
+        )
+
+
+def _get_lock_key(key):
+    return "_product_reviews_lock:%s" % key
+
+
+def _get_batch_lock_key(cache_keys):
+    """
+    Returns the lock key of computing the values of the given cache keys at once,
+    the lock of the key itself for a single key
+    """
+    if len(cache_keys) == 1:
+        return _get_lock_key(cache_keys[0])
+    return _get_lock_key("batch:%s" % hashlib.md5(force_bytes("|".join(sorted(cache_keys)))).hexdigest())
+
+
+def _wait_for(versioned_keys, names):
+    values = {}
+    waiting_keys = dict((name, versioned_keys[name]) for name in names)
+    deadline = time.time() + settings.PRODUCT_REVIEWS_CACHE_LOCK_TIMEOUT
+    while waiting_keys and time.time() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        found = get_many(waiting_keys)
+        values.update(found)
+        waiting_keys = dict((name, key) for (name, key) in waiting_keys.items() if name not in found)
+    return values
+
+
+def get_or_set_many(versioned_keys, get_values):
+    """
+    Returns the values of all the names of the versioned keys, computing
+    the values that are not cached with `get_values` and caching them.
+
+    Only one request computes the same missing values at a time while the others
+    wait for them to be cached, up to ``PRODUCT_REVIEWS_CACHE_LOCK_TIMEOUT`` seconds.
+    Values about to expire are recomputed early by one request while the
+    others are still served the cached values.
+
+    The values computed at once are locked with a single lock, taken with one cache
+    call, and a request waits only when it does not hold a lock, so requests computing
+    overlapping values never wait for each other's locks.
+
+    :param versioned_keys: dict of names and their cache keys from `get_versioned_keys`
+    :param get_values: function returning a dict of the given names and their values
+    :rtype: dict
+    """
+    (values, expiring) = _read_many(versioned_keys)
+    missing = [name for name in versioned_keys if name not in values]
+    if not missing and not expiring:
+        return values
+
+    names = missing + expiring
+    lock_key = _get_batch_lock_key([versioned_keys[name] for name in names])
+    locked = _get_cache().add(lock_key, True, settings.PRODUCT_REVIEWS_CACHE_LOCK_TIMEOUT)
+    if not locked:
+        # another request computes the values, the expiring ones are still served from the cache
+        values.update(_wait_for(versioned_keys, missing))
+        names = [name for name in missing if name not in values]
+    try:
+        if names:
+            start = time.time()
+            computed = get_values(names)
+            set_many(versioned_keys, computed, delta=time.time() - start)
+            values.update(computed)
+    finally:
+        if locked:
+            _get_cache().delete(lock_key)
+    return values
+
+
+def get_or_set(namespace, shop, key, get_value):
+    """
+    Returns the value cached under the key of the shop in the namespace,
+    caching the value returned by `get_value` when it is not cached
+    """
+    def get_shared(names):
+        cache_keys = get_versioned_keys({key: (namespace, key)})
+        return get_or_set_many(cache_keys, lambda names: {key: get_value()})
+
+    return _read_through_local({key: (namespace, key)}, shop, get_shared)[key]
+
+
+def _get_shop_namespace(shop_key):
+    return "product_reviews_shop_%s" % shop_key
+
+
+def _get_local_generation(shop):
+    """
+    Returns the generations the local values of the shop are valid for,
+    re-reading them from the shared cache at most every `LOCAL_GENERATION_CHECK_INTERVAL`
+    """
+    shop_key = get_shop_key(shop)
+    now = time.time()
+    checked = _local_generations.get(shop_key)
+    if checked and now - checked[1] < LOCAL_GENERATION_CHECK_INTERVAL:
+        return checked[0]
+
+    namespaces = [_get_shop_namespace(shop_key), _get_shop_namespace("any")]
+    generations = get_generations(namespaces)
+    generation = tuple(generations[namespace] for namespace in namespaces)
+    _local_generations[shop_key] = (generation, now)
+    return generation
+
+
+def _read_through_local(keys, shop, get_shared):
+    """
+    Returns the values of the given `(namespace, key)` pairs of the shop from the local cache,
+    reading the ones not in it with `get_shared` and storing them in the local cache
+
+    :param get_shared: function returning a dict of the given names and their values
+    """
+    size = settings.PRODUCT_REVIEWS_LOCAL_CACHE_SIZE
+    if not size:
+        return get_shared(list(keys))
+
+    generation = _get_local_generation(shop)
+    now = time.time()
+    values = {}
+    with _local_lock:
+        for (name, key) in keys.items():
+            entry = _local_cache.pop(key, None)
+            if entry is None:
+                continue
+            (value, entry_generation, expires_at) = entry
+            if entry_generation == generation and expires_at > now:
+                # re-inserted as the most recently used
+                _local_cache[key] = entry
+                values[name] = value
+
+    missing = [name for name in keys if name not in values]
+    if missing:
+        shared = get_shared(missing)
+        expires_at = time.time() + settings.PRODUCT_REVIEWS_LOCAL_CACHE_DURATION
+        with _local_lock:
+            for (name, value) in shared.items():
+                _local_cache[keys[name]] = (value, generation, expires_at)
+            while len(_local_cache) > size:
+                _local_cache.popitem(last=False)
+        values.update(shared)
+    return values
+
+
+def bump_local_caches(shop_id=None):
+    """
+    Invalidate the local values of the shop, or of all the shops, in every process
+
+    The other processes notice the invalidation within `LOCAL_GENERATION_CHECK_INTERVAL` seconds.
+    """
+    if not settings.PRODUCT_REVIEWS_LOCAL_CACHE_SIZE:
+        return
+    if shop_id is None:
+        bump_namespace(_get_shop_namespace("any"))
+        _local_generations.clear()
+    else:
+        # the ratings of all shops include the ratings of the shop
+        for shop_key in (shop_id, "all"):
+            bump_namespace(_get_shop_namespace(shop_key))
+            _local_generations.pop(shop_key, None)
+
+
+def clear_local_cache():
+    with _local_lock:
+        _local_cache.clear()
+    _local_generations.clear()
+
+
+def get_shop_key(shop):
+    return (shop.pk if shop else "all")
+
+
+def get_data_key(shop):
+    """
+    Returns the key of the review totals of the shop in an object namespace
+    """
+    return "data:%s" % get_shop_key(shop)
+
+
+def get_comments_key(shop):
+    """
+    Returns the key of whether the object has reviews with comments in the shop in an object namespace
+    """
+    return "comments:%s" % get_shop_key(shop)
+
+
+def get_comments_page_key(shop):
+    """
+    Returns the key of the first page of the review comments of the object in the shop in an object namespace
+    """
+    return "comments_page:%s" % get_shop_key(shop)
+
+
+def get_variant_key(shop, options):
+    """
+    Returns the key of the star rating rendered with the given
+    options in the active language in an object namespace
+    """
+    options = "|".join(force_text(option) for option in tuple(options) + (get_language(),))
+    return "html:%s:%s" % (get_shop_key(shop), hashlib.md5(force_bytes(options)).hexdigest())
+
+
+def _get_object_keys(object_ids, get_namespace, key):
+    return dict((object_id, (get_namespace(object_id), key)) for object_id in object_ids)
+
+
+def get_cached_values(object_ids, get_namespace, shop, key, get_values):
+    """
+    Returns the values cached under the key of the shop in the namespaces
+    of the given objects, reading the objects not in the cache with `get_values`
+
+    :param get_namespace: function returning the cache namespace of an object id
+    :param get_values: function returning a dict of the given object ids and their values
+    :return: dict of the object ids and their values
+    :rtype: dict
+    """
+    keys = _get_object_keys(object_ids, get_namespace, key)
+
+    def get_shared(missing_ids):
+        cache_keys = get_versioned_keys(dict((object_id, keys[object_id]) for object_id in missing_ids))
+        return get_or_set_many(cache_keys, get_values)
+
+    return _read_through_local(keys, shop, get_shared)
+
+
+def get_cached_data(object_ids, get_namespace, shop, get_data):
+    """
+    Returns the review totals of the given objects in the shop, reading
+    the objects not in the cache with `get_data`. The totals of objects
+    without reviews are cached too.
+
+    :param get_namespace: function returning the cache namespace of an object id
+    :param get_data: function returning a dict of the given object ids and their totals
+    :return: dict of the object ids and their totals
+    :rtype: dict
+    """
+    return get_cached_values(object_ids, get_namespace, shop, get_data_key(shop), get_data)
+
+
+def get_cached_renders(object_ids, get_namespace, shop, options, get_data, render):
+    """
+    Returns the star ratings of the given objects rendered with the
+    given options, rendering the ones not in the cache from the cached
+    review totals of the objects, see `get_cached_data`.
+
+    :param options: the render options the star ratings vary by
+    :param render: function rendering the totals of an object, returns `None` when it has no reviews
+    :return: dict of the object ids and their star ratings, an empty string if the object has no reviews
+    :rtype: dict[int, str]
+    """
+    keys = _get_object_keys(object_ids, get_namespace, get_variant_key(shop, options))
+
+    def get_shared(missing_ids):
+        shared_keys = dict((object_id, keys[object_id]) for object_id in missing_ids)
+        shared_keys.update(
+            (("data", object_id), value)
+            for (object_id, value) in _get_object_keys(missing_ids, get_namespace, get_data_key(shop)).items()
+        )
+        # the keys of both levels are versioned at once as they share the namespaces
+        versioned_keys = get_versioned_keys(shared_keys)
+
+        def render_many(render_ids):
+            data = get_or_set_many(
+                dict((object_id, versioned_keys[("data", object_id)]) for object_id in render_ids), get_data
+            )
+            # objects without reviews are cached as empty strings
+            return dict((object_id, render(data[object_id]) or "") for object_id in render_ids)
+
+        return get_or_set_many(
+            dict((object_id, versioned_keys[object_id]) for object_id in missing_ids), render_many
+        )
+
+    return _read_through_local(keys, shop, get_shared)
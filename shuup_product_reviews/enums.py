@@ -18,3 +18,16 @@ class ReviewStatus(Enum):
         PENDING = _("Pending")
         APPROVED = _("Approved")
         REJECTED = _("Rejected")
+
+
+class ModerationJobStatus(Enum):
+    PENDING = 1
+    RUNNING = 2
+    COMPLETED = 3
+    FAILED = 4
+
+    class Labels:
+        PENDING = _("Pending")
+        RUNNING = _("Running")
+        COMPLETED = _("Completed")
+        FAILED = _("Failed")
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup Product Reviews Addon.
+#
+# Copyright (c) 2012-2019, Shoop Commerce Ltd. All rights reserved.
+#
+# This source code is licensed under the OSL-3.0 license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Streaming export of the product and vendor reviews of a shop.
+
+The reviews are read in chunks of ascending ids, each chunk with one
+query of the exported columns, and written out row by row, so exporting
+any number of reviews takes the memory of one chunk. The rows are
+exported as CSV or JSON Lines, see `EXPORT_FORMATS`.
+"""
+import csv
+import json
+from collections import OrderedDict
+
+from django.apps import apps
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from shuup_product_reviews.enums import ReviewStatus
+
+#: The exported columns and the review fields they are read from,
+#: the columns without a field are only read for some kinds of reviews
+EXPORT_COLUMNS = OrderedDict([
+    ("type", None),
+    ("id", "pk"),
+    ("shop_id", "shop_id"),
+    ("product_sku", None),
+    ("supplier", None),
+    ("reviewer", "reviewer__name"),
+    ("rating", "rating"),
+    ("comment", "comment"),
+    ("would_recommend", "would_recommend"),
+    ("status", "status"),
+    ("created_on", "created_on"),
+    ("modified_on", "modified_on"),
+])
+
+#: The app and model of each kind of reviews and the fields of their own columns
+REVIEW_EXPORTS = OrderedDict([
+    ("product", ("shuup_product_reviews", "ProductReview", {"product_sku": "product__sku"})),
+    ("vendor", ("shuup_vendor_reviews", "VendorReview", {"supplier": "supplier__name"})),
+])
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def parse_since(value):
+    """
+    Returns the datetime of an ISO date or datetime, in the current time zone when it has none,
+    or `None` if it is not valid
+    """
+    since = parse_datetime(value)
+    if since is None:
+        date = parse_date(value)
+        if date is None:
+            return None
+        since = timezone.datetime.combine(date, timezone.datetime.min.time())
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+def iter_review_values(queryset, fields, chunk_size):
+    """
+    Yields the values of the reviews in chunks of ascending ids
+    """
+    last_pk = None
+    while True:
+        chunk = (queryset if last_pk is None else queryset.filter(pk__gt=last_pk))
+        rows = list(chunk.order_by("pk").values(*fields)[:chunk_size])
+        for values in rows:
+            yield values
+        if len(rows) < chunk_size:
+            return
+        last_pk = rows[-1]["pk"]
+
+
+def iter_review_rows(shop, kinds=None, since=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yields the export rows of the reviews of the shop, with all the
+    `EXPORT_COLUMNS`, of the installed apps of the given kinds of reviews
+
+    :param since: only export the reviews modified since this datetime
+    """
+    for kind in (kinds or REVIEW_EXPORTS):
+        (app_label, model_name, kind_columns) = REVIEW_EXPORTS[kind]
+        if not apps.is_installed(app_label):
+            continue
+
+        queryset = apps.get_model(app_label, model_name).objects.filter(shop=shop)
+        if since:
+            queryset = queryset.filter(modified_on__gte=since)
+
+        columns = OrderedDict(EXPORT_COLUMNS)
+        columns.update(kind_columns)
+        fields = [field for field in columns.values() if field]
+        for values in iter_review_values(queryset, fields, chunk_size):
+            row = OrderedDict((column, (values[field] if field else None)) for (column, field) in columns.items())
+            row["type"] = kind
+            row["status"] = ReviewStatus(row["status"]).name.lower()
+            row["created_on"] = row["created_on"].isoformat()
+            row["modified_on"] = row["modified_on"].isoformat()
+            yield row
+
+
+class _Echo(object):
+    """
+    The file of a csv writer returning the written rows instead of keeping them
+    """
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(list(EXPORT_COLUMNS))
+    for row in rows:
+        yield writer.writerow(list(row.values()))
+
+
+def iter_json_lines(rows):
+    for row in rows:
+        yield json.dumps(row) + "\n"
+
+
+#: The functions yielding the lines of the export rows and the content type of each export format
+EXPORT_FORMATS = OrderedDict([
+    ("csv", (iter_csv, "text/csv")),
+    ("jsonl", (iter_json_lines, "application/x-ndjson")),
+])
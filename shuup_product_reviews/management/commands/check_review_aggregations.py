@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup Product Reviews Addon.
+#
+# Copyright (c) 2012-2019, Shoop Commerce Ltd. All rights reserved.
+#
+# This source code is licensed under the OSL-3.0 license found in the
+# LICENSE file in the root directory of this source tree.
+from .recalculate_review_aggregations import Command as RecalculateCommand
+
+
+class Command(RecalculateCommand):
+    help = (
+        "Compare the stored product and vendor review aggregations with the reviews in chunks "
+        "of reviewed objects and report the ones that have drifted, e.g. after bulk updates or raw SQL."
+    )
+    default_sleep_help = "by default as long as the chunk took so the check can run against a busy database"
+
+    def get_sleep(self, options, chunk_duration):
+        if options["sleep"] is not None:
+            return options["sleep"]
+        return chunk_duration
+
+    def add_mode_arguments(self, parser):
+        parser.add_argument("--repair", action="store_true", help="Also rewrite the aggregations that have drifted.")
+
+    def get_mode(self, options):
+        return (True, options["repair"])
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup Product Reviews Addon.
+#
+# Copyright (c) 2012-2019, Shoop Commerce Ltd. All rights reserved.
+#
+# This source code is licensed under the OSL-3.0 license found in the
+# LICENSE file in the root directory of this source tree.
+import io
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shuup.core.models import Shop
+from shuup_product_reviews.export import (
+    DEFAULT_CHUNK_SIZE, EXPORT_FORMATS, iter_review_rows, parse_since,
+    REVIEW_EXPORTS
+)
+
+
+class Command(BaseCommand):
+    help = "Export the product and vendor reviews of a shop as CSV or JSON Lines, reading the reviews in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--shop", type=int, required=True, help="The id of the shop to export the reviews of.")
+        parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="csv", help="The export format.")
+        parser.add_argument(
+            "--reviews", choices=list(REVIEW_EXPORTS), nargs="+", default=list(REVIEW_EXPORTS),
+            help="The kind of reviews to export."
+        )
+        parser.add_argument(
+            "--since", help="Only export the reviews modified since this ISO date or datetime, for incremental exports."
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Number of reviews read at once."
+        )
+        parser.add_argument("--output", help="The file to write the export to instead of the standard output.")
+
+    def handle(self, *args, **options):
+        shop = Shop.objects.filter(pk=options["shop"]).first()
+        if not shop:
+            raise CommandError("Shop %s does not exist." % options["shop"])
+
+        since = None
+        if options["since"]:
+            since = parse_since(options["since"])
+            if not since:
+                raise CommandError("Invalid --since date: %s" % options["since"])
+
+        rows = iter_review_rows(shop, options["reviews"], since, options["chunk_size"])
+        lines = EXPORT_FORMATS[options["format"]][0](rows)
+        if options["output"]:
+            with io.open(options["output"], "w", encoding="utf-8", newline="") as output:
+                for line in lines:
+                    output.write(line)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending="")
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup Product Reviews Addon.
+#
+# Copyright (c) 2012-2019, Shoop Commerce Ltd. All rights reserved.
+#
+# This source code is licensed under the OSL-3.0 license found in the
+# LICENSE file in the root directory of this source tree.
+import time
+
+from django.core.management.base import BaseCommand
+
+from shuup_product_reviews.aggregation import process_aggregation_queue
+
+
+class Command(BaseCommand):
+    help = "Recalculate the review aggregations queued when PRODUCT_REVIEWS_AGGREGATION_MODE is `queue`."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Number of queue items processed at once.")
+        parser.add_argument("--loop", action="store_true", help="Keep waiting for new items instead of exiting.")
+        parser.add_argument("--interval", type=float, default=5, help="Seconds to wait when the queue is empty.")
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            processed = process_aggregation_queue(options["batch_size"])
+            total += processed
+            if processed:
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+
+        self.stdout.write("Processed %d queued review aggregations." % total)
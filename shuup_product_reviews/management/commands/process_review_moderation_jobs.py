@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup Product Reviews Addon.
+#
+# Copyright (c) 2012-2019, Shoop Commerce Ltd. All rights reserved.
+#
+# This source code is licensed under the OSL-3.0 license found in the
+# LICENSE file in the root directory of this source tree.
+import time
+
+from django.core.management.base import BaseCommand
+
+from shuup_product_reviews.moderation import (
+    DEFAULT_CHUNK_SIZE, get_unfinished_moderation_jobs, process_moderation_job
+)
+
+
+class Command(BaseCommand):
+    help = "Moderate the reviews of the review moderation jobs created in the admin, resuming the interrupted jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Number of reviews moderated at once."
+        )
+        parser.add_argument("--retry-failed", action="store_true", help="Also resume the failed jobs.")
+        parser.add_argument("--loop", action="store_true", help="Keep waiting for new jobs instead of exiting.")
+        parser.add_argument("--interval", type=float, default=5, help="Seconds to wait when there are no jobs.")
+
+    def handle(self, *args, **options):
+        total = 0
+        retry_failed = options["retry_failed"]
+        while True:
+            jobs = list(get_unfinished_moderation_jobs(retry_failed))
+            # the failed jobs are retried once per command
+            retry_failed = False
+            for job in jobs:
+                try:
+                    process_moderation_job(job, options["chunk_size"])
+                except Exception as exc:
+                    self.stderr.write("Review moderation job %d failed: %s" % (job.pk, exc))
+                else:
+                    total += 1
+            if jobs:
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+
+        self.stdout.write("Processed %d review moderation jobs." % total)
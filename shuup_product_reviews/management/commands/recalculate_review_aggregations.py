@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup Product Reviews Addon.
+#
+# Copyright (c) 2012-2019, Shoop Commerce Ltd. All rights reserved.
+#
+# This source code is licensed under the OSL-3.0 license found in the
+# LICENSE file in the root directory of this source tree.
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from shuup.core.models import Shop
+
+REVIEW_MODELS = {
+    "product": ("shuup_product_reviews", "ProductReview"),
+    "vendor": ("shuup_vendor_reviews", "VendorReview"),
+}
+
+
+class Command(BaseCommand):
+    help = "Recalculate the product and vendor review aggregations in chunks of reviewed objects."
+    default_sleep_help = "by default 0"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--shop", type=int, help="Only recalculate objects reviewed in the shop with this id.")
+        parser.add_argument(
+            "--reviews", choices=sorted(REVIEW_MODELS), nargs="+", default=sorted(REVIEW_MODELS),
+            help="The kind of reviews to recalculate."
+        )
+        parser.add_argument("--start-id", type=int, help="First product/vendor id to recalculate.")
+        parser.add_argument("--end-id", type=int, help="Last product/vendor id to recalculate.")
+        parser.add_argument("--chunk-size", type=int, default=500, help="Number of ids recalculated at once.")
+        parser.add_argument(
+            "--sleep", type=float,
+            help="Seconds to wait after each chunk to limit the load on the database, %s." % self.default_sleep_help
+        )
+        self.add_mode_arguments(parser)
+
+    def add_mode_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only print the aggregations that would change.")
+
+    def get_mode(self, options):
+        """
+        Returns whether to print and whether to write the aggregations that differ
+        """
+        return (options["dry_run"], not options["dry_run"])
+
+    def get_sleep(self, options, chunk_duration):
+        """
+        Returns the seconds to wait after a chunk that took `chunk_duration` seconds
+        """
+        if options["sleep"] is not None:
+            return options["sleep"]
+        return 0
+
+    def handle(self, *args, **options):
+        shop = None
+        if options["shop"]:
+            shop = Shop.objects.filter(pk=options["shop"]).first()
+            if not shop:
+                raise CommandError("Shop %s does not exist." % options["shop"])
+
+        for kind in options["reviews"]:
+            app_label, model_name = REVIEW_MODELS[kind]
+            if not apps.is_installed(app_label):
+                continue
+            for sync in apps.get_model(app_label, model_name).get_aggregation_syncs():
+                self.recalculate(sync, shop, options)
+
+    def recalculate(self, sync, shop, options):
+        (low, high) = sync.get_key_bounds(shop)
+        if low is None:
+            self.stdout.write("No %s to recalculate." % sync.name)
+            return
+
+        start_id = max(low, options["start_id"] or low)
+        end_id = min(high, options["end_id"] or high)
+        chunk_size = options["chunk_size"]
+        (report, write) = self.get_mode(options)
+        total_changes = 0
+
+        sleep = 0
+        for key_from in range(start_id, end_id + 1, chunk_size):
+            if sleep:
+                time.sleep(sleep)
+
+            chunk_start = time.time()
+            key_to = min(key_from + chunk_size, end_id + 1)
+            differences = sync.get_differences(key_from, key_to, shop)
+            total_changes += len(differences)
+
+            if report:
+                self.print_differences(sync, differences)
+            if write:
+                sync.write(differences)
+            sleep = self.get_sleep(options, time.time() - chunk_start)
+
+            if options["verbosity"] >= 1:
+                self.stdout.write("%s %d-%d: %d changed" % (sync.name, key_from, key_to - 1, len(differences)))
+
+        self.stdout.write("%s: %d %s" % (sync.name, total_changes, ("changed" if write else "to change")))
+
+    def print_differences(self, sync, differences):
+        stored = sync.get_stored_for_keys(differences)
+        for key in sorted(differences):
+            self.stdout.write("%s %s (shop %d): %s -> %s" % (
+                sync.name,
+                " ".join(str(part) for part in key[1:]),
+                key[0],
+                self.format_values(stored.get(key)),
+                self.format_values(differences[key])
+            ))
+
+    def format_values(self, values):
+        if not values:
+            return "(none)"
+        return " ".join("%s=%s" % (field, value) for (field, value) in values._asdict().items())
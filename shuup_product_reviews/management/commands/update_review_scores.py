@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup Product Reviews Addon.
+#
+# Copyright (c) 2012-2019, Shoop Commerce Ltd. All rights reserved.
+#
+# This source code is licensed under the OSL-3.0 license found in the
+# LICENSE file in the root directory of this source tree.
+from django.core.management.base import BaseCommand, CommandError
+
+from shuup.core.models import Shop
+from shuup_product_reviews.scores import (
+    get_scored_aggregation_models, update_scores
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalculate the average rating of the review aggregations of each shop "
+        "and update the ranking scores of the shops where it has changed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--shop", type=int, help="Only update the scores of the shop with this id.")
+        parser.add_argument(
+            "--force", action="store_true",
+            help="Update the scores even if the average rating has not changed, e.g. after changing the prior weight."
+        )
+
+    def handle(self, *args, **options):
+        shops = Shop.objects.all()
+        if options["shop"]:
+            shops = shops.filter(pk=options["shop"])
+            if not shops.exists():
+                raise CommandError("Shop %s does not exist." % options["shop"])
+
+        shop_ids = list(shops.values_list("pk", flat=True))
+        for aggregation_model in get_scored_aggregation_models():
+            updated = sum(
+                update_scores(aggregation_model, shop_id, force=options["force"])
+                for shop_id in shop_ids
+            )
+            self.stdout.write("%s: scores updated in %d shops" % (aggregation_model._meta.verbose_name, updated))
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup Product Reviews Addon.
+#
+# Copyright (c) 2012-2019, Shoop Commerce Ltd. All rights reserved.
+#
+# This source code is licensed under the OSL-3.0 license found in the
+# LICENSE file in the root directory of this source tree.
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import translation
+from django.utils.module_loading import import_string
+
+from shuup.core.models import Shop
+
+#: The app of each kind of reviews and the functions returning the ids of all
+#: the reviewed objects of a shop, the ids of the most reviewed ones and warming them up
+WARM_UPS = {
+    "product": (
+        "shuup_product_reviews",
+        "shuup_product_reviews.utils.get_reviewable_product_ids",
+        "shuup_product_reviews.utils.get_most_reviewed_product_ids",
+        "shuup_product_reviews.utils.warm_star_rating_caches",
+    ),
+    "vendor": (
+        "shuup_vendor_reviews",
+        "shuup_vendor_reviews.utils.get_reviewable_supplier_ids",
+        "shuup_vendor_reviews.utils.get_most_reviewed_supplier_ids",
+        "shuup_vendor_reviews.utils.warm_star_rating_caches",
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Render and cache the star ratings of all the products and vendors of a shop, "
+        "or of the ones with the most reviews, in chunks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--shop", type=int, required=True, help="The id of the shop to warm up the caches of.")
+        parser.add_argument(
+            "--reviews", choices=sorted(WARM_UPS), nargs="+", default=sorted(WARM_UPS),
+            help="The kind of reviews to warm up the caches of."
+        )
+        parser.add_argument("--top", type=int, help="Only warm up the products/vendors with the most reviews.")
+        parser.add_argument(
+            "--language", nargs="+", default=[settings.LANGUAGE_CODE],
+            help="The languages to render the star ratings in."
+        )
+        parser.add_argument("--chunk-size", type=int, default=500, help="Number of ids rendered at once.")
+        parser.add_argument(
+            "--sleep", type=float, default=0,
+            help="Seconds to wait after each chunk to limit the load on the database."
+        )
+
+    def handle(self, *args, **options):
+        shop = Shop.objects.filter(pk=options["shop"]).first()
+        if not shop:
+            raise CommandError("Shop %s does not exist." % options["shop"])
+
+        for kind in options["reviews"]:
+            (app_label, get_ids, get_top_ids, warm) = WARM_UPS[kind]
+            if not apps.is_installed(app_label):
+                continue
+
+            if options["top"]:
+                ids = import_string(get_top_ids)(shop, options["top"])
+            else:
+                ids = import_string(get_ids)(shop)
+            self.warm_up(kind, import_string(warm), ids, shop, options)
+
+    def warm_up(self, kind, warm, ids, shop, options):
+        chunk_size = options["chunk_size"]
+        for index in range(0, len(ids), chunk_size):
+            if index and options["sleep"]:
+                time.sleep(options["sleep"])
+            for language in options["language"]:
+                with translation.override(language):
+                    warm(ids[index:index + chunk_size], shop)
+
+        self.stdout.write("%s: %d star ratings cached" % (kind, len(ids)))
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+APPROVED = 2
+
+
+def populate_rating_sum(apps, schema_editor):
+    ProductReview = apps.get_model("shuup_product_reviews", "ProductReview")
+    ProductReviewAggregation = apps.get_model("shuup_product_reviews", "ProductReviewAggregation")
+    rating_sums = ProductReview.objects.filter(status=APPROVED).values("product_id").annotate(rating_sum=Sum("rating"))
+    for row in rating_sums.iterator():
+        ProductReviewAggregation.objects.filter(product_id=row["product_id"]).update(rating_sum=row["rating_sum"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shuup_product_reviews', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productreviewaggregation',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, verbose_name='rating sum'),
+        ),
+        migrations.RunPython(populate_rating_sum, migrations.RunPython.noop),
+    ]
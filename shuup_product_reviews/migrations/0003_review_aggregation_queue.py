@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shuup_product_reviews', '0002_rating_sum'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewAggregationQueueItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('review_model', models.CharField(max_length=100, verbose_name='review model')),
+                ('object_id', models.PositiveIntegerField(verbose_name='object id')),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from decimal import Decimal
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+
+
+def populate_family_aggregations(apps, schema_editor):
+    ProductReviewAggregation = apps.get_model("shuup_product_reviews", "ProductReviewAggregation")
+    ProductFamilyReviewAggregation = apps.get_model("shuup_product_reviews", "ProductFamilyReviewAggregation")
+    families = ProductReviewAggregation.objects.annotate(
+        family_id=Coalesce("product__variation_parent_id", "product_id")
+    ).order_by().values("family_id").annotate(
+        family_review_count=Sum("review_count"),
+        family_rating_sum=Sum("rating_sum"),
+        family_would_recommend=Sum("would_recommend")
+    )
+    ProductFamilyReviewAggregation.objects.bulk_create([
+        ProductFamilyReviewAggregation(
+            product_id=row["family_id"],
+            review_count=row["family_review_count"],
+            rating_sum=row["family_rating_sum"],
+            would_recommend=row["family_would_recommend"],
+            rating=(Decimal(row["family_rating_sum"]) / row["family_review_count"]).quantize(Decimal("0.1"))
+        )
+        for row in families
+        if row["family_review_count"]
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shuup', '0057_remove_product_stock_behavior'),
+        ('shuup_product_reviews', '0003_review_aggregation_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductFamilyReviewAggregation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rating', models.DecimalField(decimal_places=1, default=0, max_digits=2, verbose_name='rating')),
+                ('rating_sum', models.PositiveIntegerField(default=0, verbose_name='rating sum')),
+                ('review_count', models.PositiveIntegerField(default=0, verbose_name='review count')),
+                ('would_recommend', models.PositiveIntegerField(default=0, verbose_name='users would recommend')),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='product_family_reviews_aggregation', to='shuup.Product', verbose_name='product')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(populate_family_aggregations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Case, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+APPROVED = 2
+RATING_COUNT_FIELDS = tuple("rating_%d_count" % stars for stars in range(1, 6))
+
+
+def _count_when(**conditions):
+    return Sum(Case(When(then=Value(1), **conditions), default=Value(0), output_field=models.PositiveIntegerField()))
+
+
+def populate_rating_counts(apps, schema_editor):
+    ProductReview = apps.get_model("shuup_product_reviews", "ProductReview")
+    ProductReviewAggregation = apps.get_model("shuup_product_reviews", "ProductReviewAggregation")
+    ProductFamilyReviewAggregation = apps.get_model("shuup_product_reviews", "ProductFamilyReviewAggregation")
+
+    rating_counts = ProductReview.objects.filter(status=APPROVED).order_by().values("product_id").annotate(
+        **dict((field, _count_when(rating=stars)) for (stars, field) in enumerate(RATING_COUNT_FIELDS, 1))
+    )
+    for row in rating_counts.iterator():
+        ProductReviewAggregation.objects.filter(product_id=row.pop("product_id")).update(**row)
+
+    for family in ProductFamilyReviewAggregation.objects.all().iterator():
+        family_counts = ProductReviewAggregation.objects.filter(
+            Q(product_id=family.product_id) | Q(product__variation_parent_id=family.product_id)
+        ).aggregate(**dict((field, Coalesce(Sum(field), 0)) for field in RATING_COUNT_FIELDS))
+        ProductFamilyReviewAggregation.objects.filter(pk=family.pk).update(**family_counts)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shuup_product_reviews', '0004_product_family_aggregation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productfamilyreviewaggregation',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='1 star reviews'),
+        ),
+        migrations.AddField(
+            model_name='productfamilyreviewaggregation',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='2 star reviews'),
+        ),
+        migrations.AddField(
+            model_name='productfamilyreviewaggregation',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='3 star reviews'),
+        ),
+        migrations.AddField(
+            model_name='productfamilyreviewaggregation',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='4 star reviews'),
+        ),
+        migrations.AddField(
+            model_name='productfamilyreviewaggregation',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='5 star reviews'),
+        ),
+        migrations.AddField(
+            model_name='productreviewaggregation',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='1 star reviews'),
+        ),
+        migrations.AddField(
+            model_name='productreviewaggregation',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='2 star reviews'),
+        ),
+        migrations.AddField(
+            model_name='productreviewaggregation',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='3 star reviews'),
+        ),
+        migrations.AddField(
+            model_name='productreviewaggregation',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='4 star reviews'),
+        ),
+        migrations.AddField(
+            model_name='productreviewaggregation',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='5 star reviews'),
+        ),
+        migrations.RunPython(populate_rating_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from decimal import Decimal
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Case, Count, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+APPROVED = 2
+RATING_COUNT_FIELDS = tuple("rating_%d_count" % stars for stars in range(1, 6))
+SUMMED_FIELDS = ("review_count", "rating_sum", "would_recommend") + RATING_COUNT_FIELDS
+
+
+def _count_when(**conditions):
+    return Sum(Case(When(then=Value(1), **conditions), default=Value(0), output_field=models.PositiveIntegerField()))
+
+
+def _get_rating(row):
+    return (Decimal(row["rating_sum"]) / row["review_count"]).quantize(Decimal("0.1"))
+
+
+def delete_aggregations(apps, schema_editor):
+    apps.get_model("shuup_product_reviews", "ProductFamilyReviewAggregation").objects.all().delete()
+    apps.get_model("shuup_product_reviews", "ProductReviewAggregation").objects.all().delete()
+
+
+def rebuild_shop_aggregations(apps, schema_editor):
+    ProductReview = apps.get_model("shuup_product_reviews", "ProductReview")
+    ProductReviewAggregation = apps.get_model("shuup_product_reviews", "ProductReviewAggregation")
+    ProductFamilyReviewAggregation = apps.get_model("shuup_product_reviews", "ProductFamilyReviewAggregation")
+
+    aggregates = dict(
+        review_count=Count("pk"),
+        rating_sum=Sum("rating"),
+        would_recommend=_count_when(would_recommend=True),
+        **dict((field, _count_when(rating=stars)) for (stars, field) in enumerate(RATING_COUNT_FIELDS, 1))
+    )
+    products = ProductReview.objects.filter(status=APPROVED).order_by().values(
+        "shop_id", "product_id"
+    ).annotate(**aggregates)
+    ProductReviewAggregation.objects.bulk_create([
+        ProductReviewAggregation(rating=_get_rating(row), **row) for row in products
+    ], batch_size=500)
+
+    families = ProductReviewAggregation.objects.annotate(
+        family_id=Coalesce("product__variation_parent_id", "product_id")
+    ).order_by().values("shop_id", "family_id").annotate(**dict((field, Sum(field)) for field in SUMMED_FIELDS))
+    ProductFamilyReviewAggregation.objects.bulk_create([
+        ProductFamilyReviewAggregation(
+            shop_id=row["shop_id"],
+            product_id=row["family_id"],
+            rating=_get_rating(row),
+            **dict((field, row[field]) for field in SUMMED_FIELDS)
+        )
+        for row in families
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shuup', '0057_remove_product_stock_behavior'),
+        ('shuup_product_reviews', '0005_rating_histogram'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_aggregations, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='productfamilyreviewaggregation',
+            name='shop',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_family_reviews_aggregations', to='shuup.Shop', verbose_name='shop'),
+        ),
+        migrations.AddField(
+            model_name='productreviewaggregation',
+            name='shop',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_reviews_aggregations', to='shuup.Shop', verbose_name='shop'),
+        ),
+        migrations.AddField(
+            model_name='reviewaggregationqueueitem',
+            name='shop',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shuup.Shop', verbose_name='shop'),
+        ),
+        migrations.AlterField(
+            model_name='productfamilyreviewaggregation',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_family_reviews_aggregation', to='shuup.Product', verbose_name='product'),
+        ),
+        migrations.AlterField(
+            model_name='productreviewaggregation',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_reviews_aggregation', to='shuup.Product', verbose_name='product'),
+        ),
+        migrations.RunPython(rebuild_shop_aggregations, migrations.RunPython.noop),
+    ]
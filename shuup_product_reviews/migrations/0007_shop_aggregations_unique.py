@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shuup_product_reviews', '0006_shop_aggregations'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='productfamilyreviewaggregation',
+            unique_together=set([('shop', 'product')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='productreviewaggregation',
+            unique_together=set([('shop', 'product')]),
+        ),
+    ]
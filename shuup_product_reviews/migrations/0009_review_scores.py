@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import ExpressionWrapper, F, FloatField, Sum, Value
+
+
+def _populate_scores(apps, aggregation_model_label):
+    ReviewScorePrior = apps.get_model("shuup_product_reviews", "ReviewScorePrior")
+    aggregation_model = apps.get_model(aggregation_model_label)
+    weight = getattr(settings, "PRODUCT_REVIEWS_SCORE_PRIOR_WEIGHT", 10)
+    shops = aggregation_model.objects.order_by().values("shop_id").annotate(
+        review_count=Sum("review_count"),
+        rating_sum=Sum("rating_sum")
+    )
+    for row in shops:
+        if not row["review_count"]:
+            continue
+        prior = (Decimal(row["rating_sum"]) / row["review_count"]).quantize(Decimal("0.01"))
+        ReviewScorePrior.objects.create(shop_id=row["shop_id"], aggregation_model=aggregation_model_label, rating=prior)
+        aggregation_model.objects.filter(shop_id=row["shop_id"]).update(score=ExpressionWrapper(
+            (Value(float(weight * prior)) + F("rating_sum")) / (Value(float(weight)) + F("review_count")),
+            output_field=FloatField()
+        ))
+
+
+def populate_scores(apps, schema_editor):
+    _populate_scores(apps, "shuup_product_reviews.ProductReviewAggregation")
+    _populate_scores(apps, "shuup_product_reviews.ProductFamilyReviewAggregation")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shuup', '0057_remove_product_stock_behavior'),
+        ('shuup_product_reviews', '0008_daily_aggregation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewScorePrior',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('aggregation_model', models.CharField(max_length=100, verbose_name='aggregation model')),
+                ('rating', models.DecimalField(decimal_places=2, max_digits=3, verbose_name='rating')),
+                ('modified_on', models.DateTimeField(auto_now=True)),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shuup.Shop', verbose_name='shop')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='productfamilyreviewaggregation',
+            name='score',
+            field=models.DecimalField(decimal_places=4, default=0, help_text='The Bayesian average of the ratings used to rank the reviewed objects.', max_digits=5, verbose_name='score'),
+        ),
+        migrations.AddField(
+            model_name='productreviewaggregation',
+            name='score',
+            field=models.DecimalField(decimal_places=4, default=0, help_text='The Bayesian average of the ratings used to rank the reviewed objects.', max_digits=5, verbose_name='score'),
+        ),
+        migrations.AlterIndexTogether(
+            name='productfamilyreviewaggregation',
+            index_together=set([('shop', 'score')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='productreviewaggregation',
+            index_together=set([('shop', 'score')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='reviewscoreprior',
+            unique_together=set([('shop', 'aggregation_model')]),
+        ),
+        migrations.RunPython(populate_scores, migrations.RunPython.noop),
+    ]
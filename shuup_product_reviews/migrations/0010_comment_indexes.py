@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shuup_product_reviews', '0009_review_scores'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='productreview',
+            index_together=set([
+                ('product', 'shop', 'status', 'created_on', 'id'),
+                ('product', 'shop', 'status', 'rating', 'created_on', 'id')
+            ]),
+        ),
+    ]
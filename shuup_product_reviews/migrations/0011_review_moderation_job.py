@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import enumfields.fields
+import shuup_product_reviews.enums
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shuup', '0057_remove_product_stock_behavior'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('shuup_product_reviews', '0010_comment_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewModerationJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('review_model', models.CharField(max_length=100, verbose_name='review model')),
+                ('review_status', enumfields.fields.EnumIntegerField(enum=shuup_product_reviews.enums.ReviewStatus, verbose_name='review status')),
+                ('status', enumfields.fields.EnumIntegerField(db_index=True, default=1, enum=shuup_product_reviews.enums.ModerationJobStatus, verbose_name='status')),
+                ('max_review_id', models.PositiveIntegerField(verbose_name='max review id')),
+                ('last_review_id', models.PositiveIntegerField(default=0, verbose_name='last processed review id')),
+                ('review_count', models.PositiveIntegerField(default=0, verbose_name='review count')),
+                ('processed_count', models.PositiveIntegerField(default=0, verbose_name='processed review count')),
+                ('changed_count', models.PositiveIntegerField(default=0, verbose_name='changed review count')),
+                ('error', models.TextField(blank=True, verbose_name='error')),
+                ('created_on', models.DateTimeField(auto_now_add=True, verbose_name='created on')),
+                ('modified_on', models.DateTimeField(auto_now=True, verbose_name='modified on')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='created by')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shuup.Shop', verbose_name='shop')),
+            ],
+            options={
+                'verbose_name': 'review moderation job',
+                'verbose_name_plural': 'review moderation jobs',
+            },
+        ),
+    ]
@@ -5,13 +5,25 @@
 #
 # This source code is licensed under the OSL-3.0 license found in the
 # LICENSE file in the root directory of this source tree.
+from collections import OrderedDict
+
+from django.conf import settings
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
-from django.db.models import Avg, Case, Count, QuerySet, Sum, Value, When
+from django.db.models import Q, QuerySet
+from django.db.models.functions import Coalesce
 from django.utils.translation import ugettext_lazy as _
 from enumfields import EnumIntegerField
 
-from .enums import ReviewStatus
+from shuup.core.models import Product, Shop
+
+from .aggregation import (
+    AggregatedReviewMixin, AggregationSync, apply_aggregation_delta,
+    get_aggregation_differences, get_aggregation_sums, get_aggregation_values,
+    replace_aggregations
+)
+from .enums import ModerationJobStatus, ReviewStatus
+from .scores import get_aggregation_score
 
 
 class ProductReviewQuerySet(QuerySet):
@@ -22,7 +34,7 @@ class ProductReviewQuerySet(QuerySet):
         return self.filter(status=ReviewStatus.APPROVED)
 
 
-class ProductReview(models.Model):
+class ProductReview(AggregatedReviewMixin, models.Model):
     shop = models.ForeignKey("shuup.Shop", verbose_name=_("shop"), related_name="product_reviews")
     product = models.ForeignKey("shuup.Product", verbose_name=_("product"), related_name="product_reviews")
     reviewer = models.ForeignKey("shuup.Contact", verbose_name=_("reviewer"), related_name="product_reviews")
@@ -43,69 +55,296 @@ class ProductReview(models.Model):
 
     objects = ProductReviewQuerySet.as_manager()
 
+    class Meta:
+        # the comments of the reviewed object in every sort order and rating, see `COMMENT_SORTS`
+        index_together = [
+            ("product", "shop", "status", "created_on", "id"),
+            ("product", "shop", "status", "rating", "created_on", "id"),
+        ]
+
+    aggregation_field = "product"
+    aggregation_model = "shuup_product_reviews.ProductReviewAggregation"
+    daily_aggregation_model = "shuup_product_reviews.ProductReviewDailyAggregation"
+
     def __str__(self):
         return _("Review for {product} by {reviewer_name}").format(
             product=self.product,
             reviewer_name=self.reviewer.name
         )
 
-    def save(self, *args, **kwargs):
-        super(ProductReview, self).save(*args, **kwargs)
-        recalculate_aggregation(self.product)
+    @classmethod
+    def bump_aggregation_caches(cls, keys):
         from shuup_product_reviews.utils import bump_star_rating_cache
-        bump_star_rating_cache(self.product.pk)
+        family_keys = get_family_keys(keys)
+        # the products and their variation families, each bumped once
+        bumped_keys = OrderedDict()
+        for key in keys:
+            bumped_keys[key] = None
+            bumped_keys[family_keys[key]] = None
+        for (shop_id, product_id) in bumped_keys:
+            bump_star_rating_cache(product_id, shop_id)
+
+    @classmethod
+    def warm_aggregation_cache(cls, key):
+        from shuup_product_reviews.utils import warm_star_rating_caches
+        (shop_id, product_id) = key
+        family_id = get_variation_family_ids([product_id]).get(product_id, product_id)
+        warm_star_rating_caches(set([product_id, family_id]), Shop.objects.get(pk=shop_id))
+
+    @classmethod
+    def get_aggregation_syncs(cls):
+        return super(ProductReview, cls).get_aggregation_syncs() + [FamilyAggregationSync()]
+
+    @classmethod
+    def apply_aggregation_delta_for_key(cls, key, delta):
+        if not super(ProductReview, cls).apply_aggregation_delta_for_key(key, delta):
+            return False
+
+        (shop_id, family_id) = get_family_keys([key])[key]
+        if not apply_aggregation_delta(
+            ProductFamilyReviewAggregation, dict(shop_id=shop_id, product_id=family_id), delta
+        ):
+            recalculate_family_aggregation(shop_id, family_id)
+        return True
+
+    @classmethod
+    def aggregations_recalculated(cls, keys):
+        for (shop_id, family_id) in set(get_family_keys(keys).values()):
+            recalculate_family_aggregation(shop_id, family_id)
 
     def approve(self):
         self.status = ReviewStatus.APPROVED
         self.save()
+        self.warm_aggregation_cache_on_commit()
 
     def reject(self):
         self.status = ReviewStatus.REJECTED
         self.save()
+        self.warm_aggregation_cache_on_commit()
+
+
+class BaseReviewAggregation(models.Model):
+    rating = models.DecimalField(max_digits=2, decimal_places=1, verbose_name=_("rating"), default=0)
+    rating_sum = models.PositiveIntegerField(verbose_name=_("rating sum"), default=0)
+    review_count = models.PositiveIntegerField(verbose_name=_("review count"), default=0)
+    would_recommend = models.PositiveIntegerField(verbose_name=_("users would recommend"), default=0)
+    rating_1_count = models.PositiveIntegerField(verbose_name=_("1 star reviews"), default=0)
+    rating_2_count = models.PositiveIntegerField(verbose_name=_("2 star reviews"), default=0)
+    rating_3_count = models.PositiveIntegerField(verbose_name=_("3 star reviews"), default=0)
+    rating_4_count = models.PositiveIntegerField(verbose_name=_("4 star reviews"), default=0)
+    rating_5_count = models.PositiveIntegerField(verbose_name=_("5 star reviews"), default=0)
+    score = models.DecimalField(
+        max_digits=5, decimal_places=4, verbose_name=_("score"), default=0,
+        help_text=_("The Bayesian average of the ratings used to rank the reviewed objects.")
+    )
+
+    class Meta:
+        abstract = True
 
+    def get_rating_counts(self):
+        """
+        Returns the number of reviews for each star rating, from 1 to 5 stars
+        """
+        return [getattr(self, "rating_%d_count" % stars) for stars in range(1, 6)]
 
-class ProductReviewAggregation(models.Model):
-    product = models.OneToOneField(
+
+class ProductReviewAggregation(BaseReviewAggregation):
+    shop = models.ForeignKey("shuup.Shop", verbose_name=_("shop"), related_name="product_reviews_aggregations")
+    product = models.ForeignKey(
         "shuup.Product",
         verbose_name=_("product"),
         related_name="product_reviews_aggregation",
     )
-    rating = models.DecimalField(max_digits=2, decimal_places=1, verbose_name=_("rating"), default=0)
+
+    class Meta:
+        unique_together = ("shop", "product")
+        index_together = ("shop", "score")
+
+
+class ProductFamilyReviewAggregation(BaseReviewAggregation):
+    """
+    Aggregation of the reviews of a product and all its variation children
+    """
+    shop = models.ForeignKey("shuup.Shop", verbose_name=_("shop"), related_name="product_family_reviews_aggregations")
+    product = models.ForeignKey(
+        "shuup.Product",
+        verbose_name=_("product"),
+        related_name="product_family_reviews_aggregation",
+    )
+
+    class Meta:
+        unique_together = ("shop", "product")
+        index_together = ("shop", "score")
+
+
+class BaseDailyReviewAggregation(models.Model):
+    """
+    Aggregation of the reviews created on a given day
+    """
+    date = models.DateField(verbose_name=_("date"))
     review_count = models.PositiveIntegerField(verbose_name=_("review count"), default=0)
+    rating_sum = models.PositiveIntegerField(verbose_name=_("rating sum"), default=0)
     would_recommend = models.PositiveIntegerField(verbose_name=_("users would recommend"), default=0)
 
+    class Meta:
+        abstract = True
 
-def recalculate_aggregation_for_queryset(queryset):
-    if not queryset.exists():
-        # Make sure there is no aggregation since there is no approved reviews
-        return
 
-    return queryset.aggregate(
-        count=Count("pk"),
-        rating=Avg("rating"),
-        would_recommend=Sum(
-            Case(
-                When(would_recommend=True, then=Value(1)),
-                When(would_recommend=False, then=Value(0)),
-                default=Value(0),
-                output_field=models.PositiveIntegerField()
-            )
-        )
+class ProductReviewDailyAggregation(BaseDailyReviewAggregation):
+    shop = models.ForeignKey("shuup.Shop", verbose_name=_("shop"), related_name="product_reviews_daily_aggregations")
+    product = models.ForeignKey(
+        "shuup.Product",
+        verbose_name=_("product"),
+        related_name="product_reviews_daily_aggregations",
     )
 
+    class Meta:
+        unique_together = ("shop", "product", "date")
+
+
+class ReviewScorePrior(models.Model):
+    """
+    The average rating of the aggregations of a shop the stored scores were calculated with
+    """
+    shop = models.ForeignKey("shuup.Shop", verbose_name=_("shop"), related_name="+")
+    aggregation_model = models.CharField(max_length=100, verbose_name=_("aggregation model"))
+    rating = models.DecimalField(max_digits=3, decimal_places=2, verbose_name=_("rating"))
+    modified_on = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("shop", "aggregation_model")
+
+
+class ReviewAggregationQueueItem(models.Model):
+    review_model = models.CharField(max_length=100, verbose_name=_("review model"))
+    shop = models.ForeignKey("shuup.Shop", verbose_name=_("shop"), related_name="+", null=True)
+    object_id = models.PositiveIntegerField(verbose_name=_("object id"))
+    created_on = models.DateTimeField(auto_now_add=True)
+
+
+class ReviewModerationJob(models.Model):
+    """
+    The moderation of many reviews of a shop processed in chunks
+    in the background, see `shuup_product_reviews.moderation`
+    """
+    review_model = models.CharField(max_length=100, verbose_name=_("review model"))
+    shop = models.ForeignKey("shuup.Shop", verbose_name=_("shop"), related_name="+")
+    review_status = EnumIntegerField(ReviewStatus, verbose_name=_("review status"))
+    status = EnumIntegerField(
+        ModerationJobStatus, db_index=True, default=ModerationJobStatus.PENDING, verbose_name=_("status")
+    )
+    # the reviews created after the job are not moderated
+    max_review_id = models.PositiveIntegerField(verbose_name=_("max review id"))
+    last_review_id = models.PositiveIntegerField(default=0, verbose_name=_("last processed review id"))
+    review_count = models.PositiveIntegerField(default=0, verbose_name=_("review count"))
+    processed_count = models.PositiveIntegerField(default=0, verbose_name=_("processed review count"))
+    changed_count = models.PositiveIntegerField(default=0, verbose_name=_("changed review count"))
+    error = models.TextField(blank=True, verbose_name=_("error"))
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, verbose_name=_("created by"), related_name="+",
+        null=True, blank=True, on_delete=models.SET_NULL
+    )
+    created_on = models.DateTimeField(auto_now_add=True, verbose_name=_("created on"))
+    modified_on = models.DateTimeField(auto_now=True, verbose_name=_("modified on"))
+
+    class Meta:
+        verbose_name = _("review moderation job")
+        verbose_name_plural = _("review moderation jobs")
+
 
 def recalculate_aggregation(product):
-    reviews_agg = recalculate_aggregation_for_queryset(
-        ProductReview.objects.filter(product=product, status=ReviewStatus.APPROVED)
+    ProductReview.recalculate_aggregations_for_object(product.pk)
+
+
+def get_variation_family_ids(product_ids):
+    """
+    Returns a dict of the given product ids and the ids of their variation families,
+    which is the id of the variation parent, or the product id itself
+    """
+    return dict(
+        (product_id, variation_parent_id or product_id)
+        for (product_id, variation_parent_id)
+        in Product.objects.filter(pk__in=product_ids).values_list("pk", "variation_parent_id")
+    )
+
+
+def get_family_keys(keys):
+    """
+    Returns a dict of the given `(shop_id, product_id)` aggregation keys
+    and the keys of their variation families in the same shop
+    """
+    family_ids = get_variation_family_ids([product_id for (shop_id, product_id) in keys])
+    return dict(
+        ((shop_id, product_id), (shop_id, family_ids.get(product_id, product_id)))
+        for (shop_id, product_id) in keys
     )
-    if not reviews_agg:
-        aggregation = ProductReviewAggregation.objects.filter(product=product).first()
-        if aggregation:
-            aggregation.delete()
+
+
+def recalculate_family_aggregation(shop_id, product_id):
+    """
+    Recalculate the family aggregation of the given variation parent
+    or standalone product in the shop from the aggregations of its members
+    """
+    family_agg = ProductReviewAggregation.objects.filter(
+        Q(product_id=product_id) | Q(product__variation_parent_id=product_id),
+        shop_id=shop_id
+    ).aggregate(**get_aggregation_sums())
+    if not family_agg["review_count"]:
+        ProductFamilyReviewAggregation.objects.filter(shop_id=shop_id, product_id=product_id).delete()
         return
 
-    ProductReviewAggregation.objects.update_or_create(product=product, defaults=dict(
-        review_count=reviews_agg["count"],
-        rating=reviews_agg["rating"],
-        would_recommend=reviews_agg["would_recommend"]
-    ))
+    values = get_aggregation_values(family_agg)
+    score = get_aggregation_score(ProductFamilyReviewAggregation, shop_id, values)
+    ProductFamilyReviewAggregation.objects.update_or_create(
+        shop_id=shop_id,
+        product_id=product_id,
+        defaults=dict(values._asdict(), score=score)
+    )
+
+
+class FamilyAggregationSync(AggregationSync):
+    """
+    Set-based comparison and repair of the family aggregations
+    against the product aggregations of the family members
+    """
+
+    def __init__(self):
+        self.review_model = ProductReview
+        self.aggregation_model = ProductFamilyReviewAggregation
+        self.attname = "product_id"
+
+    def get_querysets(self, shop=None):
+        members = ProductReviewAggregation.objects.annotate(
+            family_id=Coalesce("product__variation_parent_id", "product_id")
+        )
+        families = ProductFamilyReviewAggregation.objects.all()
+        if shop:
+            members = members.filter(shop=shop)
+            families = families.filter(shop=shop)
+        return (members, families)
+
+    def get_key_bounds(self, shop=None):
+        (members, families) = self.get_querysets(shop)
+        members_bounds = members.aggregate(low=models.Min("family_id"), high=models.Max("family_id"))
+        families_bounds = families.aggregate(low=models.Min("product_id"), high=models.Max("product_id"))
+        lows = [bound["low"] for bound in (members_bounds, families_bounds) if bound["low"] is not None]
+        highs = [bound["high"] for bound in (members_bounds, families_bounds) if bound["high"] is not None]
+        return (min(lows) if lows else None, max(highs) if highs else None)
+
+    def get_differences(self, key_from, key_to, shop=None):
+        (members, families) = self.get_querysets(shop)
+        members_agg = members.filter(family_id__gte=key_from, family_id__lt=key_to).order_by().values(
+            "shop_id", "family_id"
+        ).annotate(**get_aggregation_sums())
+        computed = dict(((row["shop_id"], row["family_id"]), get_aggregation_values(row)) for row in members_agg)
+        stored = self.get_stored(families.filter(**self.get_key_range(key_from, key_to)))
+        return get_aggregation_differences(computed, stored)
+
+    def write(self, aggregation_values):
+        if not aggregation_values:
+            return
+
+        replace_aggregations(self.aggregation_model, self.attname, aggregation_values)
+        from shuup_product_reviews.utils import bump_star_rating_cache
+        for (shop_id, product_id) in aggregation_values:
+            bump_star_rating_cache(product_id, shop_id)
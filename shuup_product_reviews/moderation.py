@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup Product Reviews Addon.
+#
+# Copyright (c) 2012-2019, Shoop Commerce Ltd. All rights reserved.
+#
+# This source code is licensed under the OSL-3.0 license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Background moderation of many reviews.
+
+Approving or rejecting more reviews than ``PRODUCT_REVIEWS_MODERATION_JOB_THRESHOLD``
+at once creates a `ReviewModerationJob` instead of moderating the reviews inside
+the request. The ``process_review_moderation_jobs`` management command, e.g.
+run every minute by cron, processes the jobs in chunks of ascending review ids.
+
+Every chunk is moderated with `AggregatedReviewMixin.bulk_update_status` and
+committed together with the progress of the job, so a job interrupted by a
+crash is resumed from its last committed chunk. A chunk is only applied when
+the progress of the job is still the one the chunk was read with, so jobs
+can be processed by many commands at once.
+"""
+import traceback
+
+from django.apps import apps
+from django.db.models import F, Max
+from django.db.transaction import atomic
+from django.utils import timezone
+
+from shuup_product_reviews.enums import ModerationJobStatus
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+def create_moderation_job(review_model, shop, review_status, user=None):
+    """
+    Create a job to set the status of all the current reviews of the shop
+
+    :param review_model: the model of the reviews, a subclass of `AggregatedReviewMixin`
+    """
+    from shuup_product_reviews.models import ReviewModerationJob
+    reviews = review_model.objects.filter(shop=shop)
+    return ReviewModerationJob.objects.create(
+        review_model=review_model._meta.label,
+        shop=shop,
+        review_status=review_status,
+        max_review_id=(reviews.aggregate(max_id=Max("pk"))["max_id"] or 0),
+        review_count=reviews.count(),
+        created_by=(user if user and user.is_authenticated() else None)
+    )
+
+
+def get_job_reviews(job):
+    return apps.get_model(job.review_model).objects.filter(
+        shop_id=job.shop_id, pk__gt=job.last_review_id, pk__lte=job.max_review_id
+    )
+
+
+def process_moderation_chunk(job, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Moderate the next chunk of reviews of the job
+
+    :return: whether the job has more reviews to moderate
+    :rtype: bool
+    """
+    from shuup_product_reviews.models import ReviewModerationJob
+    pks = list(get_job_reviews(job).order_by("pk").values_list("pk", flat=True)[:chunk_size])
+    progress = ReviewModerationJob.objects.filter(pk=job.pk, last_review_id=job.last_review_id)
+
+    with atomic():
+        if not pks:
+            progress.update(status=ModerationJobStatus.COMPLETED, modified_on=timezone.now())
+        elif progress.update(
+            status=ModerationJobStatus.RUNNING,
+            last_review_id=pks[-1],
+            processed_count=F("processed_count") + len(pks),
+            modified_on=timezone.now()
+        ):
+            review_model = apps.get_model(job.review_model)
+            changed = review_model.bulk_update_status(review_model.objects.filter(pk__in=pks), job.review_status)
+            ReviewModerationJob.objects.filter(pk=job.pk).update(changed_count=F("changed_count") + changed)
+
+    # the chunk may have been processed by another command
+    job.refresh_from_db()
+    return (job.status != ModerationJobStatus.COMPLETED)
+
+
+def process_moderation_job(job, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Moderate the reviews of the job chunk by chunk, marking the job failed if a chunk fails
+    """
+    try:
+        while process_moderation_chunk(job, chunk_size):
+            pass
+    except Exception:
+        job.status = ModerationJobStatus.FAILED
+        job.error = traceback.format_exc()
+        job.save(update_fields=["status", "error", "modified_on"])
+        raise
+
+
+def get_unfinished_moderation_jobs(retry_failed=False):
+    """
+    Returns the jobs to process, oldest first, including the ones interrupted while running
+    """
+    from shuup_product_reviews.models import ReviewModerationJob
+    statuses = [ModerationJobStatus.PENDING, ModerationJobStatus.RUNNING]
+    if retry_failed:
+        statuses.append(ModerationJobStatus.FAILED)
+    return ReviewModerationJob.objects.filter(status__in=statuses).order_by("pk")
@@ -7,16 +7,18 @@
 # LICENSE file in the root directory of this source tree.
 from __future__ import unicode_literals
 
+import json
+
 from django import forms
 from django.utils.translation import ugettext_lazy as _
 
 from shuup.xtheme import TemplatedPlugin
 from shuup.xtheme.plugins.forms import TranslatableField
-from shuup_product_reviews.models import ProductReview
 from shuup_product_reviews.utils import (
-    get_reviews_aggregation_for_product, get_stars_from_rating,
-    is_product_valid_mode
+    get_cached_reviews_aggregation_for_product, get_rating_histogram,
+    get_stars_from_rating, has_product_review_comments, is_product_valid_mode
 )
+from shuup_product_reviews.views import ProductReviewCommentsView
 
 
 class ProductReviewStarRatingsPlugin(TemplatedPlugin):
@@ -36,6 +38,12 @@ class ProductReviewStarRatingsPlugin(TemplatedPlugin):
             required=False,
             initial=False,
             help_text=_("Whether to show number of customers that recommend the product.")
+        )),
+        ("show_rating_histogram", forms.BooleanField(
+            label=_("Show rating histogram"),
+            required=False,
+            initial=False,
+            help_text=_("Whether to show the number of reviews for each star rating.")
         ))
     ]
 
@@ -44,7 +52,7 @@ class ProductReviewStarRatingsPlugin(TemplatedPlugin):
         product = context["shop_product"].product
 
         if product and is_product_valid_mode(product):
-            product_rating = get_reviews_aggregation_for_product(product)
+            product_rating = get_cached_reviews_aggregation_for_product(product, context["request"].shop)
 
             if product_rating["reviews"]:
                 rating = product_rating["rating"]
@@ -58,7 +66,9 @@ class ProductReviewStarRatingsPlugin(TemplatedPlugin):
                     "rating": rating,
                     "would_recommend": product_rating["would_recommend"],
                     "would_recommend_perc": product_rating["would_recommend"] / reviews,
+                    "rating_histogram": get_rating_histogram(product_rating["rating_counts"], reviews),
                     "show_recommenders": self.config.get("show_recommenders", False),
+                    "show_rating_histogram": self.config.get("show_rating_histogram", False),
                     "customer_ratings_title": self.get_translated_value("customer_ratings_title")
                 })
 
@@ -87,6 +97,15 @@ class ProductReviewCommentsPlugin(TemplatedPlugin):
             required=False,
             initial=_("Load more comments")
         )),
+        ("embed_first_page", forms.BooleanField(
+            label=_("Render the first page of reviews with the page"),
+            required=False,
+            initial=False,
+            help_text=_(
+                "Whether to include the first page of reviews in the page instead of loading "
+                "it after the page has loaded. The next pages are always loaded on demand."
+            )
+        )),
     ]
 
     def get_context_data(self, context):
@@ -94,13 +113,15 @@ class ProductReviewCommentsPlugin(TemplatedPlugin):
         product = context["shop_product"].product
 
         if product and is_product_valid_mode(product):
-            product_ids = [product.pk] + list(product.variation_children.values_list("pk", flat=True))
-            reviews = ProductReview.objects.approved().filter(
-                shop=context["request"].shop,
-                product_id__in=product_ids,
-                comment__isnull=False
-            )
-            if reviews.exists():
+            if self.config.get("embed_first_page", False):
+                # the first page tells whether there are any reviews with comments
+                first_page = ProductReviewCommentsView.get_first_page_payload(context["request"], product.pk)
+                has_comments = bool(first_page["reviews"])
+                context["first_page"] = json.dumps(first_page)
+            else:
+                has_comments = has_product_review_comments(product, context["request"].shop)
+
+            if has_comments:
                 context["review_product"] = product
                 context["title"] = self.get_translated_value("title")
                 context["no_reviews_text"] = self.get_translated_value("no_reviews_text")
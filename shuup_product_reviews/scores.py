@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup Product Reviews Addon.
+#
+# Copyright (c) 2012-2019, Shoop Commerce Ltd. All rights reserved.
+#
+# This source code is licensed under the OSL-3.0 license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Ranking scores of the review aggregations.
+
+The score of an aggregation is the Bayesian average of its ratings: the
+ratings plus ``PRODUCT_REVIEWS_SCORE_PRIOR_WEIGHT`` virtual reviews rated
+with the average rating of all the aggregations of the shop, the prior.
+An object with a few reviews is ranked close to the shop average while an
+object with many reviews is ranked by its own rating.
+
+The score is stored with every aggregation write using the prior stored
+in `ReviewScorePrior`. The ``update_review_scores`` command recalculates
+the priors and updates all the scores of the shops whose prior has shifted.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.apps import apps
+from django.conf import settings
+from django.db.models import (
+    DecimalField, ExpressionWrapper, F, Func, Sum, Value
+)
+
+SCORE_PRECISION = Decimal("0.0001")
+PRIOR_PRECISION = Decimal("0.01")
+
+#: The prior used until the shop has any aggregations
+DEFAULT_SCORE_PRIOR = Decimal("3.00")
+
+
+def get_score_prior_weight():
+    return settings.PRODUCT_REVIEWS_SCORE_PRIOR_WEIGHT
+
+
+def get_score(rating_sum, review_count, prior):
+    weight = get_score_prior_weight()
+    # rounded half up like the SQL ``ROUND`` of `update_scores`
+    return ((weight * prior + rating_sum) / (weight + review_count)).quantize(SCORE_PRECISION, ROUND_HALF_UP)
+
+
+def get_scored_aggregation_models():
+    from shuup_product_reviews.models import BaseReviewAggregation
+    return [model for model in apps.get_models() if issubclass(model, BaseReviewAggregation)]
+
+
+def calculate_score_prior(aggregation_model, shop_id):
+    """
+    Returns the average rating of all the aggregations of the shop, or `None` if there are none
+    """
+    totals = aggregation_model.objects.filter(shop_id=shop_id).aggregate(
+        review_count=Sum("review_count"),
+        rating_sum=Sum("rating_sum")
+    )
+    if not totals["review_count"]:
+        return None
+    return (Decimal(totals["rating_sum"]) / totals["review_count"]).quantize(PRIOR_PRECISION)
+
+
+def get_score_prior(aggregation_model, shop_id):
+    """
+    Returns the stored prior of the aggregations of the shop,
+    calculating it the first time the shop has aggregations
+    """
+    from shuup_product_reviews.models import ReviewScorePrior
+    label = aggregation_model._meta.label
+    prior = ReviewScorePrior.objects.filter(shop_id=shop_id, aggregation_model=label).values_list(
+        "rating", flat=True
+    ).first()
+    if prior is not None:
+        return prior
+
+    prior = calculate_score_prior(aggregation_model, shop_id)
+    if prior is None:
+        return DEFAULT_SCORE_PRIOR
+
+    ReviewScorePrior.objects.update_or_create(shop_id=shop_id, aggregation_model=label, defaults=dict(rating=prior))
+    return prior
+
+
+def get_aggregation_score(aggregation_model, shop_id, values):
+    """
+    Returns the score of the given aggregation values in the shop
+    """
+    return get_score(values.rating_sum, values.review_count, get_score_prior(aggregation_model, shop_id))
+
+
+def update_scores(aggregation_model, shop_id, force=False):
+    """
+    Recalculate the prior of the aggregations of the shop and, when it has
+    shifted, update the scores of all the aggregations of the shop at once.
+
+    :return: whether the scores were updated
+    :rtype: bool
+    """
+    from shuup_product_reviews.models import ReviewScorePrior
+    prior = calculate_score_prior(aggregation_model, shop_id)
+    if prior is None:
+        return False
+
+    label = aggregation_model._meta.label
+    stored_prior = ReviewScorePrior.objects.filter(shop_id=shop_id, aggregation_model=label).first()
+    if stored_prior and stored_prior.rating == prior and not force:
+        return False
+
+    ReviewScorePrior.objects.update_or_create(shop_id=shop_id, aggregation_model=label, defaults=dict(rating=prior))
+    weight = get_score_prior_weight()
+    score_field = aggregation_model._meta.get_field("score")
+    output_field = DecimalField(max_digits=score_field.max_digits, decimal_places=score_field.decimal_places)
+    score = ExpressionWrapper(
+        (Value(Decimal(weight) * prior) + F("rating_sum")) / (Value(Decimal(weight)) + F("review_count")),
+        output_field=output_field
+    )
+    # rounded in the database to the precision of `get_score`
+    aggregation_model.objects.filter(shop_id=shop_id).update(score=Func(
+        score, Value(score_field.decimal_places), function="ROUND", output_field=output_field
+    ))
+    return True
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup Product Reviews Addon.
+#
+# Copyright (c) 2012-2019, Shoop Commerce Ltd. All rights reserved.
+#
+# This source code is licensed under the OSL-3.0 license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Full-text search of the review comments.
+
+The reviews are searched with the backend of their database vendor, see
+``PRODUCT_REVIEWS_COMMENT_SEARCH_BACKENDS``:
+
+* `SQLiteCommentSearch` keeps the comments in an FTS5 table updated
+  whenever a review is saved or deleted
+* `PostgreSQLCommentSearch` reads a GIN index of the comment ``tsvector``
+  kept up to date by the database
+
+The reviews of the other databases, or of a SQLite without FTS5, are
+searched with `CommentSearch` which matches the words of the search one
+by one with ``icontains``.
+
+The indexes are created after ``migrate`` for every review model,
+which also indexes the comments of the existing reviews. The reviews
+of a database without the index, e.g. restored from a dump without it,
+are searched with `CommentSearch` until ``migrate`` creates it and the
+processes are restarted.
+
+Every word of the search must appear in the comment as a word or the
+prefix of one, so ``"fast deliv"`` finds the comment ``"Fast delivery!"``.
+"""
+import re
+import sqlite3
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.utils.encoding import force_text
+from django.utils.module_loading import import_string
+
+#: The maximum number of words of a search, the rest are ignored
+MAX_SEARCH_WORDS = 10
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def get_search_words(query):
+    return _WORD_RE.findall(force_text(query or ""))[:MAX_SEARCH_WORDS]
+
+
+class CommentSearch(object):
+    def is_available(self):
+        return True
+
+    def is_installed(self, model, connection):
+        """
+        Returns whether the index of the comments of the review model exists
+        """
+        return True
+
+    def install(self, model, connection):
+        """
+        Create the index of the comments of the review model, if it does not exist yet
+        """
+        pass
+
+    def update(self, review, connection):
+        """
+        Update the index with the current comment of the review
+        """
+        pass
+
+    def delete(self, review, connection):
+        """
+        Remove the comment of the review from the index
+        """
+        pass
+
+    def filter(self, queryset, words):
+        """
+        Returns the reviews of the queryset with all the words in the comment
+        """
+        for word in words:
+            queryset = queryset.filter(Q(comment__icontains=word))
+        return queryset
+
+
+class SQLiteCommentSearch(CommentSearch):
+    _available = None
+
+    def is_available(self):
+        # the FTS5 extension is optional in SQLite builds
+        if SQLiteCommentSearch._available is None:
+            try:
+                sqlite3.connect(":memory:").execute("CREATE VIRTUAL TABLE search_test USING fts5(comment)")
+                SQLiteCommentSearch._available = True
+            except sqlite3.OperationalError:
+                SQLiteCommentSearch._available = False
+        return SQLiteCommentSearch._available
+
+    #: Whether the table of each database alias and review model exists, checked once per process
+    _installed = {}
+
+    def get_table(self, model):
+        return "%s_comment_fts" % model._meta.db_table
+
+    def is_installed(self, model, connection):
+        key = (connection.alias, self.get_table(model))
+        if key not in SQLiteCommentSearch._installed:
+            SQLiteCommentSearch._installed[key] = (key[1] in connection.introspection.table_names())
+        return SQLiteCommentSearch._installed[key]
+
+    def install(self, model, connection):
+        table = self.get_table(model)
+        if table not in connection.introspection.table_names():
+            qn = connection.ops.quote_name
+            with connection.cursor() as cursor:
+                cursor.execute("CREATE VIRTUAL TABLE %s USING fts5(comment)" % qn(table))
+                cursor.execute("INSERT INTO %s(rowid, comment) SELECT %s, comment FROM %s WHERE comment <> ''" % (
+                    qn(table), qn(model._meta.pk.column), qn(model._meta.db_table)
+                ))
+        SQLiteCommentSearch._installed[(connection.alias, table)] = True
+
+    def update(self, review, connection):
+        table = connection.ops.quote_name(self.get_table(type(review)))
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM %s WHERE rowid = %%s" % table, [review.pk])
+            if review.comment:
+                cursor.execute("INSERT INTO %s(rowid, comment) VALUES (%%s, %%s)" % table, [review.pk, review.comment])
+
+    def delete(self, review, connection):
+        table = connection.ops.quote_name(self.get_table(type(review)))
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM %s WHERE rowid = %%s" % table, [review.pk])
+
+    def filter(self, queryset, words):
+        qn = connections[queryset.db].ops.quote_name
+        table = qn(self.get_table(queryset.model))
+        # every word is quoted to be searched as is and not as FTS5 query syntax
+        match = " ".join('"%s"*' % word for word in words)
+        return queryset.extra(
+            where=["%s.%s IN (SELECT rowid FROM %s WHERE %s MATCH %%s)" % (
+                qn(queryset.model._meta.db_table), qn(queryset.model._meta.pk.column), table, table
+            )],
+            params=[match]
+        )
+
+
+class PostgreSQLCommentSearch(CommentSearch):
+    #: The text search configuration of the comments, ``simple`` to not depend on their language
+    config = "simple"
+
+    def get_index(self, model):
+        return "%s_comment_search" % model._meta.db_table
+
+    def get_document(self, column):
+        return "to_tsvector('%s', COALESCE(%s, ''))" % (self.config, column)
+
+    def install(self, model, connection):
+        qn = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE INDEX IF NOT EXISTS %s ON %s USING GIN (%s)" % (
+                qn(self.get_index(model)), qn(model._meta.db_table), self.get_document(qn("comment"))
+            ))
+
+    def filter(self, queryset, words):
+        # the document expression must be the indexed one for the index to be used
+        qn = connections[queryset.db].ops.quote_name
+        document = self.get_document("%s.%s" % (qn(queryset.model._meta.db_table), qn("comment")))
+        tsquery = " & ".join("%s:*" % word for word in words)
+        return queryset.extra(where=["%s @@ to_tsquery('%s', %%s)" % (document, self.config)], params=[tsquery])
+
+
+def get_comment_search(connection):
+    """
+    Returns the comment search backend of the database connection
+    """
+    path = settings.PRODUCT_REVIEWS_COMMENT_SEARCH_BACKENDS.get(connection.vendor)
+    search = (import_string(path)() if path else None)
+    return (search if search and search.is_available() else CommentSearch())
+
+
+def get_installed_comment_search(model, connection):
+    """
+    Returns the comment search backend of the database connection if the
+    index of the review model exists, otherwise `CommentSearch`
+    """
+    search = get_comment_search(connection)
+    return (search if search.is_installed(model, connection) else CommentSearch())
+
+
+def search_comments(queryset, query):
+    """
+    Returns the reviews of the queryset with comments matching the search query
+    """
+    words = get_search_words(query)
+    if not words:
+        return queryset
+    return get_installed_comment_search(queryset.model, connections[queryset.db]).filter(queryset, words)
+
+
+def install_comment_search(model, using):
+    connection = connections[using]
+    get_comment_search(connection).install(model, connection)
+
+
+def update_comment_search(review, using):
+    connection = connections[using]
+    get_installed_comment_search(type(review), connection).update(review, connection)
+
+
+def delete_comment_search(review, using):
+    connection = connections[using]
+    get_installed_comment_search(type(review), connection).delete(review, connection)
@@ -8,3 +8,61 @@
 
 #: The number of reviews to load on each page
 PRODUCT_REVIEWS_PAGE_SIZE = 5
+
+#: The Cache-Control directives of the product review comments responses,
+#: as keyword arguments of `django.utils.cache.patch_cache_control`.
+#: The responses have an ETag and Last-Modified bumped with every review change
+#: so by default the browsers and proxies revalidate them on every request.
+PRODUCT_REVIEWS_COMMENTS_CACHE_CONTROL = {"public": True, "max_age": 0}
+
+#: The full-text search backends of the review comments by database vendor,
+#: the comments in other databases are searched with ``icontains``,
+#: see `shuup_product_reviews.search`
+PRODUCT_REVIEWS_COMMENT_SEARCH_BACKENDS = {
+    "sqlite": "shuup_product_reviews.search.SQLiteCommentSearch",
+    "postgresql": "shuup_product_reviews.search.PostgreSQLCommentSearch",
+}
+
+#: Seconds to cache the rendered star ratings
+PRODUCT_REVIEWS_CACHE_DURATION = 60 * 30
+
+#: Seconds a request rendering a star rating locks it, other requests
+#: wait up to this long for it to be cached before rendering it themselves
+PRODUCT_REVIEWS_CACHE_LOCK_TIMEOUT = 2
+
+#: Whether to render and cache the star ratings of the product/vendor
+#: right after its review is approved or rejected, instead of leaving
+#: the rendering to the next visitor after invalidating the cache.
+#:
+#: The star ratings are rendered with the default options in the active
+#: language, see the ``warm_star_rating_caches`` management command.
+PRODUCT_REVIEWS_WARM_CACHE_ON_MODERATION = False
+
+#: The maximum number of star ratings and review totals each process keeps
+#: in memory in front of the shared cache, 0 disables the in-process cache
+PRODUCT_REVIEWS_LOCAL_CACHE_SIZE = 0
+
+#: Seconds a process keeps a star rating in memory
+PRODUCT_REVIEWS_LOCAL_CACHE_DURATION = 5
+
+#: How the review aggregations and star rating caches are updated when a review changes
+#:
+#: * ``immediate``: inside the review ``save()``, so the code saving a review
+#:   reads the updated aggregations in the same transaction
+#: * ``commit``: once per product/vendor when the current transaction is committed,
+#:   the aggregations recalculated from scratch are stale until then
+#: * ``queue``: by the ``process_review_aggregation_queue`` management command,
+#:   the reviews only queue the product/vendor in the database
+#:
+#: This setting is shared by product and vendor reviews.
+PRODUCT_REVIEWS_AGGREGATION_MODE = "immediate"
+
+#: The number of virtual reviews rated with the shop average rating
+#: added to the reviews of every product/vendor when calculating
+#: the score used to rank them, see `shuup_product_reviews.scores`
+PRODUCT_REVIEWS_SCORE_PRIOR_WEIGHT = 10
+
+#: The number of reviews above which approving or rejecting all the reviews
+#: in the admin creates a background job instead of moderating them in the request,
+#: see the ``process_review_moderation_jobs`` management command
+PRODUCT_REVIEWS_MODERATION_JOB_THRESHOLD = 1000
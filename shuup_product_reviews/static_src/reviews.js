@@ -26,17 +26,26 @@ const ReviewComment = {
     }
 };
 
+const SORTS = ["newest", "highest", "lowest"];
+const RATINGS = [5, 4, 3, 2, 1];
+
 const ReviewComments = {
     oninit(vnode) {
         vnode.state.reviews = prop([]);
         vnode.state.loading = prop(true);
         vnode.state.nextPageUrl = prop(vnode.attrs.commentsUrl);
+        vnode.state.sort = prop(SORTS[0]);
+        vnode.state.rating = prop("");
+        vnode.state.requestId = 0;
 
         vnode.state.loadNextPage = () => {
             if (!vnode.state.nextPageUrl()) return;
             vnode.state.loading(true);
+            // responses of the pages requested before changing the sort or filter are ignored
+            const requestId = vnode.state.requestId;
 
             m.request(vnode.state.nextPageUrl()).then((data) => {
+                if (requestId !== vnode.state.requestId) return;
                 vnode.state.loading(false);
                 vnode.state.nextPageUrl(data.next_page_url);
                 vnode.state.reviews([
@@ -44,15 +53,55 @@ const ReviewComments = {
                     ...data.reviews
                 ]);
             }, (err) => {
-                console.err(err);
+                console.error(err);
                 vnode.state.loading(false);
             });
         };
-        vnode.state.loadNextPage();
+
+        vnode.state.reload = () => {
+            const params = { sort: vnode.state.sort() };
+            if (vnode.state.rating()) {
+                params.rating = vnode.state.rating();
+            }
+            vnode.state.requestId += 1;
+            vnode.state.reviews([]);
+            vnode.state.nextPageUrl(`${vnode.attrs.commentsUrl}?${m.buildQueryString(params)}`);
+            vnode.state.loadNextPage();
+        };
+
+        // the first page of the default order may be rendered with the page
+        const firstPage = vnode.attrs.firstPage;
+        if (firstPage) {
+            vnode.state.loading(false);
+            vnode.state.nextPageUrl(firstPage.next_page_url);
+            vnode.state.reviews(firstPage.reviews);
+        } else {
+            vnode.state.loadNextPage();
+        }
     },
     view(vnode) {
+        const sortTexts = vnode.attrs.sortTexts || {};
         return [
             vnode.attrs.title ? m("h3", vnode.attrs.title) : null,
+            m(".review-comments-filters",
+                m("select.form-control.review-comments-sort", {
+                    value: vnode.state.sort(),
+                    onchange(event) {
+                        vnode.state.sort(event.target.value);
+                        vnode.state.reload();
+                    }
+                }, SORTS.map((sort) => m("option", { value: sort }, sortTexts[sort] || sort))),
+                m("select.form-control.review-comments-rating", {
+                    value: vnode.state.rating(),
+                    onchange(event) {
+                        vnode.state.rating(event.target.value);
+                        vnode.state.reload();
+                    }
+                }, [
+                    m("option", { value: "" }, vnode.attrs.allRatingsText),
+                    ...RATINGS.map((rating) => m("option", { value: rating }, `${rating} \u2605`))
+                ])
+            ),
             (!vnode.state.loading() && !vnode.state.reviews().length) && (
                 m("p", vnode.attrs.noReviewsText)
             ),
@@ -26,9 +26,19 @@ import ReviewComments from "./reviews";
         const title = element.getAttribute("data-title");
         const noReviewsText = element.getAttribute("data-no-reviews-text");
         const loadMoreText = element.getAttribute("data-load-more-text");
+        const allRatingsText = element.getAttribute("data-all-ratings-text");
+        const firstPageData = element.getAttribute("data-first-page");
+        const firstPage = firstPageData ? JSON.parse(firstPageData) : null;
+        const sortTexts = {
+            newest: element.getAttribute("data-sort-newest-text"),
+            highest: element.getAttribute("data-sort-highest-text"),
+            lowest: element.getAttribute("data-sort-lowest-text")
+        };
         m.mount(element, {
             view() {
-                return m(ReviewComments, { title, commentsUrl, noReviewsText, loadMoreText });
+                return m(ReviewComments, {
+                    title, commentsUrl, noReviewsText, loadMoreText, allRatingsText, sortTexts, firstPage
+                });
             }
         });
     });
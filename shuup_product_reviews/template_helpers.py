@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup Product Reviews Addon.
+#
+# Copyright (c) 2012-2019, Shoop Commerce Ltd. All rights reserved.
+#
+# This source code is licensed under the OSL-3.0 license found in the
+# LICENSE file in the root directory of this source tree.
+from jinja2.utils import contextfunction
+from markupsafe import Markup
+
+from shuup_product_reviews.utils import render_product_review_ratings_many
+
+
+class ProductReviewsTemplateHelpers(object):
+    name = "product_reviews"
+
+    @contextfunction
+    def get_star_ratings(self, context, products, customer_ratings_title=None, show_recommenders=False, minified=True):
+        """
+        Returns a dict of the ids of the given products and their star ratings
+        in the current shop for listing templates, e.g.::
+
+            {% set star_ratings = shuup.product_reviews.get_star_ratings(products) %}
+            {% for product in products %}{{ star_ratings.get(product.pk, "") }}{% endfor %}
+        """
+        star_ratings = render_product_review_ratings_many(
+            products, customer_ratings_title, show_recommenders, minified, context["request"].shop
+        )
+        return dict((product_id, Markup(star_rating)) for (product_id, star_rating) in star_ratings.items())
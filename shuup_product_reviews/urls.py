@@ -9,10 +9,15 @@ from django.conf.urls import url
 from django.contrib.auth.decorators import login_required
 
 from shuup_product_reviews.views import (
-    ProductReviewCommentsView, ProductReviewsView
+    ProductReviewCommentsView, ProductReviewManyCommentsView,
+    ProductReviewsView
 )
 
 urlpatterns = [
     url(r"product_reviews/$", login_required(ProductReviewsView.as_view()), name="product_reviews"),
     url(r"product_reviews/(?P<pk>\d+)/comments/$", ProductReviewCommentsView.as_view(), name="product_review_comments"),
+    url(
+        r"product_reviews/comments/$", ProductReviewManyCommentsView.as_view(),
+        name="product_review_comments_many"
+    ),
 ]
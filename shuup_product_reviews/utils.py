@@ -7,12 +7,19 @@
 # LICENSE file in the root directory of this source tree.
 import math
 
-from django.db.models import Avg, Sum
+from django.db.models import Q
 
 from shuup import configuration
-from shuup.core import cache
 from shuup.core.models import get_person_contact, Order, Product, ProductMode
-from shuup_product_reviews.models import ProductReviewAggregation
+from shuup_product_reviews import caching
+from shuup_product_reviews.aggregation import (
+    get_aggregation_totals, get_aggregation_totals_by_object, get_empty_totals,
+    get_window_totals
+)
+from shuup_product_reviews.models import (
+    ProductFamilyReviewAggregation, ProductReview, ProductReviewAggregation,
+    ProductReviewDailyAggregation
+)
 
 ACCEPTED_PRODUCT_MODES = [
     ProductMode.NORMAL,
@@ -66,16 +73,53 @@ def is_product_valid_mode(product):
     return product.mode in ACCEPTED_PRODUCT_MODES
 
 
-def get_reviews_aggregation_for_product(product):
+def get_reviews_aggregation_for_product(product, shop=None):
     """
-    Calculate the reviews totals for a giving product
+    Returns the reviews totals for a giving product, including its variation children,
+    in the given shop or in all shops when no shop is given
     """
-    product_ids = [product.pk] + list(product.variation_children.values_list("pk", flat=True))
-    return ProductReviewAggregation.objects.filter(product_id__in=product_ids).aggregate(
-        rating=Avg("rating"),
-        reviews=Sum("review_count"),
-        would_recommend=Sum("would_recommend")
+    # variation children have no children of their own, other products have their family rolled up
+    aggregation_model = (ProductReviewAggregation if product.variation_parent_id else ProductFamilyReviewAggregation)
+    aggregations = aggregation_model.objects.filter(product_id=product.pk)
+    if shop:
+        aggregations = aggregations.filter(shop=shop)
+    return get_aggregation_totals(aggregations)
+
+
+def get_windowed_reviews_aggregation_for_product(product, days, shop=None):
+    """
+    Returns the reviews totals for a giving product, including its variation children,
+    of the reviews created in the last `days` days in the given shop or in all shops
+    """
+    daily_aggregations = ProductReviewDailyAggregation.objects.filter(
+        Q(product_id=product.pk) | Q(product__variation_parent_id=product.pk)
     )
+    if shop:
+        daily_aggregations = daily_aggregations.filter(shop=shop)
+    return get_window_totals(daily_aggregations, days)
+
+
+def get_top_rated_product_ids(shop, limit=10):
+    """
+    Returns the ids of the best ranked products of the shop, variation children
+    are ranked as part of their variation parent
+    """
+    return list(
+        ProductFamilyReviewAggregation.objects.filter(shop=shop).order_by("-score").values_list(
+            "product_id", flat=True
+        )[:limit]
+    )
+
+
+def get_rating_histogram(rating_counts, reviews):
+    """
+    Returns a list of (stars, count, percentage) tuples from 5 to 1 stars
+    where `rating_counts` holds the number of reviews for 1 to 5 stars
+    """
+    return [
+        (stars, count, (count / reviews if reviews else 0))
+        for (stars, count) in reversed(list(enumerate(rating_counts, 1)))
+    ]
 
 
 def get_stars_from_rating(rating):
@@ -88,48 +132,169 @@ def get_stars_from_rating(rating):
     return (full_stars, empty_stars, half_star)
 
 
-def render_product_review_ratings(product, customer_ratings_title=None, show_recommenders=False, minified=False):
+def get_reviews_aggregations_for_products(products, shop=None):
+    """
+    Returns a dict of the ids of the given products and their reviews totals,
+    see `get_reviews_aggregation_for_product`, with one query for
+    the variation children and one for the other products
     """
-    Render the star rating template for a given product and options.
+    totals = {}
+    for (aggregation_model, product_ids) in [
+        (ProductReviewAggregation, [product.pk for product in products if product.variation_parent_id]),
+        (ProductFamilyReviewAggregation, [product.pk for product in products if not product.variation_parent_id])
+    ]:
+        if not product_ids:
+            continue
+        aggregations = aggregation_model.objects.filter(product_id__in=product_ids)
+        if shop:
+            aggregations = aggregations.filter(shop=shop)
+        totals.update(get_aggregation_totals_by_object(aggregations, "product_id"))
+
+    return dict((product.pk, totals.get(product.pk) or get_empty_totals()) for product in products)
+
+
+def _render_star_rating(template, product_rating, customer_ratings_title, show_recommenders, minified):
+    rating = product_rating["rating"]
+    if not rating:
+        return None
+
+    (full_stars, empty_stars, half_star) = get_stars_from_rating(rating)
+    context = {
+        "half_star": half_star,
+        "full_stars": full_stars,
+        "empty_stars": empty_stars,
+        "reviews": product_rating["reviews"],
+        "rating": rating,
+        "customer_ratings_title": customer_ratings_title,
+        "show_recommenders": show_recommenders,
+        "minified": minified
+    }
+    return template.render(context)
+
+
+def render_product_review_ratings(
+        product, customer_ratings_title=None, show_recommenders=False, minified=False, shop=None):
+    """
+    Render the star rating template for a given product and options
+    with the ratings of the given shop, or of all shops when no shop is given.
     Returns None if no reviews exists for product
     """
     if is_product_valid_mode(product):
-        cached_star_rating = get_cached_star_rating(product.pk)
-        if cached_star_rating is not None:
-            if cached_star_rating == -1:
-                return ""
-            return cached_star_rating
-
-        product_rating = get_reviews_aggregation_for_product(product)
-        rating = product_rating["rating"]
-        star_rating = None
-        if rating:
-            (full_stars, empty_stars, half_star) = get_stars_from_rating(rating)
-            context = {
-                "half_star": half_star,
-                "full_stars": full_stars,
-                "empty_stars": empty_stars,
-                "reviews": product_rating["reviews"],
-                "rating": rating,
-                "customer_ratings_title": customer_ratings_title,
-                "show_recommenders": show_recommenders,
-                "minified": minified
-            }
+        star_ratings = render_product_review_ratings_many(
+            [product], customer_ratings_title, show_recommenders, minified, shop
+        )
+        return star_ratings[product.pk]
+
+
+def render_product_review_ratings_many(
+        products, customer_ratings_title=None, show_recommenders=False, minified=False, shop=None):
+    """
+    Render the star rating template for the given products and options, see `render_product_review_ratings`,
+    with one cache query for all the products and one aggregation query for the products not in the cache.
+
+    The reviews totals of the products are cached once per shop and the star ratings
+    once per options and language, so all the variants share a single aggregation query.
+
+    Products of modes that can't have reviews are skipped.
+
+    :return: dict of the product ids and their star ratings, an empty string if the product has no reviews
+    :rtype: dict[int, str]
+    """
+    products = dict((product.pk, product) for product in products if is_product_valid_mode(product))
+    template = []
+
+    def get_data(product_ids):
+        return get_reviews_aggregations_for_products([products[product_id] for product_id in product_ids], shop)
+
+    def render(product_rating):
+        if not template:
             from django.template import loader
-            star_rating = loader.render_to_string("shuup_product_reviews/plugins/star_rating.jinja", context=context)
+            template.append(loader.get_template("shuup_product_reviews/plugins/star_rating.jinja"))
+        return _render_star_rating(
+            template[0], product_rating, customer_ratings_title, show_recommenders, minified
+        )
+
+    return caching.get_cached_renders(
+        list(products.keys()), get_star_rating_namespace, shop,
+        (customer_ratings_title or "", show_recommenders, minified), get_data, render
+    )
 
-        # -1 is a flag that indicates that there is no content to render
-        cache_star_rating(product.id, star_rating or -1)
-        return star_rating or ""
 
+def warm_star_rating_caches(product_ids, shop):
+    """
+    Render and cache the star ratings of the given products in the shop
+    with the default options, both full and minified, in the active language
+    """
+    products = list(Product.objects.filter(pk__in=product_ids))
+    for minified in (False, True):
+        render_product_review_ratings_many(products, minified=minified, shop=shop)
 
-def get_cached_star_rating(product_id):
-    return cache.get("product_reviews_star_rating_{}".format(product_id))
 
+def get_reviewable_product_ids(shop):
+    """
+    Returns the ids of the products of the shop that can have reviews
+    """
+    return list(Product.objects.filter(
+        shop_products__shop=shop, deleted=False, mode__in=ACCEPTED_PRODUCT_MODES
+    ).order_by("pk").values_list("pk", flat=True))
 
-def cache_star_rating(product_id, star_rating):
-    cache.set("product_reviews_star_rating_{}".format(product_id), star_rating)
 
+def get_most_reviewed_product_ids(shop, limit=10):
+    """
+    Returns the ids of the products and variation parents with the most reviews in the shop
+    """
+    return list(
+        ProductFamilyReviewAggregation.objects.filter(shop=shop).order_by("-review_count", "product_id").values_list(
+            "product_id", flat=True
+        )[:limit]
+    )
+
+
+def get_cached_reviews_aggregations_for_products(products, shop=None):
+    """
+    Returns the reviews totals of the given products, see `get_reviews_aggregations_for_products`,
+    reading them from the star rating cache of the products
+    """
+    products = dict((product.pk, product) for product in products)
+    return caching.get_cached_data(
+        list(products.keys()), get_star_rating_namespace, shop,
+        lambda product_ids: get_reviews_aggregations_for_products([products[pk] for pk in product_ids], shop)
+    )
 
-def bump_star_rating_cache(product_id):
-    cache.bump_version("product_reviews_star_rating_{}".format(product_id))
+
+def get_cached_reviews_aggregation_for_product(product, shop=None):
+    """
+    Returns the reviews totals of the product, see `get_reviews_aggregation_for_product`,
+    reading them from the star rating cache of the product
+    """
+    return get_cached_reviews_aggregations_for_products([product], shop)[product.pk]
+
+
+def has_product_review_comments(product, shop):
+    """
+    Returns whether the product or its variation children have
+    approved reviews with comments in the shop, cached with the star ratings
+    """
+    def has_comments():
+        product_ids = [product.pk] + list(product.variation_children.values_list("pk", flat=True))
+        return ProductReview.objects.approved().filter(
+            shop=shop,
+            product_id__in=product_ids,
+            comment__isnull=False
+        ).exists()
+
+    namespace = get_star_rating_namespace(product.pk)
+    return caching.get_or_set(namespace, shop, caching.get_comments_key(shop), has_comments)
+
+
+def get_star_rating_namespace(product_id):
+    return "product_reviews_star_rating_{}".format(product_id)
+
+
+def bump_star_rating_cache(product_id, shop_id=None):
+    """
+    Invalidate the cached star ratings and review totals of the product in all shops
+    and the in-process caches of the given shop, or of all shops when no shop is given
+    """
+    caching.bump_namespace(get_star_rating_namespace(product_id))
+    caching.bump_local_caches(shop_id)
@@ -7,7 +7,6 @@
 # LICENSE file in the root directory of this source tree.
 from django import forms
 from django.conf import settings
-from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
 from django.core.urlresolvers import reverse
 from django.db.transaction import atomic
 from django.http.response import HttpResponseRedirect
@@ -18,10 +17,11 @@ from shuup.core.models import Product
 from shuup.front.views.dashboard import DashboardViewMixin
 from shuup_product_reviews.models import ProductReview
 from shuup_product_reviews.utils import (
-    get_orders_for_review, get_pending_products_reviews
+    get_orders_for_review, get_pending_products_reviews,
+    get_star_rating_namespace
 )
 
-from .base import BaseCommentsView
+from .base import BaseCommentsView, BaseManyCommentsView
 
 
 class ProductReviewForm(forms.Form):
@@ -88,21 +88,50 @@ class ProductReviewsView(DashboardViewMixin, TemplateView):
 class ProductReviewCommentsView(BaseCommentsView):
     view_name = "product_review_comments"
 
-    def get_reviews_page(self):
-        product = Product.objects.filter(pk=self.kwargs["pk"], shop_products__shop=self.request.shop).first()
-        product_ids = [product.pk] + list(product.variation_children.values_list("pk", flat=True))
-        queryset = ProductReview.objects.approved().filter(
+    @classmethod
+    def get_object_reviews_namespace(cls, pk):
+        # the reviews of the variation children also bump the namespace of the parent
+        return get_star_rating_namespace(pk)
+
+    @classmethod
+    def get_first_page_querysets(cls, request, pks):
+        product_ids = dict(
+            (pk, [pk]) for pk in Product.objects.filter(
+                pk__in=pks, shop_products__shop=request.shop
+            ).values_list("pk", flat=True)
+        )
+        for (child_id, parent_id) in Product.objects.filter(variation_parent_id__in=list(product_ids)).values_list(
+            "pk", "variation_parent_id"
+        ):
+            product_ids[parent_id].append(child_id)
+        return dict((pk, cls.get_product_reviews(request, product_ids.get(pk))) for pk in pks)
+
+    @classmethod
+    def get_product_reviews(cls, request, product_ids):
+        """
+        Returns the approved reviews with comments of the product and its variation children
+        """
+        if not product_ids:
+            return ProductReview.objects.none()
+        return ProductReview.objects.approved().filter(
             product__id__in=product_ids,
-            shop=self.request.shop,
+            shop=request.shop,
             comment__isnull=False
-        ).order_by("-created_on")
+        )
 
-        paginator = Paginator(queryset, settings.PRODUCT_REVIEWS_PAGE_SIZE)
-        page = self.request.GET.get('page')
+    def get_cache_control(self):
+        return settings.PRODUCT_REVIEWS_COMMENTS_CACHE_CONTROL
 
-        try:
-            return paginator.page(page)
-        except PageNotAnInteger:
-            return paginator.page(1)
-        except EmptyPage:
-            return paginator.page(paginator.num_pages)
+    def get_page_size(self):
+        return settings.PRODUCT_REVIEWS_PAGE_SIZE
+
+    def get_reviews_queryset(self):
+        pk = int(self.kwargs["pk"])
+        return self.get_first_page_querysets(self.request, [pk])[pk]
+
+
+class ProductReviewManyCommentsView(BaseManyCommentsView):
+    comments_view_class = ProductReviewCommentsView
+
+    def get_cache_control(self):
+        return settings.PRODUCT_REVIEWS_COMMENTS_CACHE_CONTROL
@@ -7,8 +7,10 @@
 # LICENSE file in the root directory of this source tree.
 import json
 
+import mock
 import pytest
 from django.core.urlresolvers import reverse
+from django.db.models.signals import post_save
 from django.test.client import Client
 
 from shuup.testing import factories
@@ -16,7 +18,11 @@ from shuup.testing.utils import apply_request_middleware
 from shuup_product_reviews.admin_module.mass_actions import (
     ApproveProductReviewMassAction, RejectProductReviewMassAction
 )
-from shuup_product_reviews.models import ProductReview, ReviewStatus
+from shuup_product_reviews.aggregation import AGGREGATION_MODE_IMMEDIATE
+from shuup_product_reviews.models import (
+    ProductFamilyReviewAggregation, ProductReview, ProductReviewAggregation,
+    ProductReviewDailyAggregation, ReviewStatus
+)
 
 from .factories import create_random_review_for_product
 
@@ -91,3 +97,49 @@ def test_admin_mass_actions(rf, admin_user):
     ApproveProductReviewMassAction().process(request, [r.pk for r in ProductReview.objects.all()[:3]])
     assert ProductReview.objects.filter(status=ReviewStatus.REJECTED).count() == 7
     assert ProductReview.objects.filter(status=ReviewStatus.APPROVED).count() == 8
+
+
+@pytest.mark.django_db
+def test_admin_mass_actions_aggregations(rf, admin_user, settings):
+    settings.PRODUCT_REVIEWS_AGGREGATION_MODE = AGGREGATION_MODE_IMMEDIATE
+    shop = factories.get_default_shop()
+    supplier = factories.get_default_supplier()
+    parent = factories.create_product("parent", shop=shop, supplier=supplier)
+    products = [factories.create_product("product-%d" % index, shop=shop, supplier=supplier) for index in range(3)]
+    products[0].link_to_parent(parent)
+    reviews = [
+        create_random_review_for_product(shop, product, rating=rating, approved=False)
+        for product in products
+        for rating in (1, 4, 5)
+    ]
+    request = apply_request_middleware(rf.post("/"), user=admin_user)
+    saved_reviews = []
+
+    def on_review_saved(sender, instance, created, update_fields, **kwargs):
+        saved_reviews.append((instance.pk, instance.status, created, update_fields))
+
+    post_save.connect(on_review_saved, sender=ProductReview, dispatch_uid="test_admin_mass_actions")
+    try:
+        with mock.patch("shuup_product_reviews.utils.bump_star_rating_cache") as bump_star_rating_cache:
+            ApproveProductReviewMassAction().process(request, [review.pk for review in reviews[:6]])
+    finally:
+        post_save.disconnect(sender=ProductReview, dispatch_uid="test_admin_mass_actions")
+
+    # every product and the family are recalculated and invalidated once
+    assert ProductReviewAggregation.objects.get(product=products[0]).review_count == 3
+    assert ProductReviewAggregation.objects.get(product=products[1]).rating_sum == 10
+    assert not ProductReviewAggregation.objects.filter(product=products[2]).exists()
+    assert ProductFamilyReviewAggregation.objects.get(product=parent).review_count == 3
+    assert sorted(call[0] for call in bump_star_rating_cache.call_args_list) == sorted([
+        (products[0].pk, shop.pk), (parent.pk, shop.pk), (products[1].pk, shop.pk)
+    ])
+    assert sorted(saved_reviews) == sorted(
+        (review.pk, ReviewStatus.APPROVED, False, frozenset(["status", "modified_on"])) for review in reviews[:6]
+    )
+
+    # the unchanged reviews are skipped
+    ApproveProductReviewMassAction().process(request, "all")
+    RejectProductReviewMassAction().process(request, [reviews[0].pk, reviews[7].pk])
+    assert ProductReviewAggregation.objects.get(product=products[0]).review_count == 2
+    assert ProductReviewAggregation.objects.get(product=products[2]).review_count == 2
+    assert ProductReviewDailyAggregation.objects.get(product=products[2]).review_count == 2
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup Product Reviews Addon.
+#
+# Copyright (c) 2012-2019, Shoop Commerce Ltd. All rights reserved.
+#
+# This source code is licensed under the OSL-3.0 license found in the
+# LICENSE file in the root directory of this source tree.
+import mock
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from shuup.testing import factories
+from shuup_product_reviews import caching
+from shuup_product_reviews.aggregation import AGGREGATION_MODE_IMMEDIATE
+from shuup_product_reviews.utils import render_product_review_ratings
+from shuup_vendor_reviews.utils import render_vendor_review_ratings
+
+from .factories import create_random_review_for_product
+
+
+@pytest.mark.django_db
+def test_vendor_without_reviews_cached():
+    cache.clear()
+    shop = factories.get_default_shop()
+    supplier = factories.get_default_supplier()
+
+    assert render_vendor_review_ratings(supplier, shop=shop) == ""
+    with CaptureQueriesContext(connection) as context:
+        assert render_vendor_review_ratings(supplier, shop=shop) == ""
+        assert render_vendor_review_ratings(supplier, minified=True, shop=shop) == ""
+    assert len(context.captured_queries) == 0
+
+
+def test_missing_value_computed_once(settings):
+    settings.PRODUCT_REVIEWS_CACHE_LOCK_TIMEOUT = 5
+    cache.clear()
+    cache_keys = caching.get_versioned_keys({1: ("test_namespace", "value")})
+    get_values = mock.Mock(return_value={1: "computed"})
+
+    # another request is computing the value and caches it while we wait
+    assert cache.add(caching._get_lock_key(cache_keys[1]), True)
+    other_request = (lambda seconds: caching.set_many(cache_keys, {1: "other"}))
+    with mock.patch.object(caching.time, "sleep", side_effect=other_request):
+        assert caching.get_or_set_many(cache_keys, get_values) == {1: "other"}
+    assert not get_values.called
+
+    # the waiting request computes the value itself when the lock times out
+    settings.PRODUCT_REVIEWS_CACHE_LOCK_TIMEOUT = 0
+    cache.delete(cache_keys[1])
+    assert caching.get_or_set_many(cache_keys, get_values) == {1: "computed"}
+    assert caching.get_many(cache_keys) == {1: "computed"}
+
+
+def test_expiring_value_recomputed_early():
+    cache.clear()
+    cache_keys = caching.get_versioned_keys({1: ("test_namespace", "value")})
+    get_values = mock.Mock(return_value={1: "new"})
+    # the value took so long to compute that it is always expiring
+    caching.set_many(cache_keys, {1: "old"}, delta=10 ** 9)
+
+    # the other requests are served the cached value while one recomputes it
+    lock_key = caching._get_lock_key(cache_keys[1])
+    assert cache.add(lock_key, True)
+    assert caching.get_or_set_many(cache_keys, get_values) == {1: "old"}
+    assert not get_values.called
+
+    cache.delete(lock_key)
+    assert caching.get_or_set_many(cache_keys, get_values) == {1: "new"}
+    get_values.assert_called_once_with([1])
+    assert not cache.get(lock_key)
+
+
+def test_missing_values_locked_per_batch(settings):
+    settings.PRODUCT_REVIEWS_CACHE_LOCK_TIMEOUT = 5
+    cache.clear()
+    cache_keys = caching.get_versioned_keys(dict((index, ("test_namespace_%d" % index, "value")) for index in range(3)))
+    get_values = mock.Mock(side_effect=lambda names: dict((name, "computed") for name in names))
+
+    # a request computing some of the values does not make an overlapping batch wait
+    assert cache.add(caching._get_lock_key(cache_keys[1]), True)
+    with mock.patch.object(caching.time, "sleep") as sleep:
+        with mock.patch.object(cache, "add", wraps=cache.add) as cache_add:
+            assert caching.get_or_set_many(cache_keys, get_values) == {0: "computed", 1: "computed", 2: "computed"}
+    assert not sleep.called
+    # the whole batch is locked with one cache call and unlocked after
+    assert cache_add.call_count == 1
+    assert not cache.get(caching._get_batch_lock_key(list(cache_keys.values())))
+
+    # a request computing the same batch is waited for
+    cache.delete_many(list(cache_keys.values()))
+    assert cache.add(caching._get_batch_lock_key(list(cache_keys.values())), True)
+    other_request = (lambda seconds: caching.set_many(cache_keys, dict((index, "other") for index in range(3))))
+    with mock.patch.object(caching.time, "sleep", side_effect=other_request):
+        assert caching.get_or_set_many(cache_keys, get_values) == {0: "other", 1: "other", 2: "other"}
+    assert get_values.call_count == 1
+
+
+@pytest.mark.django_db
+def test_local_cache(settings):
+    settings.PRODUCT_REVIEWS_LOCAL_CACHE_SIZE = 2
+    settings.PRODUCT_REVIEWS_AGGREGATION_MODE = AGGREGATION_MODE_IMMEDIATE
+    cache.clear()
+    caching.clear_local_cache()
+    shop = factories.get_default_shop()
+    supplier = factories.get_default_supplier()
+    products = [factories.create_product("product-%d" % index, shop=shop, supplier=supplier) for index in range(3)]
+    for product in products:
+        create_random_review_for_product(shop, product)
+
+    try:
+        rendered = render_product_review_ratings(products[0], shop=shop)
+        assert "1 review" in rendered
+
+        # served from memory without touching the shared cache
+        with mock.patch.object(caching, "_get_cache") as get_cache:
+            with CaptureQueriesContext(connection) as context:
+                assert render_product_review_ratings(products[0], shop=shop) == rendered
+        assert not get_cache.called
+        assert len(context.captured_queries) == 0
+
+        # a review change in the shop invalidates the local values of the shop
+        create_random_review_for_product(shop, products[0])
+        assert "2 reviews" in render_product_review_ratings(products[0], shop=shop)
+
+        for product in products:
+            render_product_review_ratings(product, shop=shop)
+        assert len(caching._local_cache) == 2
+    finally:
+        caching.clear_local_cache()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup Product Reviews Addon.
+#
+# Copyright (c) 2012-2019, Shoop Commerce Ltd. All rights reserved.
+#
+# This source code is licensed under the OSL-3.0 license found in the
+# LICENSE file in the root directory of this source tree.
+import csv
+import datetime
+import json
+
+import pytest
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test.client import Client
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from shuup.core.models import Supplier
+from shuup.testing import factories
+from shuup_product_reviews.models import ProductReview
+from shuup_vendor_reviews.models import VendorReview
+
+from .factories import (
+    create_multi_supplier_order_to_review, create_random_review_for_product,
+    create_vendor_review_for_order_line
+)
+
+
+def create_reviews(shop):
+    product = factories.create_product(
+        "export-sku", shop=shop, supplier=factories.get_default_supplier(), default_price=10
+    )
+    for _ in range(5):
+        create_random_review_for_product(shop, product)
+
+    shop_product = product.get_shop_instance(shop)
+    shop_product.suppliers.add(Supplier.objects.create(identifier="export", name="Export Vendor"))
+    order = create_multi_supplier_order_to_review(shop_product, factories.create_random_person("en"))
+    create_vendor_review_for_order_line(order.lines.get(supplier__identifier="export"), 4, "Fast shipping")
+
+
+@pytest.mark.django_db
+def test_export_reviews_command():
+    shop = factories.get_default_shop()
+    create_reviews(shop)
+    old_review = ProductReview.objects.order_by("pk").first()
+    ProductReview.objects.filter(pk=old_review.pk).update(modified_on=timezone.now() - datetime.timedelta(days=10))
+
+    output = StringIO()
+    call_command("export_reviews", "--shop=%d" % shop.pk, "--chunk-size=2", stdout=output)
+    rows = list(csv.DictReader(StringIO(output.getvalue())))
+    assert [(row["type"], int(row["id"])) for row in rows] == (
+        [("product", pk) for pk in ProductReview.objects.order_by("pk").values_list("pk", flat=True)] +
+        [("vendor", VendorReview.objects.get().pk)]
+    )
+    review = ProductReview.objects.order_by("pk").last()
+    assert rows[4]["product_sku"] == "export-sku"
+    assert rows[4]["reviewer"] == review.reviewer.name
+    assert rows[4]["comment"] == review.comment
+    assert rows[4]["status"] == "approved"
+    assert rows[4]["created_on"] == review.created_on.isoformat()
+    assert rows[5]["supplier"] == "Export Vendor"
+    assert rows[5]["product_sku"] == ""
+
+    # incremental export
+    output = StringIO()
+    since = (timezone.now() - datetime.timedelta(days=1)).date().isoformat()
+    call_command(
+        "export_reviews", "--shop=%d" % shop.pk, "--format=jsonl", "--reviews", "product",
+        "--since=%s" % since, stdout=output
+    )
+    rows = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert len(rows) == 4
+    assert old_review.pk not in [row["id"] for row in rows]
+    assert set(row["type"] for row in rows) == set(["product"])
+
+
+@pytest.mark.django_db
+def test_export_reviews_view(admin_user):
+    shop = factories.get_default_shop()
+    create_reviews(shop)
+    url = reverse("shuup_admin:product_reviews.export")
+
+    client = Client()
+    client.login(username=admin_user.username, password="password")
+    response = client.get(url, {"format": "jsonl", "reviews": "vendor"})
+    assert response.status_code == 200
+    assert response.streaming
+    assert response["Content-Type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in b"".join(response.streaming_content).decode("utf-8").splitlines()]
+    assert [row["id"] for row in rows] == [VendorReview.objects.get().pk]
+
+    response = client.get(url)
+    assert response["Content-Disposition"] == 'attachment; filename="reviews.csv"'
+    content = b"".join(response.streaming_content).decode("utf-8")
+    assert len(list(csv.DictReader(StringIO(content)))) == 6
+    assert client.get(url, {"format": "xml"}).status_code == 400
+    assert client.get(url, {"since": "yesterday"}).status_code == 400
+
+    # only for the admin users
+    user = factories.create_random_user()
+    user.set_password("user")
+    user.save()
+    client = Client()
+    client.login(username=user.username, password="user")
+    assert client.get(url).status_code != 200
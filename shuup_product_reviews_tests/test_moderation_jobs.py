@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup Product Reviews Addon.
+#
+# Copyright (c) 2012-2019, Shoop Commerce Ltd. All rights reserved.
+#
+# This source code is licensed under the OSL-3.0 license found in the
+# LICENSE file in the root directory of this source tree.
+import json
+
+import mock
+import pytest
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test.client import Client
+from django.utils.six import StringIO
+
+from shuup.testing import factories
+from shuup.testing.utils import apply_request_middleware
+from shuup_product_reviews.admin_module.mass_actions import (
+    ApproveProductReviewMassAction, RejectProductReviewMassAction
+)
+from shuup_product_reviews.enums import ModerationJobStatus, ReviewStatus
+from shuup_product_reviews.models import (
+    ProductReview, ProductReviewAggregation, ReviewModerationJob
+)
+from shuup_product_reviews.moderation import (
+    create_moderation_job, process_moderation_chunk, process_moderation_job
+)
+
+from .factories import create_random_review_for_product
+
+
+def create_pending_reviews(shop, count):
+    product = factories.create_product("product", shop=shop, supplier=factories.get_default_supplier())
+    return [create_random_review_for_product(shop, product, approved=False) for _ in range(count)]
+
+
+@pytest.mark.django_db
+def test_mass_action_moderation_job(rf, admin_user, settings):
+    settings.PRODUCT_REVIEWS_MODERATION_JOB_THRESHOLD = 5
+    shop = factories.get_default_shop()
+    reviews = create_pending_reviews(shop, 8)
+    request = apply_request_middleware(rf.post("/"), user=admin_user)
+
+    # the selected reviews are moderated right away
+    RejectProductReviewMassAction().process(request, [review.pk for review in reviews[:6]])
+    assert ProductReview.objects.filter(status=ReviewStatus.REJECTED).count() == 6
+    assert not ReviewModerationJob.objects.exists()
+
+    ApproveProductReviewMassAction().process(request, "all")
+    job = ReviewModerationJob.objects.get()
+    assert job.review_model == "shuup_product_reviews.ProductReview"
+    assert job.review_status == ReviewStatus.APPROVED
+    assert job.status == ModerationJobStatus.PENDING
+    assert job.created_by == admin_user
+    assert (job.review_count, job.max_review_id) == (8, reviews[-1].pk)
+    assert not ProductReview.objects.filter(status=ReviewStatus.APPROVED).exists()
+
+    # the reviews created after the job are not moderated
+    product = reviews[0].product
+    new_review = create_random_review_for_product(shop, product, approved=False)
+
+    output = StringIO()
+    call_command("process_review_moderation_jobs", "--chunk-size=3", stdout=output)
+    assert "Processed 1 review moderation jobs." in output.getvalue()
+    job.refresh_from_db()
+    assert job.status == ModerationJobStatus.COMPLETED
+    assert (job.processed_count, job.changed_count, job.last_review_id) == (8, 8, reviews[-1].pk)
+    assert ProductReview.objects.filter(status=ReviewStatus.APPROVED).count() == 8
+    assert ProductReview.objects.get(pk=new_review.pk).status == ReviewStatus.PENDING
+    assert ProductReviewAggregation.objects.get(product=product).review_count == 8
+
+    # the completed jobs are not processed again
+    output = StringIO()
+    call_command("process_review_moderation_jobs", stdout=output)
+    assert "Processed 0 review moderation jobs." in output.getvalue()
+
+
+@pytest.mark.django_db
+def test_moderation_job_resume(admin_user):
+    shop = factories.get_default_shop()
+    reviews = create_pending_reviews(shop, 7)
+    job = create_moderation_job(ProductReview, shop, ReviewStatus.REJECTED, admin_user)
+    stale_job = ReviewModerationJob.objects.get(pk=job.pk)
+
+    assert process_moderation_chunk(job, chunk_size=3)
+    assert (job.status, job.last_review_id, job.processed_count) == (ModerationJobStatus.RUNNING, reviews[2].pk, 3)
+
+    # a chunk already processed by another command is skipped
+    with mock.patch.object(ProductReview, "bulk_update_status") as bulk_update_status:
+        assert process_moderation_chunk(stale_job, chunk_size=3)
+    assert not bulk_update_status.called
+    assert stale_job.last_review_id == reviews[2].pk
+
+    # the failed chunk is rolled back
+    with mock.patch.object(ProductReview, "bulk_update_status", side_effect=RuntimeError("crash")):
+        with pytest.raises(RuntimeError):
+            process_moderation_job(job, chunk_size=3)
+    job.refresh_from_db()
+    assert job.status == ModerationJobStatus.FAILED
+    assert "crash" in job.error
+    assert (job.last_review_id, job.processed_count, job.changed_count) == (reviews[2].pk, 3, 3)
+    assert ProductReview.objects.filter(status=ReviewStatus.REJECTED).count() == 3
+
+    call_command("process_review_moderation_jobs", stdout=StringIO())
+    assert ReviewModerationJob.objects.get(pk=job.pk).status == ModerationJobStatus.FAILED
+
+    call_command("process_review_moderation_jobs", "--retry-failed", "--chunk-size=3", stdout=StringIO())
+    job.refresh_from_db()
+    assert job.status == ModerationJobStatus.COMPLETED
+    assert (job.processed_count, job.changed_count) == (7, 7)
+    assert ProductReview.objects.filter(status=ReviewStatus.REJECTED).count() == 7
+
+
+@pytest.mark.django_db
+def test_moderation_job_list_view(admin_user):
+    shop = factories.get_default_shop()
+    create_pending_reviews(shop, 4)
+    job = create_moderation_job(ProductReview, shop, ReviewStatus.APPROVED, admin_user)
+    process_moderation_chunk(job, chunk_size=3)
+
+    client = Client()
+    client.login(username=admin_user.username, password="password")
+    url = reverse("shuup_admin:product_reviews.moderation_jobs")
+    assert client.get(url).status_code == 200
+    response = client.get(url, data={"jq": json.dumps({"perPage": 100, "page": 1})})
+    assert response.status_code == 200
+    items = json.loads(response.content.decode("utf-8"))["items"]
+    assert len(items) == 1
+    assert items[0]["progress"] == "3 / 4"
+    assert items[0]["review_model"] == "product reviews"
+    assert items[0]["status"] == "Running"
@@ -5,9 +5,15 @@
 #
 # This source code is licensed under the OSL-3.0 license found in the
 # LICENSE file in the root directory of this source tree.
+import json
+
 import pytest
+from django.conf import settings
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.test.client import Client
+from django.test.utils import CaptureQueriesContext, override_settings
 
 from shuup.testing import factories
 from shuup.themes.classic_gray.theme import ClassicGrayTheme
@@ -22,11 +28,12 @@ from .factories import create_random_review_for_product
 
 
 @pytest.mark.django_db
-@pytest.mark.parametrize("show_recommenders,title", [
-    (True, "My Title Here"),
-    (False, "A new life")
+@pytest.mark.parametrize("show_recommenders,show_rating_histogram,title", [
+    (True, False, "My Title Here"),
+    (False, True, "A new life")
 ])
-def test_ratings_plugin(show_recommenders, title):
+def test_ratings_plugin(show_recommenders, show_rating_histogram, title):
+    cache.clear()
     shop = factories.get_default_shop()
     product = factories.create_product("product", shop=shop, supplier=factories.get_default_supplier())
 
@@ -45,7 +52,8 @@ def test_ratings_plugin(show_recommenders, title):
         "customer_ratings_title": {
             "en": title
         },
-        "show_recommenders": show_recommenders
+        "show_recommenders": show_recommenders,
+        "show_rating_histogram": show_rating_histogram
     })
     svc.set_layout_data(layout.placeholder_name, layout)
     svc.save()
@@ -60,12 +68,14 @@ def test_ratings_plugin(show_recommenders, title):
     assert "product-reviews-rating-star" in content
     assert 'class="rating"' in content
     assert ('class="recommend"' in content) == show_recommenders
+    assert ('class="rating-histogram' in content) == show_rating_histogram
     assert title in content
 
 
 @pytest.mark.django_db
 @pytest.mark.parametrize("title", ["My Title Here", "A new life"])
 def test_comments_plugin(title):
+    cache.clear()
     shop = factories.get_default_shop()
     product = factories.create_product("product", shop=shop, supplier=factories.get_default_supplier())
 
@@ -98,3 +108,58 @@ def test_comments_plugin(title):
     assert "product-review-comments" in content
     assert 'data-url="%s"' % reverse('shuup:product_review_comments', kwargs=dict(pk=product.pk)) in content
     assert 'data-title="%s"' % title in content
+
+
+@pytest.mark.django_db
+def test_plugins_cached(rf):
+    cache.clear()
+    shop = factories.get_default_shop()
+    product = factories.create_product("product", shop=shop, supplier=factories.get_default_supplier())
+    [create_random_review_for_product(shop, product) for _ in range(3)]
+
+    request = rf.get("/")
+    request.shop = shop
+    context = {"request": request, "shop_product": product.get_shop_instance(shop)}
+    plugins = [ProductReviewStarRatingsPlugin({}), ProductReviewCommentsPlugin({})]
+    contexts = [plugin.get_context_data(context) for plugin in plugins]
+    assert contexts[0]["reviews"] == 3
+    assert contexts[1]["review_product"] == product
+
+    with CaptureQueriesContext(connection) as queries:
+        assert [plugin.get_context_data(context) for plugin in plugins] == contexts
+    assert not [query for query in queries.captured_queries if "shuup_product_reviews" in query["sql"]]
+
+
+@pytest.mark.django_db
+@override_settings(PRODUCT_REVIEWS_AGGREGATION_MODE="immediate")
+def test_comments_plugin_first_page(rf):
+    cache.clear()
+    shop = factories.get_default_shop()
+    product = factories.create_product("product", shop=shop, supplier=factories.get_default_supplier())
+    product_no_reviews = factories.create_product("product-no", shop=shop, supplier=factories.get_default_supplier())
+    [create_random_review_for_product(shop, product) for _ in range(7)]
+
+    request = rf.get("/", {"sort": "lowest", "rating": 1})
+    request.shop = shop
+    plugin = ProductReviewCommentsPlugin({"embed_first_page": True})
+    context = plugin.get_context_data({"request": request, "shop_product": product.get_shop_instance(shop)})
+    assert context["review_product"] == product
+
+    # the first page in the default order, whatever the parameters of the page
+    comments_url = reverse("shuup:product_review_comments", kwargs=dict(pk=product.pk))
+    first_page = json.loads(Client().get(comments_url).content.decode("utf-8"))
+    assert json.loads(context["first_page"]) == first_page
+    assert len(first_page["reviews"]) == settings.PRODUCT_REVIEWS_PAGE_SIZE
+    assert first_page["next_page_url"]
+
+    with CaptureQueriesContext(connection) as queries:
+        assert plugin.get_context_data(context)["first_page"] == context["first_page"]
+    assert not [query for query in queries.captured_queries if "shuup_product_reviews" in query["sql"]]
+
+    # a new review changes the first page
+    review = create_random_review_for_product(shop, product)
+    context = plugin.get_context_data(context)
+    assert json.loads(context["first_page"])["reviews"][0]["id"] == review.pk
+
+    context = plugin.get_context_data({"request": request, "shop_product": product_no_reviews.get_shop_instance(shop)})
+    assert "review_product" not in context
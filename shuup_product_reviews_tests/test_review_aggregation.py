@@ -5,11 +5,35 @@
 #
 # This source code is licensed under the OSL-3.0 license found in the
 # LICENSE file in the root directory of this source tree.
+import datetime
+from decimal import Decimal
+
+import mock
 import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.six import StringIO
 
+from shuup.core.models import Product
 from shuup.testing import factories
-from shuup_product_reviews.models import ProductReview
-from shuup_product_reviews.utils import get_reviews_aggregation_for_product
+from shuup_product_reviews.aggregation import (
+    AGGREGATION_MODE_COMMIT, AGGREGATION_MODE_IMMEDIATE,
+    AGGREGATION_MODE_QUEUE, apply_daily_aggregation_delta,
+    get_review_contribution
+)
+from shuup_product_reviews.enums import ReviewStatus
+from shuup_product_reviews.models import (
+    get_variation_family_ids, ProductFamilyReviewAggregation, ProductReview,
+    ProductReviewAggregation, ProductReviewDailyAggregation,
+    ReviewAggregationQueueItem, ReviewScorePrior
+)
+from shuup_product_reviews.scores import get_score, update_scores
+from shuup_product_reviews.utils import (
+    get_reviews_aggregation_for_product, get_top_rated_product_ids,
+    get_windowed_reviews_aggregation_for_product
+)
 
 from .factories import create_random_review_for_product
 
@@ -31,3 +55,425 @@ def test_rejecting_all_reviews():
     totals = get_reviews_aggregation_for_product(product)
     assert totals["rating"] is None
     assert totals["reviews"] is None
+
+
+@pytest.mark.django_db
+def test_aggregation_delta_maintenance(settings):
+    settings.PRODUCT_REVIEWS_AGGREGATION_MODE = AGGREGATION_MODE_IMMEDIATE
+    shop = factories.get_default_shop()
+    product = factories.create_product("product", shop=shop, supplier=factories.get_default_supplier())
+    reviews = [
+        create_random_review_for_product(shop, product, rating=rating, would_recommend=(rating > 3), approved=False)
+        for rating in [1, 2, 4, 5]
+    ]
+    assert not ProductReviewAggregation.objects.filter(product=product).exists()
+
+    for review in reviews:
+        review.approve()
+
+    aggregation = ProductReviewAggregation.objects.get(product=product)
+    assert aggregation.review_count == 4
+    assert aggregation.rating_sum == 12
+    assert aggregation.rating == Decimal("3.0")
+    assert aggregation.would_recommend == 2
+    assert aggregation.get_rating_counts() == [1, 1, 0, 1, 1]
+
+    review = ProductReview.objects.get(pk=reviews[0].pk)
+    review.rating = 5
+    review.would_recommend = True
+    review.save()
+    aggregation.refresh_from_db()
+    assert aggregation.review_count == 4
+    assert aggregation.rating_sum == 16
+    assert aggregation.rating == Decimal("4.0")
+    assert aggregation.would_recommend == 3
+    assert aggregation.get_rating_counts() == [0, 1, 0, 1, 2]
+
+    # the change of reviews loaded with deferred fields is read from their stored row
+    ProductReview.objects.only("pk").get(pk=reviews[1].pk).reject()
+    aggregation.refresh_from_db()
+    assert aggregation.review_count == 3
+    assert aggregation.rating_sum == 14
+    assert aggregation.rating == Decimal("4.7")
+    assert aggregation.get_rating_counts() == [0, 0, 0, 1, 2]
+
+    # a drifted aggregation is recalculated instead of being patched
+    ProductReviewAggregation.objects.filter(product=product).update(review_count=1, rating_sum=100)
+    ProductReview.objects.get(pk=reviews[2].pk).reject()
+    aggregation.refresh_from_db()
+    assert aggregation.review_count == 2
+    assert aggregation.rating_sum == 10
+
+    for review in ProductReview.objects.filter(product=product):
+        review.reject()
+    assert not ProductReviewAggregation.objects.filter(product=product).exists()
+
+
+@pytest.mark.django_db
+def test_daily_aggregation_drift(settings):
+    settings.PRODUCT_REVIEWS_AGGREGATION_MODE = AGGREGATION_MODE_IMMEDIATE
+    shop = factories.get_default_shop()
+    product = factories.create_product("product", shop=shop, supplier=factories.get_default_supplier())
+    reviews = [create_random_review_for_product(shop, product, rating=4, would_recommend=True) for _ in range(2)]
+
+    # the delta would make the drifted counters negative, it is refused without writing
+    ProductReviewDailyAggregation.objects.filter(product=product).update(rating_sum=1, would_recommend=0)
+    lookup = dict(shop_id=shop.pk, product_id=product.pk, date=timezone.localdate())
+    assert ProductReviewDailyAggregation.objects.filter(**lookup).exists()
+    delta = get_review_contribution(ReviewStatus.APPROVED, 4, True)._replace(review_count=-1, rating_sum=-4)
+    with CaptureQueriesContext(connection) as context:
+        assert not apply_daily_aggregation_delta(ProductReviewDailyAggregation, lookup, delta)
+    assert not [query for query in context.captured_queries if query["sql"].startswith(("UPDATE", "INSERT"))]
+
+    # and the day is recalculated instead
+    reviews[0].reject()
+    daily = ProductReviewDailyAggregation.objects.get(product=product)
+    assert (daily.review_count, daily.rating_sum, daily.would_recommend) == (1, 4, 1)
+
+
+@pytest.mark.django_db
+def test_aggregation_stale_review_saves(settings):
+    settings.PRODUCT_REVIEWS_AGGREGATION_MODE = AGGREGATION_MODE_IMMEDIATE
+    shop = factories.get_default_shop()
+    product = factories.create_product("product", shop=shop, supplier=factories.get_default_supplier())
+    review = create_random_review_for_product(shop, product, rating=4, would_recommend=True, approved=False)
+    first_copy = ProductReview.objects.get(pk=review.pk)
+    second_copy = ProductReview.objects.get(pk=review.pk)
+
+    # both copies were loaded pending but the review is only counted once
+    first_copy.approve()
+    second_copy.approve()
+    aggregation = ProductReviewAggregation.objects.get(product=product)
+    assert (aggregation.review_count, aggregation.rating_sum, aggregation.would_recommend) == (1, 4, 1)
+    assert aggregation.get_rating_counts() == [0, 0, 0, 1, 0]
+    assert ProductReviewDailyAggregation.objects.get(product=product).review_count == 1
+
+    # a copy loaded before the approval removes the review it rejects
+    review.reject()
+    assert not ProductReviewAggregation.objects.filter(product=product).exists()
+    assert not ProductReviewDailyAggregation.objects.filter(product=product).exists()
+
+
+@pytest.mark.django_db
+def test_aggregation_updated_in_save_by_default():
+    shop = factories.get_default_shop()
+    product = factories.create_product("product", shop=shop, supplier=factories.get_default_supplier())
+    review = create_random_review_for_product(shop, product, rating=4, approved=False)
+
+    # nothing waits for the transaction to commit
+    with mock.patch("shuup_product_reviews.aggregation.transaction.on_commit") as on_commit:
+        with mock.patch("shuup_product_reviews.utils.bump_star_rating_cache") as bump_star_rating_cache:
+            review.approve()
+    assert not on_commit.called
+    bump_star_rating_cache.assert_called_once_with(product.pk, shop.pk)
+    assert ProductReviewAggregation.objects.get(product=product).review_count == 1
+
+
+@pytest.mark.django_db
+def test_aggregation_flushed_on_commit(settings):
+    settings.PRODUCT_REVIEWS_AGGREGATION_MODE = AGGREGATION_MODE_COMMIT
+    shop = factories.get_default_shop()
+    product = factories.create_product("product", shop=shop, supplier=factories.get_default_supplier())
+    reviews = [create_random_review_for_product(shop, product, rating=4, approved=False) for _ in range(3)]
+
+    commit_hooks = []
+    with mock.patch("shuup_product_reviews.aggregation.transaction.on_commit", side_effect=commit_hooks.append):
+        with mock.patch("shuup_product_reviews.utils.bump_star_rating_cache") as bump_star_rating_cache:
+            for review in ProductReview.objects.only("pk").filter(pk__in=[review.pk for review in reviews]):
+                review.approve()
+
+            # the changes are applied in the transaction but nothing is invalidated before the commit
+            assert ProductReviewAggregation.objects.get(product=product).review_count == 3
+            assert not bump_star_rating_cache.called
+
+            for commit_hook in commit_hooks:
+                commit_hook()
+
+            # the product is recalculated and invalidated only once
+            bump_star_rating_cache.assert_called_once_with(product.pk, shop.pk)
+
+    aggregation = ProductReviewAggregation.objects.get(product=product)
+    assert aggregation.review_count == 3
+    assert aggregation.rating == 4
+
+
+@pytest.mark.django_db
+def test_aggregation_queue(settings):
+    settings.PRODUCT_REVIEWS_AGGREGATION_MODE = AGGREGATION_MODE_QUEUE
+    shop = factories.get_default_shop()
+    product = factories.create_product("product", shop=shop, supplier=factories.get_default_supplier())
+    [create_random_review_for_product(shop, product, rating=2) for _ in range(3)]
+
+    assert ReviewAggregationQueueItem.objects.count() == 3
+    assert not ProductReviewAggregation.objects.filter(product=product).exists()
+
+    call_command("process_review_aggregation_queue")
+    assert not ReviewAggregationQueueItem.objects.exists()
+    aggregation = ProductReviewAggregation.objects.get(product=product)
+    assert aggregation.review_count == 3
+    assert aggregation.rating == 2
+
+
+@pytest.mark.django_db
+def test_recalculate_review_aggregations_command():
+    shop = factories.get_default_shop()
+    product1 = factories.create_product("product1", shop=shop, supplier=factories.get_default_supplier())
+    product2 = factories.create_product("product2", shop=shop, supplier=factories.get_default_supplier())
+    [create_random_review_for_product(shop, product1, rating=3) for _ in range(2)]
+    create_random_review_for_product(shop, product2, rating=5)
+
+    ProductReviewAggregation.objects.filter(product=product1).update(review_count=10, rating=1)
+    ProductReviewAggregation.objects.filter(product=product2).delete()
+    ProductReview.objects.filter(product=product1).update(rating=4)
+
+    out = StringIO()
+    call_command("recalculate_review_aggregations", "--dry-run", "--chunk-size=1", stdout=out)
+    assert "product review aggregation: 2 to change" in out.getvalue()
+    assert "product review aggregation %d-%d: 1 changed" % (product1.pk, product1.pk) in out.getvalue()
+
+    out = StringIO()
+    call_command("recalculate_review_aggregations", "--dry-run", "--chunk-size=1", verbosity=0, stdout=out)
+    assert "product review aggregation: 2 to change" in out.getvalue()
+    assert "product review aggregation %d-%d" % (product1.pk, product1.pk) not in out.getvalue()
+    assert ProductReviewAggregation.objects.get(product=product1).review_count == 10
+
+    call_command("recalculate_review_aggregations", "--shop=%d" % shop.pk, stdout=StringIO())
+    aggregation = ProductReviewAggregation.objects.get(product=product1)
+    assert aggregation.review_count == 2
+    assert aggregation.rating == 4
+    assert ProductReviewAggregation.objects.get(product=product2).rating == 5
+
+    out = StringIO()
+    call_command("recalculate_review_aggregations", stdout=out)
+    assert "product review aggregation: 0 changed" in out.getvalue()
+    assert "product family review aggregation: 0 changed" in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_check_review_aggregations_command():
+    shop = factories.get_default_shop()
+    product = factories.create_product("product", shop=shop, supplier=factories.get_default_supplier())
+    reviews = [create_random_review_for_product(shop, product, rating=4) for _ in range(3)]
+
+    # bulk updates and deletes skip the incremental maintenance
+    ProductReview.objects.filter(pk=reviews[0].pk).update(rating=1)
+    ProductReview.objects.filter(pk=reviews[1].pk).delete()
+
+    out = StringIO()
+    call_command("check_review_aggregations", "--reviews=product", stdout=out)
+    output = out.getvalue()
+    assert "product review aggregation %d (shop %d): review_count=3" % (product.pk, shop.pk) in output
+    assert "product review aggregation: 1 to change" in output
+    assert ProductReviewAggregation.objects.get(product=product).review_count == 3
+
+    out = StringIO()
+    call_command("check_review_aggregations", "--repair", "--sleep=0.01", "--chunk-size=1", stdout=out)
+    assert "product review aggregation: 1 changed" in out.getvalue()
+    aggregation = ProductReviewAggregation.objects.get(product=product)
+    assert aggregation.review_count == 2
+    assert aggregation.rating_sum == 5
+
+    out = StringIO()
+    call_command("check_review_aggregations", stdout=out)
+    assert "product review aggregation: 0 to change" in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_check_review_aggregations_throttle():
+    shop = factories.get_default_shop()
+    products = [
+        factories.create_product("product-%d" % index, shop=shop, supplier=factories.get_default_supplier())
+        for index in range(3)
+    ]
+    for product in products:
+        create_random_review_for_product(shop, product, rating=4)
+    sleep_path = "shuup_product_reviews.management.commands.recalculate_review_aggregations.time.sleep"
+    chunk_size = "--chunk-size=1"
+
+    # by default the checker waits as long as each chunk took
+    with mock.patch(sleep_path) as sleep:
+        call_command("check_review_aggregations", "--reviews=product", chunk_size, stdout=StringIO())
+    assert sleep.call_count >= 2
+    assert all(call[0][0] > 0 for call in sleep.call_args_list)
+
+    with mock.patch(sleep_path) as sleep:
+        call_command("check_review_aggregations", "--reviews=product", chunk_size, "--sleep=0", stdout=StringIO())
+    assert not sleep.called
+
+    with mock.patch(sleep_path) as sleep:
+        call_command("recalculate_review_aggregations", "--reviews=product", chunk_size, stdout=StringIO())
+    assert not sleep.called
+
+
+@pytest.mark.django_db
+def test_variation_family_aggregation():
+    shop = factories.get_default_shop()
+    supplier = factories.get_default_supplier()
+    parent = factories.create_product("parent", shop=shop, supplier=supplier)
+    child1 = factories.create_product("child1", shop=shop, supplier=supplier)
+    child2 = factories.create_product("child2", shop=shop, supplier=supplier)
+    child1.link_to_parent(parent)
+    child2.link_to_parent(parent)
+
+    [create_random_review_for_product(shop, child1, rating=5, would_recommend=True) for _ in range(3)]
+    review = create_random_review_for_product(shop, child2, rating=1, would_recommend=False)
+
+    parent = Product.objects.get(pk=parent.pk)
+    with CaptureQueriesContext(connection) as context:
+        totals = get_reviews_aggregation_for_product(parent)
+    assert len(context.captured_queries) == 1
+    # weighted by the number of reviews of each child
+    assert totals["rating"] == 4
+    assert totals["reviews"] == 4
+    assert totals["would_recommend"] == 3
+
+    totals = get_reviews_aggregation_for_product(Product.objects.get(pk=child2.pk))
+    assert totals["rating"] == 1
+    assert totals["reviews"] == 1
+
+    review.reject()
+    family = ProductFamilyReviewAggregation.objects.get(product=parent)
+    assert family.review_count == 3
+    assert family.rating == 5
+
+    # moving a child out of the family is repaired by the recalculation command
+    child1.unlink_from_parent()
+    call_command("recalculate_review_aggregations", stdout=StringIO())
+    assert not ProductFamilyReviewAggregation.objects.filter(product=parent).exists()
+    assert ProductFamilyReviewAggregation.objects.get(product=child1).review_count == 3
+
+
+@pytest.mark.django_db
+def test_recalculate_variation_families_in_bulk():
+    shop = factories.get_default_shop()
+    supplier = factories.get_default_supplier()
+    parent = factories.create_product("parent", shop=shop, supplier=supplier)
+    children = [factories.create_product("child-%d" % index, shop=shop, supplier=supplier) for index in range(4)]
+    for child in children:
+        child.link_to_parent(parent)
+        create_random_review_for_product(shop, child, rating=4)
+    ProductReview.objects.filter(product__in=children).update(rating=2)
+
+    # the families are repaired by their own sync and the caches bumped with one family lookup
+    with mock.patch("shuup_product_reviews.models.recalculate_family_aggregation") as recalculate_family_aggregation:
+        with mock.patch(
+            "shuup_product_reviews.models.get_variation_family_ids", wraps=get_variation_family_ids
+        ) as get_family_ids:
+            with mock.patch("shuup_product_reviews.utils.bump_star_rating_cache") as bump_star_rating_cache:
+                call_command("recalculate_review_aggregations", "--reviews=product", stdout=StringIO())
+    assert not recalculate_family_aggregation.called
+    assert get_family_ids.call_count == 1
+    assert sorted(call[0] for call in bump_star_rating_cache.call_args_list) == sorted(
+        [(child.pk, shop.pk) for child in children] + [(parent.pk, shop.pk), (parent.pk, shop.pk)]
+    )
+    family = ProductFamilyReviewAggregation.objects.get(product=parent)
+    assert (family.review_count, family.rating_sum) == (4, 8)
+
+
+@pytest.mark.django_db
+def test_aggregations_per_shop(settings):
+    settings.PRODUCT_REVIEWS_AGGREGATION_MODE = AGGREGATION_MODE_IMMEDIATE
+    shop1 = factories.get_default_shop()
+    shop2 = factories.get_shop(identifier="shop2", enabled=True)
+    supplier = factories.get_default_supplier()
+    product = factories.create_product("product", shop=shop1, supplier=supplier)
+    factories.create_product("product2", shop=shop2, supplier=supplier)
+
+    [create_random_review_for_product(shop1, product, rating=5) for _ in range(2)]
+    review = create_random_review_for_product(shop2, product, rating=2)
+
+    assert ProductReviewAggregation.objects.get(shop=shop1, product=product).review_count == 2
+    assert ProductReviewAggregation.objects.get(shop=shop2, product=product).review_count == 1
+    assert ProductFamilyReviewAggregation.objects.filter(product=product).count() == 2
+
+    assert get_reviews_aggregation_for_product(product, shop1)["rating"] == 5
+    assert get_reviews_aggregation_for_product(product, shop2)["rating"] == 2
+    totals = get_reviews_aggregation_for_product(product)
+    assert totals["reviews"] == 3
+    assert totals["rating"] == 4
+
+    # moving the review to another shop updates both shops
+    review.shop = shop1
+    review.save()
+    assert ProductReviewAggregation.objects.get(shop=shop1, product=product).review_count == 3
+    assert not ProductReviewAggregation.objects.filter(shop=shop2, product=product).exists()
+    assert get_reviews_aggregation_for_product(product, shop2)["rating"] is None
+
+
+@pytest.mark.django_db
+def test_windowed_aggregations():
+    shop = factories.get_default_shop()
+    product = factories.create_product("product", shop=shop, supplier=factories.get_default_supplier())
+    recent_review = create_random_review_for_product(shop, product, rating=5, would_recommend=True)
+    assert ProductReviewDailyAggregation.objects.get(product=product).review_count == 1
+
+    old_reviews = [create_random_review_for_product(shop, product, rating=2) for _ in range(2)]
+    ProductReview.objects.filter(pk__in=[review.pk for review in old_reviews]).update(
+        created_on=timezone.now() - datetime.timedelta(days=60)
+    )
+    call_command("recalculate_review_aggregations", stdout=StringIO())
+    assert ProductReviewDailyAggregation.objects.filter(product=product).count() == 2
+
+    totals = get_windowed_reviews_aggregation_for_product(product, 30, shop)
+    assert totals["reviews"] == 1
+    assert totals["rating"] == 5
+    assert totals["would_recommend"] == 1
+    totals = get_windowed_reviews_aggregation_for_product(product, 90)
+    assert totals["reviews"] == 3
+    assert totals["rating"] == 3
+
+    # the buckets are updated incrementally
+    ProductReview.objects.get(pk=old_reviews[0].pk).reject()
+    assert get_windowed_reviews_aggregation_for_product(product, 90)["reviews"] == 2
+
+    review = ProductReview.objects.get(pk=recent_review.pk)
+    review.rating = 3
+    review.save()
+    assert get_windowed_reviews_aggregation_for_product(product, 30)["rating"] == 3
+
+    review.reject()
+    assert get_windowed_reviews_aggregation_for_product(product, 30)["rating"] is None
+    assert ProductReviewDailyAggregation.objects.filter(product=product).count() == 1
+
+
+@pytest.mark.django_db
+def test_review_scores(settings):
+    settings.PRODUCT_REVIEWS_SCORE_PRIOR_WEIGHT = 2
+    shop = factories.get_default_shop()
+    supplier = factories.get_default_supplier()
+    product1 = factories.create_product("product1", shop=shop, supplier=supplier)
+    product2 = factories.create_product("product2", shop=shop, supplier=supplier)
+    product3 = factories.create_product("product3", shop=shop, supplier=supplier)
+    create_random_review_for_product(shop, product1, rating=5)
+    [create_random_review_for_product(shop, product2, rating=rating) for rating in [5, 5, 5, 5, 4]]
+    [create_random_review_for_product(shop, product3, rating=2) for _ in range(4)]
+
+    out = StringIO()
+    call_command("update_review_scores", stdout=out)
+    assert "product review aggregation: scores updated in 1 shops" in out.getvalue()
+    prior = ReviewScorePrior.objects.get(shop=shop, aggregation_model="shuup_product_reviews.ProductReviewAggregation")
+    assert prior.rating == Decimal("3.70")
+
+    # a single 5 star review ranks below a 4.8 rating from five reviews
+    assert get_top_rated_product_ids(shop) == [product2.pk, product1.pk, product3.pk]
+    assert ProductReviewAggregation.objects.get(product=product2).score == Decimal("4.4857")
+
+    # scores of new writes use the stored prior
+    create_random_review_for_product(shop, product1, rating=5)
+    assert ProductReviewAggregation.objects.get(product=product1).score == Decimal("4.3500")
+
+    out = StringIO()
+    call_command("update_review_scores", stdout=out)
+    assert "product review aggregation: scores updated in 1 shops" in out.getvalue()
+    out = StringIO()
+    call_command("update_review_scores", stdout=out)
+    assert "product review aggregation: scores updated in 0 shops" in out.getvalue()
+
+    # the scores updated in the database are rounded like the scores of the writes
+    prior = Decimal("3.70")
+    ProductReviewAggregation.objects.filter(product=product3).update(rating_sum=120, review_count=30)
+    with mock.patch("shuup_product_reviews.scores.calculate_score_prior", return_value=prior):
+        assert update_scores(ProductReviewAggregation, shop.pk, force=True)
+    for aggregation in ProductReviewAggregation.objects.filter(shop=shop):
+        assert aggregation.score == get_score(aggregation.rating_sum, aggregation.review_count, prior)
+    assert ProductReviewAggregation.objects.get(product=product3).score == Decimal("3.9813")
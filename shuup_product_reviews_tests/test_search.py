@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup Product Reviews Addon.
+#
+# Copyright (c) 2012-2019, Shoop Commerce Ltd. All rights reserved.
+#
+# This source code is licensed under the OSL-3.0 license found in the
+# LICENSE file in the root directory of this source tree.
+import json
+
+import pytest
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.client import Client
+
+from shuup.core.models import Supplier
+from shuup.testing import factories
+from shuup_product_reviews.models import ProductReview
+from shuup_product_reviews.search import (
+    CommentSearch, get_comment_search, search_comments, SQLiteCommentSearch
+)
+from shuup_vendor_reviews.models import VendorReview
+
+from .factories import (
+    create_multi_supplier_order_to_review, create_random_review_for_product,
+    create_vendor_review_for_order_line
+)
+
+COMMENTS = [
+    "Fast delivery and great quality!",
+    "The quality is poor, would not buy again.",
+    "Delivered late but the product is great.",
+    "",
+]
+
+
+def get_found_comments(query, queryset=None):
+    queryset = (ProductReview.objects.all() if queryset is None else queryset)
+    return set(search_comments(queryset, query).values_list("comment", flat=True))
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("backend", [
+    "shuup_product_reviews.search.CommentSearch",
+    "shuup_product_reviews.search.SQLiteCommentSearch",
+])
+def test_search_comments(settings, backend):
+    settings.PRODUCT_REVIEWS_COMMENT_SEARCH_BACKENDS = {"sqlite": backend}
+    assert isinstance(get_comment_search(connection), CommentSearch)
+    shop = factories.get_default_shop()
+    product = factories.create_product("product", shop=shop, supplier=factories.get_default_supplier())
+    reviews = [create_random_review_for_product(shop, product) for _ in COMMENTS]
+    for (review, comment) in zip(reviews, COMMENTS):
+        review.comment = comment
+        review.save()
+
+    assert get_found_comments("great") == set([COMMENTS[0], COMMENTS[2]])
+    assert get_found_comments("Great QUALITY") == set([COMMENTS[0]])
+    assert get_found_comments("deliver") == set([COMMENTS[0], COMMENTS[2]])
+    assert get_found_comments("terrible") == set()
+    # the search is not parsed as a query, only its words are matched
+    assert get_found_comments('great" OR "poor') == set()
+    assert get_found_comments("great -") == set([COMMENTS[0], COMMENTS[2]])
+    assert get_found_comments(" * ") == set(COMMENTS)
+    assert get_found_comments("great", ProductReview.objects.filter(pk=reviews[2].pk)) == set([COMMENTS[2]])
+
+    # the index follows the saved and deleted comments
+    reviews[1].comment = "Great value for the money."
+    reviews[1].save()
+    reviews[2].delete()
+    assert get_found_comments("great") == set([COMMENTS[0], reviews[1].comment])
+    assert get_found_comments("poor") == set()
+
+
+@pytest.mark.django_db
+def test_search_index_installed():
+    if not SQLiteCommentSearch().is_available():
+        pytest.skip("SQLite without FTS5")
+    search = get_comment_search(connection)
+    assert isinstance(search, SQLiteCommentSearch)
+    tables = connection.introspection.table_names()
+    assert search.get_table(ProductReview) in tables
+    assert search.get_table(VendorReview) in tables
+
+
+@pytest.mark.django_db
+def test_search_index_missing():
+    if not SQLiteCommentSearch().is_available():
+        pytest.skip("SQLite without FTS5")
+    search = SQLiteCommentSearch()
+    with connection.cursor() as cursor:
+        cursor.execute("DROP TABLE %s" % connection.ops.quote_name(search.get_table(ProductReview)))
+    SQLiteCommentSearch._installed.clear()
+    try:
+        shop = factories.get_default_shop()
+        product = factories.create_product("product", shop=shop, supplier=factories.get_default_supplier())
+        reviews = [create_random_review_for_product(shop, product) for _ in COMMENTS]
+        for (review, comment) in zip(reviews, COMMENTS):
+            review.comment = comment
+            review.save()
+        reviews[1].delete()
+
+        # the comments are searched without the index
+        assert not search.is_installed(ProductReview, connection)
+        assert get_found_comments("great") == set([COMMENTS[0], COMMENTS[2]])
+
+        search.install(ProductReview, connection)
+        assert search.is_installed(ProductReview, connection)
+        assert get_found_comments("great") == set([COMMENTS[0], COMMENTS[2]])
+    finally:
+        SQLiteCommentSearch._installed.clear()
+
+
+@pytest.mark.django_db
+def test_search_vendor_comments():
+    shop = factories.get_default_shop()
+    customer = factories.create_random_person("en")
+    product = factories.create_product("product", shop=shop, default_price=10)
+    shop_product = product.get_shop_instance(shop=shop)
+    for index in range(len(COMMENTS)):
+        shop_product.suppliers.add(Supplier.objects.create(identifier=str(index), name="Supplier %d" % index))
+
+    order = create_multi_supplier_order_to_review(shop_product, customer)
+    for (order_line, comment) in zip(order.lines.order_by("supplier__identifier"), COMMENTS):
+        create_vendor_review_for_order_line(order_line, 4, comment)
+    assert get_found_comments("great", VendorReview.objects.all()) == set([COMMENTS[0], COMMENTS[2]])
+
+
+@pytest.mark.django_db
+def test_comments_view_search():
+    shop = factories.get_default_shop()
+    product = factories.create_product("product", shop=shop, supplier=factories.get_default_supplier())
+    for comment in COMMENTS * 3:
+        review = create_random_review_for_product(shop, product)
+        review.comment = comment
+        review.save()
+    client = Client()
+
+    comments = []
+    url = reverse("shuup:product_review_comments", kwargs=dict(pk=product.pk))
+    params = {"q": "great"}
+    while url:
+        data = json.loads(client.get(url, params).content.decode("utf-8"))
+        comments.extend(review["comment"] for review in data["reviews"])
+        url = data["next_page_url"]
+        if url:
+            assert "q=great" in url
+        params = {}
+    assert sorted(comments) == sorted([COMMENTS[0], COMMENTS[2]] * 3)
+
+
+@pytest.mark.django_db
+def test_admin_list_view_search(admin_user):
+    shop = factories.get_default_shop()
+    product = factories.create_product("product", shop=shop, supplier=factories.get_default_supplier())
+    for comment in COMMENTS:
+        review = create_random_review_for_product(shop, product)
+        review.comment = comment
+        review.save()
+
+    client = Client()
+    client.login(username=admin_user.username, password="password")
+    response = client.get(reverse("shuup_admin:product_reviews.list"), data={"jq": json.dumps({
+        "perPage": 100, "page": 1, "filters": {"comment": "quality"}
+    })})
+    assert response.status_code == 200
+    items = json.loads(response.content.decode("utf-8"))["items"]
+    assert set(item["comment"] for item in items) == set([COMMENTS[0], COMMENTS[1]])
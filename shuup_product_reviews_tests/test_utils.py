@@ -5,14 +5,22 @@
 #
 # This source code is licensed under the OSL-3.0 license found in the
 # LICENSE file in the root directory of this source tree.
+import mock
 import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import translation
+from django.utils.six import StringIO
 
 from shuup import configuration
 from shuup.core.models import OrderStatus, ProductType
 from shuup.testing import factories
 from shuup_product_reviews.utils import (
-    get_pending_products_reviews, get_reviews_aggregation_for_product,
-    render_product_review_ratings
+    bump_star_rating_cache, get_pending_products_reviews,
+    get_reviews_aggregation_for_product, render_product_review_ratings,
+    render_product_review_ratings_many
 )
 
 from .factories import create_random_review_for_product
@@ -38,6 +46,102 @@ def test_comments_view():
         assert rendered == ""
 
 
+@pytest.mark.django_db
+def test_render_star_ratings_many():
+    cache.clear()
+    shop = factories.get_default_shop()
+    supplier = factories.get_default_supplier()
+    products = [factories.create_product("product-%d" % index, shop=shop, supplier=supplier) for index in range(4)]
+    for product in products[:3]:
+        [create_random_review_for_product(shop, product) for _ in range(2)]
+
+    for product in products:
+        product.refresh_from_db()
+
+    rendered = render_product_review_ratings_many(products, shop=shop)
+    assert set(rendered.keys()) == set(product.pk for product in products)
+    for product in products[:3]:
+        assert rendered[product.pk] == render_product_review_ratings(product, shop=shop)
+        assert "%d reviews" % get_reviews_aggregation_for_product(product, shop)["reviews"] in rendered[product.pk]
+    assert rendered[products[3].pk] == ""
+
+    # everything is served from the cache now
+    with CaptureQueriesContext(connection) as context:
+        assert render_product_review_ratings_many(products, shop=shop) == rendered
+    assert len(context.captured_queries) == 0
+
+
+@pytest.mark.django_db
+def test_star_rating_variants():
+    cache.clear()
+    shop = factories.get_default_shop()
+    product = factories.create_product("product", shop=shop, supplier=factories.get_default_supplier())
+    [create_random_review_for_product(shop, product) for _ in range(3)]
+
+    rendered = render_product_review_ratings(product, shop=shop)
+    assert "product-reviews-rating-star" in rendered
+
+    # other variants are rendered from the cached totals without querying the reviews
+    with CaptureQueriesContext(connection) as context:
+        minified = render_product_review_ratings(product, minified=True, shop=shop)
+        titled = render_product_review_ratings(product, customer_ratings_title="Our customers", shop=shop)
+        with translation.override("fi"):
+            render_product_review_ratings(product, shop=shop)
+    assert len(context.captured_queries) == 0
+    assert minified != rendered
+    assert "Our customers" in titled and "Our customers" not in rendered
+
+    # bumping the product drops the totals and all the variants
+    bump_star_rating_cache(product.pk)
+    with CaptureQueriesContext(connection) as context:
+        assert render_product_review_ratings(product, minified=True, shop=shop) == minified
+    assert len(context.captured_queries) == 1
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("top", [None, 1])
+def test_warm_star_rating_caches(top):
+    cache.clear()
+    shop = factories.get_default_shop()
+    supplier = factories.get_default_supplier()
+    products = [factories.create_product("product-%d" % index, shop=shop, supplier=supplier) for index in range(3)]
+    for (index, product) in enumerate(products[:2]):
+        [create_random_review_for_product(shop, product) for _ in range(index + 1)]
+
+    output = StringIO()
+    call_command("warm_star_rating_caches", "--shop=%d" % shop.pk, reviews=["product"], top=top, stdout=output)
+    assert "product: %d star ratings cached" % (top or 3) in output.getvalue()
+
+    for product in products:
+        with CaptureQueriesContext(connection) as context:
+            render_product_review_ratings(product, shop=shop)
+            render_product_review_ratings(product, minified=True, shop=shop)
+        # only the most reviewed product was warmed up
+        assert len(context.captured_queries) == (1 if top and product != products[1] else 0)
+
+
+@pytest.mark.django_db
+def test_warm_star_rating_cache_on_moderation(settings):
+    settings.PRODUCT_REVIEWS_WARM_CACHE_ON_MODERATION = True
+    cache.clear()
+    shop = factories.get_default_shop()
+    product = factories.create_product("product", shop=shop, supplier=factories.get_default_supplier())
+    review = create_random_review_for_product(shop, product, approved=False)
+    assert render_product_review_ratings(product, shop=shop) == ""
+
+    commit_hooks = []
+    with mock.patch("shuup_product_reviews.aggregation.transaction.on_commit", side_effect=commit_hooks.append):
+        review.approve()
+    for commit_hook in commit_hooks:
+        commit_hook()
+
+    # the star rating was rendered right after the commit
+    with CaptureQueriesContext(connection) as context:
+        rendered = render_product_review_ratings(product, shop=shop)
+    assert len(context.captured_queries) == 0
+    assert "1 review" in rendered
+
+
 @pytest.mark.django_db
 def test_ignored_products(rf):
     shop = factories.get_default_shop()
@@ -59,3 +59,7 @@ def test_rejecting_all_reviews_multiple_suppliers():
         totals = get_reviews_aggregation_for_supplier(Supplier.objects.get(identifier=identifier))
         assert totals["rating"] == (rating1 + rating2) / 2
         assert totals["reviews"] == 2
+        rating_counts = [0] * 5
+        rating_counts[rating1 - 1] += 1
+        rating_counts[rating2 - 1] += 1
+        assert totals["rating_counts"] == rating_counts
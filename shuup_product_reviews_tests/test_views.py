@@ -11,12 +11,17 @@ import random
 import pytest
 from bs4 import BeautifulSoup
 from django.conf import settings
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.test.client import Client
+from django.test.utils import CaptureQueriesContext, override_settings
 from faker import Faker
 
 from shuup.testing import factories
 from shuup.testing.soup_utils import extract_form_fields
+from shuup_product_reviews.models import ProductReview
+from shuup_product_reviews.views import ProductReviewCommentsView
 
 from .factories import (
     create_random_order_to_review, create_random_review_for_product,
@@ -138,3 +143,178 @@ def test_comments_view():
     assert len(data["reviews"]) == settings.PRODUCT_REVIEWS_PAGE_SIZE
     # no more pages
     assert data["next_page_url"] is None
+
+
+@pytest.mark.django_db
+def test_comments_view_cursor_pages():
+    shop = factories.get_default_shop()
+    product = factories.create_product("product", shop=shop, supplier=factories.get_default_supplier())
+    reviews = [create_random_review_for_product(shop, product) for _ in range(12)]
+    # reviews created at the same time are paged by id
+    ProductReview.objects.filter(pk__in=[review.pk for review in reviews[3:9]]).update(
+        created_on=reviews[3].created_on
+    )
+    client = Client()
+
+    review_ids = []
+    url = reverse("shuup:product_review_comments", kwargs=dict(pk=product.pk))
+    while url:
+        with CaptureQueriesContext(connection) as context:
+            data = json.loads(client.get(url).content.decode("utf-8"))
+        assert not [query for query in context.captured_queries if "COUNT(" in query["sql"]]
+        assert len(data["reviews"]) <= settings.PRODUCT_REVIEWS_PAGE_SIZE
+        review_ids.extend(review["id"] for review in data["reviews"])
+        url = data["next_page_url"]
+        assert not url or "cursor=" in url
+
+    assert review_ids == list(ProductReview.objects.order_by("-created_on", "-pk").values_list("pk", flat=True))
+
+    # an invalid cursor returns the first page
+    response = client.get(reverse("shuup:product_review_comments", kwargs=dict(pk=product.pk)) + "?cursor=invalid")
+    first_page = json.loads(response.content.decode("utf-8"))["reviews"]
+    assert [review["id"] for review in first_page] == review_ids[:settings.PRODUCT_REVIEWS_PAGE_SIZE]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("sort,rating,ordering", [
+    ("newest", None, ("-created_on", "-pk")),
+    ("highest", None, ("-rating", "-created_on", "-pk")),
+    ("lowest", None, ("rating", "created_on", "pk")),
+    ("lowest", 3, ("rating", "created_on", "pk")),
+    ("invalid", 5, ("-created_on", "-pk")),
+])
+def test_comments_view_sort_and_rating(sort, rating, ordering):
+    shop = factories.get_default_shop()
+    product = factories.create_product("product", shop=shop, supplier=factories.get_default_supplier())
+    reviews = [create_random_review_for_product(shop, product, rating=(index % 3) + 3) for index in range(13)]
+    ProductReview.objects.filter(pk__in=[review.pk for review in reviews[2:8]]).update(
+        created_on=reviews[2].created_on
+    )
+    client = Client()
+
+    review_ids = []
+    url = reverse("shuup:product_review_comments", kwargs=dict(pk=product.pk))
+    params = {"sort": sort}
+    if rating:
+        params["rating"] = rating
+    while url:
+        data = json.loads(client.get(url, params).content.decode("utf-8"))
+        review_ids.extend(review["id"] for review in data["reviews"])
+        url = data["next_page_url"]
+        # the next page url has the sort and filter parameters
+        params = {}
+
+    expected_reviews = ProductReview.objects.order_by(*ordering)
+    if rating:
+        expected_reviews = expected_reviews.filter(rating=rating)
+    assert review_ids == list(expected_reviews.values_list("pk", flat=True))
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("page", [None, "1", "2"])
+def test_comments_view_query_count(rf, page):
+    shop = factories.get_default_shop()
+    product = factories.create_product("product", shop=shop, supplier=factories.get_default_supplier())
+    # every review has its own reviewer
+    [create_random_review_for_product(shop, product) for _ in range(12)]
+
+    request = rf.get("/", {"page": page} if page else {})
+    request.shop = shop
+    with CaptureQueriesContext(connection) as context:
+        response = ProductReviewCommentsView.as_view()(request, pk=product.pk)
+    data = json.loads(response.content.decode("utf-8"))
+    assert len(data["reviews"]) == settings.PRODUCT_REVIEWS_PAGE_SIZE
+    assert set(data["reviews"][0].keys()) == set(["id", "date", "rating", "comment", "reviewer"])
+    review = ProductReview.objects.get(pk=data["reviews"][0]["id"])
+    assert data["reviews"][0]["reviewer"] == review.reviewer.name
+    assert data["reviews"][0]["date"] == review.created_on.isoformat()
+
+    # the product, its variation children and the reviews with their
+    # reviewers, plus the count of the numbered pages
+    assert len(context.captured_queries) == (4 if page else 3)
+
+
+@pytest.mark.django_db
+@override_settings(PRODUCT_REVIEWS_AGGREGATION_MODE="immediate")
+def test_comments_view_conditional_get():
+    cache.clear()
+    shop = factories.get_default_shop()
+    product = factories.create_product("product", shop=shop, supplier=factories.get_default_supplier())
+    [create_random_review_for_product(shop, product) for _ in range(3)]
+    client = Client()
+    url = reverse("shuup:product_review_comments", kwargs=dict(pk=product.pk))
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert "max-age=0" in response["Cache-Control"]
+    etag = response["ETag"]
+    last_modified = response["Last-Modified"]
+
+    # an unchanged page is not modified and the reviews are not queried
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert not [query for query in context.captured_queries if "shuup_product_reviews" in query["sql"]]
+    assert client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code == 304
+
+    # other pages have other versions
+    assert client.get(url + "?page=2", HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+    # a new review changes the version
+    create_random_review_for_product(shop, product)
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+
+
+@pytest.mark.django_db
+@override_settings(PRODUCT_REVIEWS_AGGREGATION_MODE="immediate")
+def test_many_comments_view():
+    cache.clear()
+    shop = factories.get_default_shop()
+    supplier = factories.get_default_supplier()
+    products = [factories.create_product("product-%d" % index, shop=shop, supplier=supplier) for index in range(3)]
+    for (product, review_count) in zip(products, [7, 1, 0]):
+        [create_random_review_for_product(shop, product) for _ in range(review_count)]
+    client = Client()
+    url = reverse("shuup:product_review_comments_many")
+    ids = "%d,%d,%d,%d,x" % (products[0].pk, products[1].pk, products[2].pk, products[0].pk)
+
+    data = json.loads(client.get(url, {"ids": ids, "limit": 2}).content.decode("utf-8"))
+    results = data["results"]
+    assert set(results.keys()) == set(str(product.pk) for product in products)
+    assert len(results[str(products[1].pk)]["reviews"]) == 1
+    assert results[str(products[1].pk)]["next_page_url"] is None
+    assert results[str(products[2].pk)] == {"reviews": [], "next_page_url": None}
+
+    # the next page continues after the limited reviews
+    review_ids = [review["id"] for review in results[str(products[0].pk)]["reviews"]]
+    next_page_url = results[str(products[0].pk)]["next_page_url"]
+    while next_page_url:
+        page = json.loads(client.get(next_page_url).content.decode("utf-8"))
+        review_ids.extend(review["id"] for review in page["reviews"])
+        next_page_url = page["next_page_url"]
+    expected_reviews = ProductReview.objects.filter(product=products[0]).order_by("-created_on", "-pk")
+    assert review_ids == list(expected_reviews.values_list("pk", flat=True))
+
+    # the first pages are cached
+    with CaptureQueriesContext(connection) as context:
+        data = json.loads(client.get(url, {"ids": ids}).content.decode("utf-8"))
+    assert not [query for query in context.captured_queries if "shuup_product_reviews" in query["sql"]]
+    assert len(data["results"][str(products[0].pk)]["reviews"]) == settings.PRODUCT_REVIEWS_PAGE_SIZE
+
+    # the products and their variation children are read at once, then one page per product
+    cache.clear()
+    with CaptureQueriesContext(connection) as context:
+        client.get(url, {"ids": ids})
+    queries = [query["sql"] for query in context.captured_queries]
+    assert len([sql for sql in queries if 'FROM "shuup_product" ' in sql]) == 2
+    assert len([sql for sql in queries if 'FROM "shuup_product_reviews_productreview" ' in sql]) == len(products)
+
+    # a new review changes the first page of its product
+    review = create_random_review_for_product(shop, products[2])
+    data = json.loads(client.get(url, {"ids": ids}).content.decode("utf-8"))
+    assert [review["id"] for review in data["results"][str(products[2].pk)]["reviews"]] == [review.pk]
+
+    too_many_ids = ",".join(str(index) for index in range(21))
+    assert client.get(url, {"ids": too_many_ids}).status_code == 400
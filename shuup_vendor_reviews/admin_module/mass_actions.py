@@ -5,12 +5,13 @@
 #
 # This source code is licensed under the OSL-3.0 license found in the
 # LICENSE file in the root directory of this source tree.
-from django.db.models import Q
 from django.utils.translation import ugettext_lazy as _
-from six import string_types
 
-from shuup.admin.shop_provider import get_shop
 from shuup.admin.utils.picotable import PicotableMassAction
+from shuup_product_reviews.admin_module.mass_actions import (
+    update_review_status
+)
+from shuup_product_reviews.enums import ReviewStatus
 from shuup_vendor_reviews.models import VendorReview
 
 
@@ -19,13 +20,7 @@ class ApproveVendorReviewMassAction(PicotableMassAction):
     identifier = "mass_action_approve_vendor_reviews"
 
     def process(self, request, ids):
-        query = Q(shop=get_shop(request))
-
-        if not (isinstance(ids, string_types) and ids == "all"):
-            query &= Q(id__in=ids)
-
-        for vendor_review in VendorReview.objects.only("pk").filter(query):
-            vendor_review.approve()
+        update_review_status(request, VendorReview, ids, ReviewStatus.APPROVED)
 
 
 class RejectVendorReviewMassAction(PicotableMassAction):
@@ -33,10 +28,4 @@ class RejectVendorReviewMassAction(PicotableMassAction):
     identifier = "mass_action_reject_vendor_reviews"
 
     def process(self, request, ids):
-        query = Q(shop=get_shop(request))
-
-        if not (isinstance(ids, string_types) and ids == "all"):
-            query &= Q(id__in=ids)
-
-        for vendor_review in VendorReview.objects.only("pk").filter(query):
-            vendor_review.reject()
+        update_review_status(request, VendorReview, ids, ReviewStatus.REJECTED)
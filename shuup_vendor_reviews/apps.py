@@ -32,6 +32,9 @@ class AppConfig(shuup.apps.AppConfig):
         "xtheme_resource_injection": [
             "shuup_vendor_reviews.resources:add_resources"
         ],
+        "front_template_helper_namespace": [
+            "shuup_vendor_reviews.template_helpers.VendorReviewsTemplateHelpers"
+        ],
         "notify_event": [
             "shuup_vendor_reviews.notify_events.VendorReviewCreated"
         ],
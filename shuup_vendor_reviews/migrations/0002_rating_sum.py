@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+APPROVED = 2
+
+
+def populate_rating_sum(apps, schema_editor):
+    VendorReview = apps.get_model("shuup_vendor_reviews", "VendorReview")
+    VendorReviewAggregation = apps.get_model("shuup_vendor_reviews", "VendorReviewAggregation")
+    rating_sums = VendorReview.objects.filter(status=APPROVED).values("supplier_id").annotate(rating_sum=Sum("rating"))
+    for row in rating_sums.iterator():
+        VendorReviewAggregation.objects.filter(supplier_id=row["supplier_id"]).update(rating_sum=row["rating_sum"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shuup_vendor_reviews', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vendorreviewaggregation',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, verbose_name='rating sum'),
+        ),
+        migrations.RunPython(populate_rating_sum, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Case, Sum, Value, When
+
+APPROVED = 2
+RATING_COUNT_FIELDS = tuple("rating_%d_count" % stars for stars in range(1, 6))
+
+
+def _count_when(**conditions):
+    return Sum(Case(When(then=Value(1), **conditions), default=Value(0), output_field=models.PositiveIntegerField()))
+
+
+def populate_rating_counts(apps, schema_editor):
+    VendorReview = apps.get_model("shuup_vendor_reviews", "VendorReview")
+    VendorReviewAggregation = apps.get_model("shuup_vendor_reviews", "VendorReviewAggregation")
+    rating_counts = VendorReview.objects.filter(status=APPROVED).order_by().values("supplier_id").annotate(
+        **dict((field, _count_when(rating=stars)) for (stars, field) in enumerate(RATING_COUNT_FIELDS, 1))
+    )
+    for row in rating_counts.iterator():
+        VendorReviewAggregation.objects.filter(supplier_id=row.pop("supplier_id")).update(**row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shuup_vendor_reviews', '0002_rating_sum'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vendorreviewaggregation',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='1 star reviews'),
+        ),
+        migrations.AddField(
+            model_name='vendorreviewaggregation',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='2 star reviews'),
+        ),
+        migrations.AddField(
+            model_name='vendorreviewaggregation',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='3 star reviews'),
+        ),
+        migrations.AddField(
+            model_name='vendorreviewaggregation',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='4 star reviews'),
+        ),
+        migrations.AddField(
+            model_name='vendorreviewaggregation',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='5 star reviews'),
+        ),
+        migrations.RunPython(populate_rating_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from decimal import Decimal
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Case, Count, Sum, Value, When
+
+APPROVED = 2
+RATING_COUNT_FIELDS = tuple("rating_%d_count" % stars for stars in range(1, 6))
+
+
+def _count_when(**conditions):
+    return Sum(Case(When(then=Value(1), **conditions), default=Value(0), output_field=models.PositiveIntegerField()))
+
+
+def delete_aggregations(apps, schema_editor):
+    apps.get_model("shuup_vendor_reviews", "VendorReviewAggregation").objects.all().delete()
+
+
+def rebuild_shop_aggregations(apps, schema_editor):
+    VendorReview = apps.get_model("shuup_vendor_reviews", "VendorReview")
+    VendorReviewAggregation = apps.get_model("shuup_vendor_reviews", "VendorReviewAggregation")
+
+    suppliers = VendorReview.objects.filter(status=APPROVED).order_by().values("shop_id", "supplier_id").annotate(
+        review_count=Count("pk"),
+        rating_sum=Sum("rating"),
+        would_recommend=_count_when(would_recommend=True),
+        **dict((field, _count_when(rating=stars)) for (stars, field) in enumerate(RATING_COUNT_FIELDS, 1))
+    )
+    VendorReviewAggregation.objects.bulk_create([
+        VendorReviewAggregation(
+            rating=(Decimal(row["rating_sum"]) / row["review_count"]).quantize(Decimal("0.1")),
+            **row
+        )
+        for row in suppliers
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shuup', '0057_remove_product_stock_behavior'),
+        ('shuup_vendor_reviews', '0003_rating_histogram'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_aggregations, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='vendorreviewaggregation',
+            name='shop',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='supplier_reviews_aggregations', to='shuup.Shop', verbose_name='shop'),
+        ),
+        migrations.AlterField(
+            model_name='vendorreviewaggregation',
+            name='supplier',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='supplier_reviews_aggregation', to='shuup.Supplier', verbose_name='supplier'),
+        ),
+        migrations.RunPython(rebuild_shop_aggregations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shuup_vendor_reviews', '0004_shop_aggregations'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='vendorreviewaggregation',
+            unique_together=set([('shop', 'supplier')]),
+        ),
+    ]
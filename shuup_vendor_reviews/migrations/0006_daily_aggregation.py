@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Case, Count, Sum, Value, When
+from django.db.models.functions import TruncDate
+
+APPROVED = 2
+
+
+def populate_daily_aggregations(apps, schema_editor):
+    VendorReview = apps.get_model("shuup_vendor_reviews", "VendorReview")
+    VendorReviewDailyAggregation = apps.get_model("shuup_vendor_reviews", "VendorReviewDailyAggregation")
+    days = VendorReview.objects.filter(status=APPROVED).order_by().values(
+        "shop_id", "supplier_id", date=TruncDate("created_on")
+    ).annotate(
+        review_count=Count("pk"),
+        rating_sum=Sum("rating"),
+        would_recommend=Sum(Case(
+            When(would_recommend=True, then=Value(1)), default=Value(0), output_field=models.PositiveIntegerField()
+        ))
+    )
+    VendorReviewDailyAggregation.objects.bulk_create([
+        VendorReviewDailyAggregation(**row) for row in days
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shuup', '0057_remove_product_stock_behavior'),
+        ('shuup_vendor_reviews', '0005_shop_aggregations_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VendorReviewDailyAggregation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='date')),
+                ('review_count', models.PositiveIntegerField(default=0, verbose_name='review count')),
+                ('rating_sum', models.PositiveIntegerField(default=0, verbose_name='rating sum')),
+                ('would_recommend', models.PositiveIntegerField(default=0, verbose_name='users would recommend')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='supplier_reviews_daily_aggregations', to='shuup.Shop', verbose_name='shop')),
+                ('supplier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='supplier_reviews_daily_aggregations', to='shuup.Supplier', verbose_name='supplier')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='vendorreviewdailyaggregation',
+            unique_together=set([('shop', 'supplier', 'date')]),
+        ),
+        migrations.RunPython(populate_daily_aggregations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shuup_vendor_reviews', '0007_review_scores'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='vendorreview',
+            index_together=set([
+                ('supplier', 'shop', 'status', 'created_on', 'id'),
+                ('supplier', 'shop', 'status', 'rating', 'created_on', 'id')
+            ]),
+        ),
+    ]
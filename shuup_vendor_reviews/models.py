@@ -7,11 +7,15 @@
 # LICENSE file in the root directory of this source tree.
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
-from django.db.models import Avg, Case, Count, Sum, Value, When
 from django.utils.translation import ugettext_lazy as _
 from enumfields import EnumIntegerField
 
+from shuup.core.models import Shop
+from shuup_product_reviews.aggregation import AggregatedReviewMixin
 from shuup_product_reviews.enums import ReviewStatus
+from shuup_product_reviews.models import (
+    BaseDailyReviewAggregation, BaseReviewAggregation
+)
 
 
 class VendorReviewQuerySet(models.QuerySet):
@@ -22,7 +26,7 @@ class VendorReviewQuerySet(models.QuerySet):
         return self.filter(status=ReviewStatus.APPROVED)
 
 
-class VendorReview(models.Model):
+class VendorReview(AggregatedReviewMixin, models.Model):
     shop = models.ForeignKey("shuup.Shop", verbose_name=_("shop"), related_name="supplier_reviews")
     supplier = models.ForeignKey("shuup.Supplier", verbose_name=_("supplier"), related_name="supplier_reviews")
     reviewer = models.ForeignKey("shuup.Contact", verbose_name=_("reviewer"), related_name="supplier_reviews")
@@ -42,72 +46,73 @@ class VendorReview(models.Model):
 
     objects = VendorReviewQuerySet.as_manager()
 
+    class Meta:
+        # the comments of the reviewed object in every sort order and rating, see `COMMENT_SORTS`
+        index_together = [
+            ("supplier", "shop", "status", "created_on", "id"),
+            ("supplier", "shop", "status", "rating", "created_on", "id"),
+        ]
+
+    aggregation_field = "supplier"
+    aggregation_model = "shuup_vendor_reviews.VendorReviewAggregation"
+    daily_aggregation_model = "shuup_vendor_reviews.VendorReviewDailyAggregation"
+
     def __str__(self):
         return _("Review for {supplier} by {reviewer_name}").format(
             supplier=self.supplier,
             reviewer_name=self.reviewer.name
         )
 
-    def save(self, *args, **kwargs):
-        super(VendorReview, self).save(*args, **kwargs)
-        recalculate_aggregation(self.supplier)
+    @classmethod
+    def bump_aggregation_caches(cls, keys):
         from shuup_vendor_reviews.utils import bump_star_rating_cache
-        bump_star_rating_cache(self.supplier.pk)
+        for (shop_id, supplier_id) in keys:
+            bump_star_rating_cache(supplier_id, shop_id)
+
+    @classmethod
+    def warm_aggregation_cache(cls, key):
+        from shuup_vendor_reviews.utils import warm_star_rating_caches
+        (shop_id, supplier_id) = key
+        warm_star_rating_caches([supplier_id], Shop.objects.get(pk=shop_id))
 
     def approve(self):
         self.status = ReviewStatus.APPROVED
         self.save()
+        self.warm_aggregation_cache_on_commit()
 
     def reject(self):
         self.status = ReviewStatus.REJECTED
         self.save()
+        self.warm_aggregation_cache_on_commit()
 
 
-class VendorReviewAggregation(models.Model):
-    supplier = models.OneToOneField(
+class VendorReviewAggregation(BaseReviewAggregation):
+    shop = models.ForeignKey("shuup.Shop", verbose_name=_("shop"), related_name="supplier_reviews_aggregations")
+    supplier = models.ForeignKey(
         "shuup.Supplier",
         verbose_name=_("supplier"),
         related_name="supplier_reviews_aggregation",
     )
-    rating = models.DecimalField(max_digits=2, decimal_places=1, verbose_name=_("rating"), default=0)
-    review_count = models.PositiveIntegerField(verbose_name=_("review count"), default=0)
-    would_recommend = models.PositiveIntegerField(verbose_name=_("users would recommend"), default=0)
 
+    class Meta:
+        unique_together = ("shop", "supplier")
+        index_together = ("shop", "score")
 
-def recalculate_aggregation_for_queryset(queryset):
-    if not queryset.exists():
-        # Make sure there is no aggregation since there is no approved reviews
-        return
 
-    return queryset.aggregate(
-        count=Count("pk"),
-        rating=Avg("rating"),
-        would_recommend=Sum(
-            Case(
-                When(would_recommend=True, then=Value(1)),
-                When(would_recommend=False, then=Value(0)),
-                default=Value(0),
-                output_field=models.PositiveIntegerField()
-            )
-        )
+class VendorReviewDailyAggregation(BaseDailyReviewAggregation):
+    shop = models.ForeignKey("shuup.Shop", verbose_name=_("shop"), related_name="supplier_reviews_daily_aggregations")
+    supplier = models.ForeignKey(
+        "shuup.Supplier",
+        verbose_name=_("supplier"),
+        related_name="supplier_reviews_daily_aggregations",
     )
 
+    class Meta:
+        unique_together = ("shop", "supplier", "date")
+
 
 def recalculate_aggregation(supplier):
     if not supplier:
         return
 
-    reviews_agg = recalculate_aggregation_for_queryset(
-        VendorReview.objects.filter(supplier=supplier, status=ReviewStatus.APPROVED)
-    )
-    if not reviews_agg:
-        aggregation = VendorReviewAggregation.objects.filter(supplier=supplier).first()
-        if aggregation:
-            aggregation.delete()
-        return
-
-    VendorReviewAggregation.objects.update_or_create(supplier=supplier, defaults=dict(
-        review_count=reviews_agg["count"],
-        rating=reviews_agg["rating"],
-        would_recommend=reviews_agg["would_recommend"]
-    ))
+    VendorReview.recalculate_aggregations_for_object(supplier.pk)
@@ -7,15 +7,19 @@
 # LICENSE file in the root directory of this source tree.
 from __future__ import unicode_literals
 
+import json
+
 from django import forms
 from django.utils.translation import ugettext_lazy as _
 
 from shuup.xtheme import TemplatedPlugin
 from shuup.xtheme.plugins.forms import TranslatableField
-from shuup_vendor_reviews.models import VendorReview
+from shuup_product_reviews.utils import get_rating_histogram
 from shuup_vendor_reviews.utils import (
-    get_reviews_aggregation_for_supplier, get_stars_from_rating
+    get_cached_reviews_aggregation_for_supplier, get_stars_from_rating,
+    has_vendor_review_comments
 )
+from shuup_vendor_reviews.views import VendorReviewCommentsView
 
 
 class VendorReviewStarRatingsPlugin(TemplatedPlugin):
@@ -35,6 +39,12 @@ class VendorReviewStarRatingsPlugin(TemplatedPlugin):
             required=False,
             initial=False,
             help_text=_("Whether to show number of customers that recommend the vendor.")
+        )),
+        ("show_rating_histogram", forms.BooleanField(
+            label=_("Show rating histogram"),
+            required=False,
+            initial=False,
+            help_text=_("Whether to show the number of reviews for each star rating.")
         ))
     ]
 
@@ -43,7 +53,7 @@ class VendorReviewStarRatingsPlugin(TemplatedPlugin):
         supplier = context["supplier"]
 
         if supplier and supplier.enabled:
-            supplier_rating = get_reviews_aggregation_for_supplier(supplier)
+            supplier_rating = get_cached_reviews_aggregation_for_supplier(supplier, context["request"].shop)
             if supplier_rating["reviews"]:
                 rating = supplier_rating["rating"]
                 reviews = supplier_rating["reviews"]
@@ -56,7 +66,9 @@ class VendorReviewStarRatingsPlugin(TemplatedPlugin):
                     "rating": rating,
                     "would_recommend": supplier_rating["would_recommend"],
                     "would_recommend_perc": supplier_rating["would_recommend"] / reviews,
+                    "rating_histogram": get_rating_histogram(supplier_rating["rating_counts"], reviews),
                     "show_recommenders": self.config.get("show_recommenders", False),
+                    "show_rating_histogram": self.config.get("show_rating_histogram", False),
                     "customer_ratings_title": self.get_translated_value("customer_ratings_title")
                 })
 
@@ -85,6 +97,15 @@ class VendorReviewCommentsPlugin(TemplatedPlugin):
             required=False,
             initial=_("Load more comments")
         )),
+        ("embed_first_page", forms.BooleanField(
+            label=_("Render the first page of reviews with the page"),
+            required=False,
+            initial=False,
+            help_text=_(
+                "Whether to include the first page of reviews in the page instead of loading "
+                "it after the page has loaded. The next pages are always loaded on demand."
+            )
+        )),
     ]
 
     def get_context_data(self, context):
@@ -92,12 +113,15 @@ class VendorReviewCommentsPlugin(TemplatedPlugin):
         supplier = context["supplier"]
 
         if supplier and supplier.enabled:
-            reviews = VendorReview.objects.approved().filter(
-                shop=context["request"].shop,
-                supplier=supplier,
-                comment__isnull=False
-            )
-            if reviews.exists():
+            if self.config.get("embed_first_page", False):
+                # the first page tells whether there are any reviews with comments
+                first_page = VendorReviewCommentsView.get_first_page_payload(context["request"], supplier.pk)
+                has_comments = bool(first_page["reviews"])
+                context["first_page"] = json.dumps(first_page)
+            else:
+                has_comments = has_vendor_review_comments(supplier, context["request"].shop)
+
+            if has_comments:
                 context["review_supplier"] = supplier
                 context["title"] = self.get_translated_value("title")
                 context["no_reviews_text"] = self.get_translated_value("no_reviews_text")
@@ -8,3 +8,7 @@
 
 #: The number of reviews to load on each page
 VENDOR_REVIEWS_PAGE_SIZE = 5
+
+#: The Cache-Control directives of the vendor review comments responses,
+#: see ``PRODUCT_REVIEWS_COMMENTS_CACHE_CONTROL``
+VENDOR_REVIEWS_COMMENTS_CACHE_CONTROL = {"public": True, "max_age": 0}
@@ -5,9 +5,12 @@
 #
 # This source code is licensed under the OSL-3.0 license found in the
 # LICENSE file in the root directory of this source tree.
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_migrate, post_save
 from django.dispatch import receiver
 
+from shuup_product_reviews.search import (
+    delete_comment_search, install_comment_search, update_comment_search
+)
 from shuup_vendor_reviews.models import VendorReview
 from shuup_vendor_reviews.notify_events import (
     send_vendor_review_created_notification
@@ -20,3 +23,20 @@ def on_vendor_review_created(sender, instance, created, **kwargs):
         return
 
     send_vendor_review_created_notification(instance)
+
+
+@receiver(post_save, sender=VendorReview)
+def on_vendor_review_saved(sender, instance, using, update_fields=None, **kwargs):
+    if update_fields is None or "comment" in update_fields:
+        update_comment_search(instance, using)
+
+
+@receiver(post_delete, sender=VendorReview)
+def on_vendor_review_deleted(sender, instance, using, **kwargs):
+    delete_comment_search(instance, using)
+
+
+@receiver(post_migrate)
+def on_migrated(sender, using, **kwargs):
+    if sender.name == "shuup_vendor_reviews":
+        install_comment_search(VendorReview, using)
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup Product Reviews Addon.
+#
+# Copyright (c) 2012-2019, Shoop Commerce Ltd. All rights reserved.
+#
+# This source code is licensed under the OSL-3.0 license found in the
+# LICENSE file in the root directory of this source tree.
+from jinja2.utils import contextfunction
+from markupsafe import Markup
+
+from shuup_vendor_reviews.utils import render_vendor_review_ratings_many
+
+
+class VendorReviewsTemplateHelpers(object):
+    name = "vendor_reviews"
+
+    @contextfunction
+    def get_star_ratings(self, context, vendors, customer_ratings_title=None, show_recommenders=False, minified=True):
+        """
+        Returns a dict of the ids of the given vendors and their star ratings
+        in the current shop for listing templates, e.g.::
+
+            {% set star_ratings = shuup.vendor_reviews.get_star_ratings(vendors) %}
+            {% for vendor in vendors %}{{ star_ratings.get(vendor.pk, "") }}{% endfor %}
+        """
+        star_ratings = render_vendor_review_ratings_many(
+            vendors, customer_ratings_title, show_recommenders, minified, context["request"].shop
+        )
+        return dict((vendor_id, Markup(star_rating)) for (vendor_id, star_rating) in star_ratings.items())
@@ -7,11 +7,15 @@
 # LICENSE file in the root directory of this source tree.
 import math
 
-from django.db.models import Avg, Sum
-
-from shuup.core import cache
 from shuup.core.models import get_person_contact, Order, Supplier
-from shuup_vendor_reviews.models import VendorReviewAggregation
+from shuup_product_reviews import caching
+from shuup_product_reviews.aggregation import (
+    get_aggregation_totals, get_aggregation_totals_by_object, get_empty_totals,
+    get_window_totals
+)
+from shuup_vendor_reviews.models import (
+    VendorReview, VendorReviewAggregation, VendorReviewDailyAggregation
+)
 
 
 def get_orders_for_review(request):
@@ -35,11 +39,36 @@ def get_pending_vendors_reviews(request):
     ).distinct()
 
 
-def get_reviews_aggregation_for_supplier(supplier):
-    return VendorReviewAggregation.objects.filter(supplier=supplier).aggregate(
-        rating=Avg("rating"),
-        reviews=Sum("review_count"),
-        would_recommend=Sum("would_recommend")
+def get_reviews_aggregation_for_supplier(supplier, shop=None):
+    """
+    Returns the reviews totals for a giving supplier
+    in the given shop or in all shops when no shop is given
+    """
+    aggregations = VendorReviewAggregation.objects.filter(supplier=supplier)
+    if shop:
+        aggregations = aggregations.filter(shop=shop)
+    return get_aggregation_totals(aggregations)
+
+
+def get_windowed_reviews_aggregation_for_supplier(supplier, days, shop=None):
+    """
+    Returns the reviews totals for a giving supplier of the reviews
+    created in the last `days` days in the given shop or in all shops
+    """
+    daily_aggregations = VendorReviewDailyAggregation.objects.filter(supplier=supplier)
+    if shop:
+        daily_aggregations = daily_aggregations.filter(shop=shop)
+    return get_window_totals(daily_aggregations, days)
+
+
+def get_top_rated_supplier_ids(shop, limit=10):
+    """
+    Returns the ids of the best ranked suppliers of the shop
+    """
+    return list(
+        VendorReviewAggregation.objects.filter(shop=shop).order_by("-score").values_list(
+            "supplier_id", flat=True
+        )[:limit]
     )
 
 
@@ -53,45 +82,154 @@ def get_stars_from_rating(rating):
     return (full_stars, empty_stars, half_star)
 
 
-def render_vendor_review_ratings(vendor, customer_ratings_title=None, show_recommenders=False, minified=False):
+def get_reviews_aggregations_for_suppliers(suppliers, shop=None):
     """
-    Render the star rating template for a given vendor and options.
-    Returns None if no reviews exists for product
+    Returns a dict of the ids of the given suppliers and their reviews totals,
+    see `get_reviews_aggregation_for_supplier`, with one query
     """
-    cached_star_rating = get_cached_star_rating(vendor.pk)
-    if cached_star_rating is not None:
-        return cached_star_rating
+    aggregations = VendorReviewAggregation.objects.filter(supplier_id__in=[supplier.pk for supplier in suppliers])
+    if shop:
+        aggregations = aggregations.filter(shop=shop)
+    totals = get_aggregation_totals_by_object(aggregations, "supplier_id")
+    return dict((supplier.pk, totals.get(supplier.pk) or get_empty_totals()) for supplier in suppliers)
+
 
-    vendor_rating = get_reviews_aggregation_for_supplier(vendor)
+def _render_star_rating(template, vendor_rating, customer_ratings_title, show_recommenders, minified):
     rating = vendor_rating["rating"]
-    star_rating = None
-    if rating:
-        (full_stars, empty_stars, half_star) = get_stars_from_rating(rating)
-        context = {
-            "half_star": half_star,
-            "full_stars": full_stars,
-            "empty_stars": empty_stars,
-            "reviews": vendor_rating["reviews"],
-            "rating": rating,
-            "customer_ratings_title": customer_ratings_title,
-            "show_recommenders": show_recommenders,
-            "minified": minified
-        }
-        from django.template import loader
-        star_rating = loader.render_to_string("shuup_vendor_reviews/plugins/vendor_star_rating.jinja", context=context)
+    if not rating:
+        return None
+
+    (full_stars, empty_stars, half_star) = get_stars_from_rating(rating)
+    context = {
+        "half_star": half_star,
+        "full_stars": full_stars,
+        "empty_stars": empty_stars,
+        "reviews": vendor_rating["reviews"],
+        "rating": rating,
+        "customer_ratings_title": customer_ratings_title,
+        "show_recommenders": show_recommenders,
+        "minified": minified
+    }
+    return template.render(context)
+
+
+def render_vendor_review_ratings(
+        vendor, customer_ratings_title=None, show_recommenders=False, minified=False, shop=None):
+    """
+    Render the star rating template for a given vendor and options
+    with the ratings of the given shop, or of all shops when no shop is given.
+    Returns None if no reviews exists for product
+    """
+    star_ratings = render_vendor_review_ratings_many(
+        [vendor], customer_ratings_title, show_recommenders, minified, shop
+    )
+    return star_ratings[vendor.pk]
+
+
+def render_vendor_review_ratings_many(
+        vendors, customer_ratings_title=None, show_recommenders=False, minified=False, shop=None):
+    """
+    Render the star rating template for the given vendors and options, see `render_vendor_review_ratings`,
+    with one cache query for all the vendors and one aggregation query for the vendors not in the cache.
+
+    The reviews totals of the vendors are cached once per shop and the star ratings
+    once per options and language, so all the variants share a single aggregation query.
+
+    :return: dict of the vendor ids and their star ratings, an empty string if the vendor has no reviews
+    :rtype: dict[int, str]
+    """
+    vendors = dict((vendor.pk, vendor) for vendor in vendors)
+    template = []
+
+    def get_data(vendor_ids):
+        return get_reviews_aggregations_for_suppliers([vendors[vendor_id] for vendor_id in vendor_ids], shop)
+
+    def render(vendor_rating):
+        if not template:
+            from django.template import loader
+            template.append(loader.get_template("shuup_vendor_reviews/plugins/vendor_star_rating.jinja"))
+        return _render_star_rating(
+            template[0], vendor_rating, customer_ratings_title, show_recommenders, minified
+        )
+
+    return caching.get_cached_renders(
+        list(vendors.keys()), get_star_rating_namespace, shop,
+        (customer_ratings_title or "", show_recommenders, minified), get_data, render
+    )
+
 
-    if star_rating is not None:
-        cache_star_rating(vendor.id, star_rating)
-    return star_rating or ""
+def warm_star_rating_caches(supplier_ids, shop):
+    """
+    Render and cache the star ratings of the given suppliers in the shop
+    with the default options, both full and minified, in the active language
+    """
+    suppliers = list(Supplier.objects.filter(pk__in=supplier_ids))
+    for minified in (False, True):
+        render_vendor_review_ratings_many(suppliers, minified=minified, shop=shop)
 
 
-def get_cached_star_rating(vendor_id):
-    return cache.get("vendor_reviews_star_rating_{}".format(vendor_id))
+def get_reviewable_supplier_ids(shop):
+    """
+    Returns the ids of the enabled suppliers of the shop
+    """
+    return list(Supplier.objects.enabled().filter(shops=shop).order_by("pk").values_list("pk", flat=True))
 
 
-def cache_star_rating(vendor_id, star_rating):
-    cache.set("vendor_reviews_star_rating_{}".format(vendor_id), star_rating)
+def get_most_reviewed_supplier_ids(shop, limit=10):
+    """
+    Returns the ids of the suppliers with the most reviews in the shop
+    """
+    return list(
+        VendorReviewAggregation.objects.filter(shop=shop).order_by("-review_count", "supplier_id").values_list(
+            "supplier_id", flat=True
+        )[:limit]
+    )
 
 
-def bump_star_rating_cache(vendor_id):
-    cache.bump_version("vendor_reviews_star_rating_{}".format(vendor_id))
+def get_cached_reviews_aggregations_for_suppliers(suppliers, shop=None):
+    """
+    Returns the reviews totals of the given suppliers, see `get_reviews_aggregations_for_suppliers`,
+    reading them from the star rating cache of the suppliers
+    """
+    suppliers = dict((supplier.pk, supplier) for supplier in suppliers)
+    return caching.get_cached_data(
+        list(suppliers.keys()), get_star_rating_namespace, shop,
+        lambda supplier_ids: get_reviews_aggregations_for_suppliers([suppliers[pk] for pk in supplier_ids], shop)
+    )
+
+
+def get_cached_reviews_aggregation_for_supplier(supplier, shop=None):
+    """
+    Returns the reviews totals of the supplier, see `get_reviews_aggregation_for_supplier`,
+    reading them from the star rating cache of the supplier
+    """
+    return get_cached_reviews_aggregations_for_suppliers([supplier], shop)[supplier.pk]
+
+
+def has_vendor_review_comments(supplier, shop):
+    """
+    Returns whether the supplier has approved reviews
+    with comments in the shop, cached with the star ratings
+    """
+    def has_comments():
+        return VendorReview.objects.approved().filter(
+            shop=shop,
+            supplier=supplier,
+            comment__isnull=False
+        ).exists()
+
+    namespace = get_star_rating_namespace(supplier.pk)
+    return caching.get_or_set(namespace, shop, caching.get_comments_key(shop), has_comments)
+
+
+def get_star_rating_namespace(vendor_id):
+    return "vendor_reviews_star_rating_{}".format(vendor_id)
+
+
+def bump_star_rating_cache(vendor_id, shop_id=None):
+    """
+    Invalidate the cached star ratings and review totals of the vendor in all shops
+    and the in-process caches of the given shop, or of all shops when no shop is given
+    """
+    caching.bump_namespace(get_star_rating_namespace(vendor_id))
+    caching.bump_local_caches(shop_id)
@@ -7,7 +7,6 @@
 # LICENSE file in the root directory of this source tree.
 from django import forms
 from django.conf import settings
-from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
 from django.core.urlresolvers import reverse
 from django.db.transaction import atomic
 from django.http.response import HttpResponseRedirect
@@ -19,7 +18,9 @@ from shuup.front.views.dashboard import DashboardViewMixin
 from shuup_product_reviews.base import BaseCommentsView
 from shuup_product_reviews.enums import ReviewStatus
 from shuup_vendor_reviews.models import VendorReview
-from shuup_vendor_reviews.utils import get_pending_vendors_reviews
+from shuup_vendor_reviews.utils import (
+    get_pending_vendors_reviews, get_star_rating_namespace
+)
 
 
 class VendorReviewForm(forms.Form):
@@ -89,18 +90,26 @@ class VendorReviewsView(DashboardViewMixin, TemplateView):
 class VendorReviewCommentsView(BaseCommentsView):
     view_name = "vendor_review_comments"
 
-    def get_reviews_page(self):
-        supplier = Supplier.objects.filter(pk=self.kwargs["pk"], shops=self.request.shop).first()
-        queryset = VendorReview.objects.approved().filter(
-            supplier=supplier, shop=self.request.shop, comment__isnull=False
-        ).order_by("-created_on")
-
-        paginator = Paginator(queryset, settings.VENDOR_REVIEWS_PAGE_SIZE)
-        page = self.request.GET.get('page')
-
-        try:
-            return paginator.page(page)
-        except PageNotAnInteger:
-            return paginator.page(1)
-        except EmptyPage:
-            return paginator.page(paginator.num_pages)
+    @classmethod
+    def get_object_reviews_namespace(cls, pk):
+        return get_star_rating_namespace(pk)
+
+    def get_cache_control(self):
+        return settings.VENDOR_REVIEWS_COMMENTS_CACHE_CONTROL
+
+    def get_page_size(self):
+        return settings.VENDOR_REVIEWS_PAGE_SIZE
+
+    @classmethod
+    def get_first_page_querysets(cls, request, pks):
+        supplier_ids = set(Supplier.objects.filter(pk__in=pks, shops=request.shop).values_list("pk", flat=True))
+        return dict(
+            (pk, VendorReview.objects.approved().filter(
+                supplier_id=(pk if pk in supplier_ids else None), shop=request.shop, comment__isnull=False
+            ))
+            for pk in pks
+        )
+
+    def get_reviews_queryset(self):
+        pk = int(self.kwargs["pk"])
+        return self.get_first_page_querysets(self.request, [pk])[pk]